@@ -0,0 +1,155 @@
+"""Static image pipeline: resized WebP/AVIF variants of the app banners.
+
+Variants are written once per source version under ``static/generated/`` (file
+names carry a hash of the source bytes, so they never change content and can be
+cached forever by browsers) and served either through Streamlit's static route
+(``/app/static/...``) or through a small optional server that sends
+``Cache-Control: public, max-age=31536000, immutable``. That server listens on
+``127.0.0.1`` unless another host is given, and sends no CORS header: the
+``<picture>`` elements of the app need none.
+"""
+import hashlib
+import os
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from PIL import Image, features
+except ImportError:  # pragma: no cover - Pillow est une dépendance de streamlit
+    Image = None
+    features = None
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(APP_DIR, "static")
+GENERATED_ASSETS_DIR = os.path.join(STATIC_DIR, "generated")
+STATIC_URL_PREFIX = "app/static"
+
+HERO_WIDTHS = (800, 1600, 2400)
+IMAGE_FORMATS = ("avif", "webp")  # Ordre de préférence dans <picture>
+FORMAT_QUALITY = {"avif": 55, "webp": 80}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_ASSET_SERVER_HOST = "127.0.0.1"  # Pas d'exposition au réseau sans configuration explicite
+
+
+def source_hash(source_path):
+    """Return a short sha256 of the file content (used as cache key)."""
+    digest = hashlib.sha256()
+    with open(source_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def supported_formats(formats=IMAGE_FORMATS):
+    """Formats among ``formats`` that the installed Pillow can encode."""
+    if Image is None:
+        return []
+    return [fmt for fmt in formats if features.check(fmt)]
+
+
+def _variant_filename(source_path, digest, width, fmt):
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    return f"{stem}.{digest}.{width}w.{fmt}"
+
+
+def _save_atomically(image, target_path, fmt):
+    tmp_path = f"{target_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    image.save(tmp_path, format=fmt.upper(), quality=FORMAT_QUALITY.get(fmt, 80))
+    os.replace(tmp_path, target_path)
+
+
+def build_image_variants(source_path, widths=HERO_WIDTHS, formats=IMAGE_FORMATS, output_dir=GENERATED_ASSETS_DIR):
+    """Create (or reuse) resized variants of ``source_path``.
+
+    Returns a dict ``{"width": w, "height": h, "hash": ..., "variants": {fmt: [(width, filename), ...]}}``
+    or None if no variant can be produced (Pillow missing, unreadable source...).
+    Existing files for the same source hash are reused, so only the first
+    startup after a banner change pays the encoding cost.
+    """
+    encodable_formats = supported_formats(formats)
+    if not encodable_formats or not os.path.exists(source_path):
+        return None
+    digest = source_hash(source_path)
+    os.makedirs(output_dir, exist_ok=True)
+
+    with Image.open(source_path) as original:
+        src_width, src_height = original.size
+        target_widths = sorted({min(w, src_width) for w in widths})
+        variants = {fmt: [] for fmt in encodable_formats}
+        missing = [
+            (w, fmt) for w in target_widths for fmt in encodable_formats
+            if not os.path.exists(os.path.join(output_dir, _variant_filename(source_path, digest, w, fmt)))
+        ]
+        if missing:
+            base = original.convert("RGBA")
+            resized_cache = {}
+            for w, fmt in missing:
+                if w not in resized_cache:
+                    h = max(1, round(src_height * w / src_width))
+                    resized_cache[w] = base.resize((w, h), Image.LANCZOS)
+                target = os.path.join(output_dir, _variant_filename(source_path, digest, w, fmt))
+                _save_atomically(resized_cache[w], target, fmt)
+
+    for fmt in encodable_formats:
+        for w in target_widths:
+            variants[fmt].append((w, _variant_filename(source_path, digest, w, fmt)))
+    _prune_stale_variants(source_path, digest, output_dir)
+    return {"width": src_width, "height": src_height, "hash": digest, "variants": variants}
+
+
+def _prune_stale_variants(source_path, digest, output_dir):
+    """Remove variants produced from previous versions of the same source."""
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    for filename in os.listdir(output_dir):
+        if filename.startswith(f"{stem}.") and f".{digest}." not in filename:
+            try:
+                os.remove(os.path.join(output_dir, filename))
+            except OSError:  # pragma: no cover
+                pass
+
+
+def picture_html(image_info, base_url, alt="", sizes="100vw"):
+    """Build a responsive ``<picture>`` element for variants built by ``build_image_variants``.
+
+    The smallest WebP is used as ``<img>`` fallback; width/height are set so the
+    layout is reserved before the image arrives (no reflow on first paint).
+    """
+    base_url = base_url.rstrip("/")
+    sources = []
+    for fmt, entries in image_info["variants"].items():
+        srcset = ", ".join(f"{base_url}/{filename} {w}w" for w, filename in entries)
+        sources.append(f'<source type="image/{fmt}" srcset="{srcset}" sizes="{sizes}">')
+    fallback_fmt = "webp" if "webp" in image_info["variants"] else next(iter(image_info["variants"]))
+    fallback_filename = image_info["variants"][fallback_fmt][0][1]
+    return (
+        "<picture>"
+        + "".join(sources)
+        + f'<img src="{base_url}/{fallback_filename}" alt="{alt}" width="{image_info["width"]}" height="{image_info["height"]}"'
+        + ' decoding="async" fetchpriority="high" style="width:100%;height:auto;display:block;">'
+        + "</picture>"
+    )
+
+
+class _ImmutableAssetHandler(SimpleHTTPRequestHandler):
+    """Serves generated assets with long-lived cache headers."""
+
+    def end_headers(self):
+        self.send_header("Cache-Control", IMMUTABLE_CACHE_CONTROL)
+        super().end_headers()
+
+    def log_message(self, format, *args):  # Pas de log par requête
+        pass
+
+
+_asset_server = None
+
+
+def start_asset_server(port, directory=GENERATED_ASSETS_DIR, host=DEFAULT_ASSET_SERVER_HOST):
+    """Start (once per process) a background HTTP server for ``directory``."""
+    global _asset_server
+    if _asset_server is None:
+        handler = partial(_ImmutableAssetHandler, directory=directory)
+        _asset_server = ThreadingHTTPServer((host, int(port)), handler)
+        threading.Thread(target=_asset_server.serve_forever, name="asset-server", daemon=True).start()
+    return _asset_server
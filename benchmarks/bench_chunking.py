@@ -0,0 +1,71 @@
+"""Splitting time of ``chunking.split_text`` per document size (checks it stays linear).
+
+    python -m benchmarks.bench_chunking [--sizes-mb 1 4 16] [--chunk-chars 40000] [--overlap 0.1] [--repeat 3]
+
+The synthetic document is made of French sentences with a paragraph break
+every ten sentences or so. For each size the benchmark checks the split (the
+chunks cover the document, each is within the bound, consecutive chunks
+overlap and end on whitespace) and reports the median time and the time per
+MB: a constant ms/MB means linear time.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from chunking import split_text
+
+SENTENCE_WORDS = ("le", "contrat", "de", "bail", "prévoit", "une", "résiliation", "sous", "trois", "mois", "avec", "préavis",
+                  "la", "direction", "régionale", "valide", "les", "procédures", "du", "courrier", "recommandé")
+
+
+def make_document(n_chars, seed=0):
+    rng = random.Random(seed)
+    parts, size = [], 0
+    while size < n_chars:
+        sentence = " ".join(rng.choice(SENTENCE_WORDS) for _ in range(rng.randint(6, 30))).capitalize() + rng.choice((". ", " ! ", " ? "))
+        if rng.random() < 0.1:
+            sentence += "\n\n"
+        parts.append(sentence)
+        size += len(sentence)
+    return "".join(parts)[:n_chars]
+
+
+def check_split(text, chunks, max_chars):
+    assert chunks[0].start == 0 and chunks[-1].end == len(text)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous.start < chunk.start <= previous.end
+    assert all(len(chunk.text) <= max_chars for chunk in chunks)
+    return sum(chunk.text[-1:].isspace() for chunk in chunks[:-1]) / max(1, len(chunks) - 1)
+
+
+def run(sizes_mb=(1, 4, 16), chunk_chars=40000, overlap=0.1, repeat=3):
+    rows = []
+    for size_mb in sizes_mb:
+        text = make_document(int(size_mb * 1024 * 1024))
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            chunks = split_text(text, chunk_chars, int(chunk_chars * overlap))
+            timings.append((time.perf_counter() - started) * 1000)
+        clean_ends = check_split(text, chunks, chunk_chars)
+        median_ms = statistics.median(timings)
+        rows.append({"size_mb": size_mb, "chunks": len(chunks), "ms": median_ms, "ms_per_mb": median_ms / size_mb, "clean_ends": clean_ends})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--chunk-chars", type=int, default=40000)
+    parser.add_argument("--overlap", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(f"Extraits de {args.chunk_chars} caractères, recouvrement {args.overlap:.0%}")
+    print(f"{'taille Mo':>10}{'extraits':>10}{'ms':>10}{'ms/Mo':>10}{'coupures propres':>18}")
+    for row in run(args.sizes_mb, args.chunk_chars, args.overlap, args.repeat):
+        print(f"{row['size_mb']:>10g}{row['chunks']:>10}{row['ms']:>10.0f}{row['ms_per_mb']:>10.1f}{row['clean_ends']:>18.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Time and memory of the library hot paths as the library grows, with JSON baselines.
+
+    python -m benchmarks.bench_library_core                    # compare with the baseline
+    python -m benchmarks.bench_library_core --save-baseline    # (re)write the baseline
+    python -m benchmarks.bench_library_core --sizes 100 1000 --threshold 0.5
+
+Each case is timed (median of ``--repeat`` runs) then run once more under
+tracemalloc for its memory peak. Against a baseline, a case is flagged when its
+median is more than ``--threshold`` slower *and* at least ``--min-delta-ms``
+slower (noise floor); the exit code is 1 if anything is flagged. Baselines are
+machine-specific: regenerate them when the benchmark host changes.
+"""
+import argparse
+import copy
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date
+
+from benchmarks.synthetic_library import generate_library_of_size
+from library_core import (
+    _postprocess_after_loading, _preprocess_for_saving, collect_all_tags, fill_template, filter_use_cases,
+    format_values_for_template,
+)
+from template_lint import clear_cache as clear_lint_cache, lint_library
+
+DEFAULT_SIZES = (100, 1000, 10000, 50000)
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "library_core.json")
+SEARCH_TERM = "contrat"
+SEARCH_TAGS = ["analyse"]
+SAMPLE_FORM_VALUES = {
+    "document_source": "Objet : renouvellement du contrat de maintenance des machines de tri. " * 20,
+    "contexte": "Demande de la direction régionale Île-de-France.",
+    "nom_client": "La Poste", "destinataire": "Direction des achats", "ton": "Formel", "langue": "Français",
+    "date_echeance": date(2025, 6, 30), "date_document": date(2025, 1, 15), "nombre_points": 5.0, "budget": 12.5,
+}
+
+
+def _search(library):
+    return [filter_use_cases(use_cases, SEARCH_TERM, SEARCH_TAGS) for use_cases in library.values()]
+
+
+def _generate_all(library):
+    values = format_values_for_template(SAMPLE_FORM_VALUES)
+    return [fill_template(config.get("template", ""), values) for use_cases in library.values() for config in use_cases.values()]
+
+
+def build_cases(saved_library):
+    """``{case_name: zero-argument callable}`` for one library size."""
+    loaded_library = _postprocess_after_loading(saved_library)
+    return {
+        "postprocess_after_loading": lambda: _postprocess_after_loading(saved_library),
+        "preprocess_for_saving": lambda: _preprocess_for_saving(loaded_library),
+        "search_filter": lambda: _search(loaded_library),
+        "tag_aggregation": lambda: collect_all_tags(loaded_library),
+        "generation_substitution": lambda: _generate_all(loaded_library),
+        "template_lint_cold": lambda: (clear_lint_cache(), lint_library(loaded_library)),
+    }
+
+
+def _median_ms(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def _peak_kib(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes=DEFAULT_SIZES, repeat=5, seed=42):
+    """Return ``{"<case>@<size>": {"case", "use_cases", "median_ms", "peak_kib"}}``."""
+    results = {}
+    for size in sizes:
+        saved_library = generate_library_of_size(size, seed=seed)
+        for case_name, func in build_cases(copy.deepcopy(saved_library)).items():
+            results[f"{case_name}@{size}"] = {
+                "case": case_name,
+                "use_cases": size,
+                "median_ms": round(_median_ms(func, repeat), 3),
+                "peak_kib": round(_peak_kib(func), 1),
+            }
+    return results
+
+
+def compare(results, baseline, threshold=0.25, min_delta_ms=1.0):
+    """Return the keys of ``results`` that regressed against ``baseline``."""
+    regressions = []
+    for key, row in results.items():
+        reference = baseline.get(key)
+        if not reference:
+            continue
+        delta = row["median_ms"] - reference["median_ms"]
+        if delta > min_delta_ms and row["median_ms"] > reference["median_ms"] * (1 + threshold):
+            regressions.append(key)
+    return regressions
+
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("results", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baseline(results, path=BASELINE_PATH, seed=42, repeat=5):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"seed": seed, "repeat": repeat, "python": sys.version.split()[0], "results": results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="ralentissement relatif toléré (0.25 = +25 %%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat, args.seed)
+    baseline = {} if args.save_baseline else load_baseline(args.baseline)
+    regressions = set(compare(results, baseline, args.threshold, args.min_delta_ms))
+    print(f"{'cas':<26}{'use cases':>12}{'médiane ms':>12}{'pic KiB':>12}{'baseline ms':>13}")
+    for key, row in results.items():
+        reference = baseline.get(key, {}).get("median_ms")
+        reference_str = f"{reference:.1f}" if reference is not None else "-"
+        flag = "  REGRESSION" if key in regressions else ""
+        print(f"{row['case']:<26}{row['use_cases']:>12,}{row['median_ms']:>12.1f}{row['peak_kib']:>12,.0f}{reference_str:>13}{flag}")
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline, args.seed, args.repeat)
+        print(f"Baseline écrite : {args.baseline}")
+        return 0
+    if not baseline:
+        print("Aucune baseline : lancez avec --save-baseline pour en créer une.")
+    elif regressions:
+        print(f"{len(regressions)} régression(s) au-delà de +{args.threshold:.0%}.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
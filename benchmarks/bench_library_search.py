@@ -0,0 +1,69 @@
+"""Build, incremental update and query latency of the library search index (``library_search``).
+
+    python -m benchmarks.bench_library_search [--use-cases 1000 10000] [--repeat 20] [--seed 42]
+
+For each library size (synthetic, ``benchmarks.synthetic_library``): time of
+the first ``sync`` (full build), of a ``sync`` with nothing changed (what
+every search pays), of a ``sync`` after one template edit, and the median and
+p95 latency of queries mixing exact words, accent-free spellings, prefixes
+typed so far and typos. The benchmark checks that each typo query finds the
+same best use case as its correct spelling.
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.synthetic_library import generate_library_of_size
+from library_search import LibrarySearchIndex
+
+QUERIES = ["contrat", "résumer", "resume", "factur", "cv candidats", "rapport financier", "procès-verbal",
+           "bilan comptable direction", "réclamations clients", "cahier des charges", "appel d'offres", "courrier"]
+# Faute de frappe -> orthographe correcte
+TYPO_QUERIES = {"contarts": "contrats", "fatcure": "facture", "reclamtions": "réclamations", "candidtas": "candidats",
+                "procedurs": "procédures", "comptabel": "comptable"}
+
+
+def _ms(function, *args):
+    started = time.perf_counter()
+    value = function(*args)
+    return value, (time.perf_counter() - started) * 1000
+
+
+def run(sizes=(1000, 10000), repeat=20, seed=42):
+    rows = []
+    for size in sizes:
+        library = generate_library_of_size(size, seed)
+        index = LibrarySearchIndex()
+        _, build_ms = _ms(index.sync, library)
+        _, noop_ms = _ms(index.sync, library)
+        family = next(iter(library))
+        name = next(iter(library[family]))
+        library[family][name]["template"] += "\nVérifiez la clause de confidentialité."
+        updated, edit_ms = _ms(index.sync, library)
+        assert updated == 1
+        for typo, correct in TYPO_QUERIES.items():
+            expected = index.search(correct)
+            assert expected and index.search(typo)[0][0] == expected[0][0], typo
+        timings = []
+        for _ in range(repeat):
+            for query in QUERIES + list(TYPO_QUERIES):
+                timings.append(_ms(index.search, query)[1])
+        timings.sort()
+        rows.append({"use_cases": size, "terms": index.term_count, "build_ms": build_ms, "noop_sync_ms": noop_ms,
+                     "edit_sync_ms": edit_ms, "p50_ms": statistics.median(timings), "p95_ms": timings[int(0.95 * len(timings))]})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--use-cases", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(f"{'cas d usage':>12}{'termes':>8}{'construction ms':>17}{'sync inchangé ms':>18}{'sync 1 édition ms':>19}{'requête p50 ms':>16}{'p95 ms':>8}")
+    for row in run(args.use_cases, args.repeat, args.seed):
+        print(f"{row['use_cases']:>12}{row['terms']:>8}{row['build_ms']:>17.0f}{row['noop_sync_ms']:>18.1f}{row['edit_sync_ms']:>19.1f}{row['p50_ms']:>16.2f}{row['p95_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
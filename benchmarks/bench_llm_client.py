@@ -0,0 +1,71 @@
+"""Offline throughput of the LLM client against the fake endpoint, per concurrency level.
+
+    python -m benchmarks.bench_llm_client [--prompts 40] [--concurrency 1 4 16] [--tokens-per-second 200]
+
+Starts ``FakeLLMServer`` in-process, runs the same batch of prompts with each
+concurrency bound and reports requests/s, streamed tokens/s, latency
+percentiles and time to first token (both measured from submission, so
+queueing behind the concurrency bound is included). The rate limit is set
+high enough not to interfere unless ``--requests-per-minute`` is given.
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.fake_llm_server import FakeLLMServer
+from llm_client import AsyncLLMClient, BACKGROUND_LOOP, LLMJob
+
+DEFAULT_CONCURRENCY_LEVELS = (1, 4, 16)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def run(n_prompts=40, concurrency_levels=DEFAULT_CONCURRENCY_LEVELS, tokens_per_second=200.0, latency_ms=50.0,
+        reply_tokens=60, requests_per_minute=600000):
+    server = FakeLLMServer(tokens_per_second=tokens_per_second, latency_ms=latency_ms, reply_tokens=reply_tokens).start()
+    prompts = [f"Résumez le document n°{index} pour la direction régionale." for index in range(n_prompts)]
+    rows = []
+    try:
+        for concurrency in concurrency_levels:
+            client = BACKGROUND_LOOP.call(AsyncLLMClient, server.url, None, "fake-model", concurrency, requests_per_minute)
+            started = time.perf_counter()
+            results = LLMJob(client, prompts).wait()
+            elapsed = time.perf_counter() - started
+            ok = [result for result in results if result.status == "ok"]
+            latencies = [result.latency_s for result in ok]
+            rows.append({
+                "concurrency": concurrency,
+                "ok": len(ok),
+                "seconds": elapsed,
+                "requests_per_s": len(ok) / elapsed,
+                "tokens_per_s": sum(len(result.text.split()) for result in ok) / elapsed,
+                "p50_ms": _percentile(latencies, 0.5) * 1000,
+                "p95_ms": _percentile(latencies, 0.95) * 1000,
+                "first_token_ms": statistics.median(result.first_token_s for result in ok) * 1000 if ok else 0.0,
+            })
+    finally:
+        server.stop()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(DEFAULT_CONCURRENCY_LEVELS))
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--requests-per-minute", type=float, default=600000)
+    args = parser.parse_args()
+    print(f"{args.prompts} prompts, réponse de {args.reply_tokens} tokens à {args.tokens_per_second:g} tokens/s, premier token après {args.latency_ms:g} ms")
+    print(f"{'concurrence':>12}{'ok':>6}{'durée s':>10}{'req/s':>9}{'tokens/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'1er tok ms':>12}")
+    for row in run(args.prompts, args.concurrency, args.tokens_per_second, args.latency_ms, args.reply_tokens, args.requests_per_minute):
+        print(f"{row['concurrency']:>12}{row['ok']:>6}{row['seconds']:>10.2f}{row['requests_per_s']:>9.1f}{row['tokens_per_s']:>10.0f}"
+              f"{row['p50_ms']:>9.0f}{row['p95_ms']:>9.0f}{row['first_token_ms']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Token reduction of the compact prompt option (``prompt_minifier``), per use case.
+
+    python -m benchmarks.bench_prompt_minifier [--library bibliotheque.json] [--use-cases 200] [--model gpt-4o] [--vocab-dir tokenizer_vocabs] [--top 15]
+
+Each use case is rendered with its default values, as written and minified,
+and both prompts are counted with the model's tokenizer (``token_counting``:
+exact when its vocabulary is in ``--vocab-dir``, estimated otherwise).
+The benchmark checks that minification keeps the template's placeholders and
+every substituted value.
+
+Without ``--library`` (a library exported as ``{famille: {cas d'usage: config}}``),
+the two bundled meta-prompts are measured along with synthetic use cases, half
+of them decorated the way the creation meta-prompt writes templates (bold
+``##`` headings, ``---`` separators, blank lines, a rule repeated at the end).
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+from benchmarks.synthetic_library import generate_library_of_size
+from library_core import format_values_for_template
+from llm_client import DEFAULT_MODEL
+from prompt_minifier import minify_template
+from render_cache import render_use_case_prompt
+from template_lint import analyze_template
+from token_counting import DEFAULT_VOCAB_DIRECTORY, get_token_counter
+
+BUNDLED_TEMPLATES = ("prompt_creation_template.md", "prompt_improvement_template.md")
+
+
+def decorate(template, rng):
+    """The synthetic template in the verbose style of assistant-written templates."""
+    sections = []
+    for block in template.strip().split("\n\n"):
+        title, _, body = block.partition("\n")
+        title = f"## **{title.lstrip('# ').title()}**" if title.startswith("#") else title
+        body = re.sub(r"^(\d+\.|-) ", r"\1  ", body, flags=re.MULTILINE).replace("\n", "\n\n")
+        sections.append(f"{title}\n\n{body}\n")
+    rule = "- Ne divulguez aucune donnée personnelle."
+    return "\n---\n\n".join(sections) + f"\n\n## **Rappel important**\n\n{rule}   \n" * rng.randint(1, 2)
+
+
+def load_cases(library_path=None, n_use_cases=200, seed=42):
+    """[(label, template, values)] with the default values of each variable."""
+    if library_path:
+        with open(library_path, encoding="utf-8") as library_file:
+            library = json.load(library_file)
+    else:
+        library = generate_library_of_size(n_use_cases, seed)
+    rng = random.Random(seed)
+    cases = []
+    for family, use_cases in library.items():
+        for index, (name, config) in enumerate(use_cases.items()):
+            template = config.get("template", "")
+            if not library_path and index % 2:
+                template = decorate(template, rng)
+            values = {var["name"]: var.get("default") for var in config.get("variables", []) if var.get("name")}
+            cases.append((f"{family} / {name}", template, format_values_for_template(values)))
+    if not library_path:
+        for filename in BUNDLED_TEMPLATES:
+            with open(filename, encoding="utf-8") as template_file:
+                template = template_file.read()
+            names = analyze_template(template).placeholders
+            cases.append((filename, template, {name: f"<{name}>" for name in names}))
+    return cases
+
+
+def run(cases, model=DEFAULT_MODEL, vocab_directory=DEFAULT_VOCAB_DIRECTORY):
+    counter = get_token_counter(model, vocab_directory)
+    rows = []
+    for label, template, values in cases:
+        started = time.perf_counter()
+        minified = minify_template(template)
+        minify_ms = (time.perf_counter() - started) * 1000
+        assert set(analyze_template(minified).placeholders) == set(analyze_template(template).placeholders), label
+        prompt = render_use_case_prompt(label, template, values)
+        compact = render_use_case_prompt(label, minified, values)
+        assert all(value in compact for value in values.values()), label
+        before, after = counter.count(prompt), counter.count(compact)
+        rows.append({"label": label, "before": before, "after": after, "saved": 1 - after / before if before else 0.0, "minify_ms": minify_ms})
+    return counter, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--library", default=None)
+    parser.add_argument("--use-cases", type=int, default=200)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--vocab-dir", default=DEFAULT_VOCAB_DIRECTORY)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--top", type=int, default=15, help="cas d'usage listés (les plus gros gains) ; 0 : tous")
+    args = parser.parse_args()
+    counter, rows = run(load_cases(args.library, args.use_cases, args.seed), args.model, args.vocab_dir)
+    print(f"Tokenizer : {counter.name if counter.exact else 'estimation hors ligne'} · {len(rows)} cas d'usage")
+    print(f"{'cas d usage':<60}{'tokens':>9}{'compact':>9}{'gain':>8}")
+    listed = sorted(rows, key=lambda row: row["saved"], reverse=True)
+    for row in listed[:args.top or len(listed)]:
+        print(f"{row['label'][:59]:<60}{row['before']:>9}{row['after']:>9}{row['saved']:>8.1%}")
+    before, after = sum(row["before"] for row in rows), sum(row["after"] for row in rows)
+    savings = sorted(row["saved"] for row in rows)
+    print(f"{'TOTAL':<60}{before:>9}{after:>9}{1 - after / before:>8.1%}")
+    print(f"Gain médian {savings[len(savings) // 2]:.1%}, maximum {savings[-1]:.1%} ; "
+          f"minification {max(row['minify_ms'] for row in rows):.2f} ms au plus par template (mémoïsée ensuite)")
+
+
+if __name__ == "__main__":
+    main()
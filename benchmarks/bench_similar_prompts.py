@@ -0,0 +1,75 @@
+"""Build, incremental update and lookup latency of the similar prompts index (``similar_prompts``).
+
+    python -m benchmarks.bench_similar_prompts [--use-cases 1000 10000] [--edits 20] [--seed 42] [--no-scipy]
+
+For each library size (synthetic, ``benchmarks.synthetic_library``): time of
+the first ``sync`` (TF-IDF matrix and top-k neighbours of every use case), of
+a ``sync`` with nothing changed (what every view pays), the median and maximum
+time of a ``sync`` after one template edit, and the median lookup time. The
+benchmark checks that the incrementally updated neighbours are those a full
+computation gives. ``--no-scipy`` measures the NumPy-only product even when
+SciPy is installed.
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+import similar_prompts
+from benchmarks.synthetic_library import generate_library_of_size
+from similar_prompts import SimilarPromptsIndex
+
+EDIT_SUFFIXES = ["\nVérifiez la clause de confidentialité.", "\nAjoutez un tableau récapitulatif des risques.",
+                 "\nRédigez la réponse pour le comité de direction."]
+
+
+def _ms(function, *args):
+    started = time.perf_counter()
+    value = function(*args)
+    return value, (time.perf_counter() - started) * 1000
+
+
+def run(sizes=(1000, 10000), edits=20, seed=42):
+    rows = []
+    for size in sizes:
+        library = generate_library_of_size(size, seed)
+        keys = [(family, name) for family, use_cases in library.items() for name in use_cases]
+        index = SimilarPromptsIndex()
+        _, build_ms = _ms(index.sync, library)
+        _, noop_ms = _ms(index.sync, library)
+        edit_timings, refreshed = [], index.updated_rows
+        for edit in range(edits):
+            family, name = keys[(edit * 7919) % len(keys)]
+            library[family][name]["template"] += EDIT_SUFFIXES[edit % len(EDIT_SUFFIXES)]
+            updated, edit_ms = _ms(index.sync, library)
+            assert updated == 1
+            edit_timings.append(edit_ms)
+        refreshed = (index.updated_rows - refreshed) / edits
+        lookups = [_ms(index.similar, *keys[(lookup * 104729) % len(keys)])[1] for lookup in range(1000)]
+        incremental = index._scores.copy()
+        index._compute_rows(np.arange(len(index._vectors)))
+        assert np.allclose(incremental, index._scores, atol=1e-5)
+        rows.append({"use_cases": size, "build_ms": build_ms, "noop_sync_ms": noop_ms, "edit_p50_ms": statistics.median(edit_timings),
+                     "edit_max_ms": max(edit_timings), "refreshed": refreshed, "lookup_ms": statistics.median(lookups)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--use-cases", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--edits", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-scipy", action="store_true")
+    args = parser.parse_args()
+    if args.no_scipy:
+        similar_prompts.sparse = None
+    print(f"Produit creux : {'scipy.sparse' if similar_prompts.sparse is not None else 'NumPy'}")
+    print(f"{'cas d usage':>12}{'construction ms':>17}{'sync inchangé ms':>18}{'1 édition p50 ms':>18}{'max ms':>8}{'lignes recalculées':>20}{'lecture ms':>12}")
+    for row in run(args.use_cases, args.edits, args.seed):
+        print(f"{row['use_cases']:>12}{row['build_ms']:>17.0f}{row['noop_sync_ms']:>18.1f}{row['edit_p50_ms']:>18.1f}{row['edit_max_ms']:>8.1f}"
+              f"{row['refreshed']:>20.0f}{row['lookup_ms']:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Payload size and encode/decode time of each storage encoding.
+
+    python -m benchmarks.bench_storage_encoding [--use-cases 5000] [--repeat 5]
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.synthetic_library import generate_library_of_size
+from storage_codec import ENCODING_JSON, available_encodings, decode_payload, encode_payload
+
+
+def _median_ms(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def run(n_use_cases=5000, repeat=5, seed=42):
+    library = generate_library_of_size(n_use_cases, seed=seed)
+    results = []
+    baseline_size = None
+    for encoding in available_encodings():
+        payload = encode_payload(library, encoding)
+        assert decode_payload(payload) == library, encoding
+        size = len(payload.encode("utf-8"))
+        if encoding == ENCODING_JSON:
+            baseline_size = size
+        results.append({
+            "encoding": encoding,
+            "bytes": size,
+            "encode_ms": _median_ms(lambda: encode_payload(library, encoding), repeat),
+            "decode_ms": _median_ms(lambda: decode_payload(payload), repeat),
+        })
+    for row in results:
+        row["ratio_vs_json"] = row["bytes"] / baseline_size if baseline_size else None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--use-cases", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(f"Bibliothèque synthétique : {args.use_cases} cas d'usage (seed {args.seed})")
+    print(f"{'encodage':<14}{'taille':>14}{'vs json':>10}{'encode ms':>12}{'decode ms':>12}")
+    for row in run(args.use_cases, args.repeat, args.seed):
+        print(f"{row['encoding']:<14}{row['bytes']:>14,}{row['ratio_vs_json']:>10.1%}{row['encode_ms']:>12.1f}{row['decode_ms']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Stored size and expansion time when shared boilerplate is factored into fragments.
+
+    python -m benchmarks.bench_template_fragments [--use-cases 5000] [--repeat 5]
+
+The synthetic templates all repeat the same sections (role sentence,
+instructions, data rule). They are factored into ``{>nom}`` fragments with
+``factor_fragment``; the benchmark checks that every expanded template is
+identical to the original, then reports the Gist payload size (shards +
+manifest) before and after, and the cold (first expansion of a fragment set
+version) and warm (cached) expansion time of the whole library.
+"""
+import argparse
+import copy
+import json
+import statistics
+import time
+
+from benchmarks.synthetic_library import generate_library_of_size
+from gist_store import build_sharded_files
+from storage_codec import ENCODING_JSON
+from template_fragments import clear_cache, expand_template, factor_fragment, fragments_version
+
+FRAGMENTS = {
+    "role_la_poste": "au sein du groupe La Poste. Vous maîtrisez les procédures internes et le vocabulaire métier.",
+    "instructions": """# INSTRUCTIONS
+1. Lisez attentivement les éléments fournis.
+2. Identifiez les informations clés, les risques et les points d'attention.
+3. Produisez une réponse claire, factuelle et sans invention.
+4. Si une information manque, signalez-la explicitement.""",
+    "regle_donnees": "- Ne divulguez aucune donnée personnelle.",
+}
+
+
+def _median_ms(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def _stored_bytes(library, fragments=None):
+    manifest, files = build_sharded_files(library, ENCODING_JSON, fragments)
+    payload = json.dumps(manifest, indent=2, ensure_ascii=False) + "".join(files.values())
+    return len(payload.encode("utf-8"))
+
+
+def _expand_all(library, fragments, version):
+    return [expand_template(config.get("template", ""), fragments, version)
+            for use_cases in library.values() for config in use_cases.values()]
+
+
+def run(n_use_cases=5000, repeat=5, seed=42):
+    library = generate_library_of_size(n_use_cases, seed=seed)
+    factored = copy.deepcopy(library)
+    for name, text in FRAGMENTS.items():
+        factor_fragment(factored, name, text)
+    version = fragments_version(FRAGMENTS)
+    originals = [config["template"] for use_cases in library.values() for config in use_cases.values()]
+    assert _expand_all(factored, FRAGMENTS, version) == originals
+    bytes_before = _stored_bytes(library)
+    bytes_after = _stored_bytes(factored, FRAGMENTS)
+    return {
+        "use_cases": sum(len(use_cases) for use_cases in library.values()),
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "ratio": bytes_after / bytes_before,
+        "expand_cold_ms": _median_ms(lambda: (clear_cache(), _expand_all(factored, FRAGMENTS, version)), repeat),
+        "expand_warm_ms": _median_ms(lambda: _expand_all(factored, FRAGMENTS, version), repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--use-cases", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    result = run(args.use_cases, args.repeat, args.seed)
+    print(f"Bibliothèque synthétique : {result['use_cases']} cas d'usage (seed {args.seed}), {len(FRAGMENTS)} fragments")
+    print(f"Taille stockée : {result['bytes_before']:,} -> {result['bytes_after']:,} octets ({result['ratio']:.1%})")
+    print(f"Développement des templates : {result['expand_cold_ms']:.1f} ms à froid, {result['expand_warm_ms']:.1f} ms en cache")
+
+
+if __name__ == "__main__":
+    main()
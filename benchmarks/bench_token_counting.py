@@ -0,0 +1,57 @@
+"""Token counting time per text size: first count, memoized count, and exact BPE when a vocabulary is available.
+
+    python -m benchmarks.bench_token_counting [--sizes-kb 1 10 100 1000] [--vocab-dir tokenizer_vocabs] [--encoding cl100k_base]
+
+The text is the synthetic French document of ``bench_chunking``. "1er
+comptage" is the cost of a text never seen (tokenizer), "mémoïsé" the cost of
+every later render of the same text (hash + lookup). With ``--vocab-dir``
+pointing to a directory holding ``<encoding>.tiktoken``, the exact count is
+timed too and the heuristic's error against it is reported.
+"""
+import argparse
+import os
+import time
+
+from benchmarks.bench_chunking import make_document
+from token_counting import BPETokenizer, HeuristicTokenizer, TokenCounter, load_tiktoken_vocab
+
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    value = function(*args)
+    return value, (time.perf_counter() - started) * 1000
+
+
+def run(sizes_kb=(1, 10, 100, 1000), vocab_directory=None, encoding="cl100k_base"):
+    bpe = None
+    if vocab_directory:
+        bpe = BPETokenizer(encoding, load_tiktoken_vocab(os.path.join(vocab_directory, f"{encoding}.tiktoken")))
+    rows = []
+    for size_kb in sizes_kb:
+        text = make_document(int(size_kb * 1024), seed=int(size_kb))
+        counter = TokenCounter(HeuristicTokenizer())
+        tokens, cold_ms = _timed(counter.count, text)
+        _, warm_ms = _timed(counter.count, text)
+        row = {"size_kb": size_kb, "tokens": tokens, "cold_ms": cold_ms, "warm_ms": warm_ms, "bpe_tokens": None, "bpe_ms": None}
+        if bpe is not None:
+            row["bpe_tokens"], row["bpe_ms"] = _timed(bpe.count, text)
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes-kb", type=float, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--vocab-dir", default=None)
+    parser.add_argument("--encoding", default="cl100k_base")
+    args = parser.parse_args()
+    print(f"{'taille Ko':>10}{'tokens':>10}{'1er comptage ms':>17}{'mémoïsé ms':>12}{'BPE tokens':>12}{'BPE ms':>10}{'écart':>8}")
+    for row in run(args.sizes_kb, args.vocab_dir, args.encoding):
+        line = f"{row['size_kb']:>10g}{row['tokens']:>10}{row['cold_ms']:>17.2f}{row['warm_ms']:>12.3f}"
+        if row["bpe_tokens"] is not None:
+            line += f"{row['bpe_tokens']:>12}{row['bpe_ms']:>10.1f}{row['tokens'] / row['bpe_tokens'] - 1:>+8.1%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""In-memory stand-in for the GitHub Gist API, for offline load and latency tests.
+
+    python -m benchmarks.fake_gist_server --port 8765 --latency-ms 80 --error-rate 0.02 --rate-limit 5000
+
+then point the apps at it with the ``GIST_API_URL`` secret (or environment
+variable) set to ``http://127.0.0.1:8765``. Any ``GIST_ID``/``GITHUB_PAT`` is
+accepted; unknown gists are created empty on first access unless
+``--no-autocreate`` is given.
+
+Implemented: ``GET /gists/{id}`` (and ``/gists/{id}/{revision}``) with ETag /
+``If-None-Match`` -> 304, ``PATCH /gists/{id}`` (``null`` or empty content
+deletes a file) with one revision per PATCH, contents above ``truncate_bytes``
+returned with ``truncated: true`` and served in full from ``raw_url``,
+per-token rate limiting (403 + ``X-RateLimit-*`` headers, like GitHub),
+random 5xx injection and fixed + random latency. ``GET /_stats`` returns the
+request counters.
+
+In-process use (tests, load harness)::
+
+    server = FakeGistServer(latency_ms=50).start()
+    gist_store.set_api_base_url(server.url)
+    ...
+    server.stop()
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+GITHUB_TRUNCATE_BYTES = 1024 * 1024  # Au-delà, l'API Gist renvoie un contenu tronqué
+DEFAULT_RATE_LIMIT = 5000            # Requêtes par fenêtre et par token (limite GitHub authentifiée)
+DEFAULT_RATE_WINDOW = 3600.0         # secondes
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class FakeGist:
+    """One gist: current files plus the list of revisions (newest first, like GitHub)."""
+
+    def __init__(self, gist_id):
+        self.id = gist_id
+        self.files = {}
+        self.history = []
+        self.created_at = self.updated_at = _now_iso()
+        self._commit()
+
+    def _commit(self):
+        self.updated_at = _now_iso()
+        digest = hashlib.sha1(json.dumps([len(self.history), self.files], sort_keys=True).encode("utf-8")).hexdigest()
+        self.history.insert(0, {"version": digest, "committed_at": self.updated_at, "files": dict(self.files)})
+
+    @property
+    def version(self):
+        return self.history[0]["version"]
+
+    def apply_patch(self, files_patch):
+        for filename, entry in files_patch.items():
+            content = entry.get("content") if isinstance(entry, dict) else None
+            if not content:
+                self.files.pop(filename, None)
+            else:
+                self.files[filename] = content
+        self._commit()
+
+    def revision(self, version):
+        return next((rev for rev in self.history if rev["version"] == version), None)
+
+
+class FakeGistServer:
+    """Threaded HTTP server holding gists in memory; every knob can be changed while it runs."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 error_statuses=(500, 502, 503), rate_limit=DEFAULT_RATE_LIMIT, rate_window=DEFAULT_RATE_WINDOW,
+                 truncate_bytes=GITHUB_TRUNCATE_BYTES, autocreate=True, seed=None):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.truncate_bytes = truncate_bytes
+        self.autocreate = autocreate
+        self.gists = {}
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._rate_windows = {}  # token -> [début de fenêtre, requêtes]
+        self._httpd = None
+        self._thread = None
+
+    # --- Cycle de vie ---
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        handler = type("FakeGistHandler", (_FakeGistHandler,), {"fake": self})
+        self._httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-gist-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    # --- Accès direct aux données (préparation des tests) ---
+    def get_gist(self, gist_id, create=None):
+        with self._lock:
+            gist = self.gists.get(gist_id)
+            if gist is None and (self.autocreate if create is None else create):
+                gist = self.gists[gist_id] = FakeGist(gist_id)
+            return gist
+
+    def seed_files(self, gist_id, files):
+        """Write ``{filename: content}`` into a gist as one revision."""
+        gist = self.get_gist(gist_id, create=True)
+        with self._lock:
+            gist.apply_patch({name: {"content": content} for name, content in files.items()})
+        return gist
+
+    # --- Simulation réseau ---
+    def _sleep(self):
+        delay_ms = self.latency_ms + (self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+
+    def _rate_limit_state(self, token):
+        """Count the request for ``token``; return ``(allowed, remaining, reset_epoch)``."""
+        now = time.time()
+        with self._lock:
+            window = self._rate_windows.get(token)
+            if window is None or now - window[0] >= self.rate_window:
+                window = self._rate_windows[token] = [now, 0]
+            allowed = window[1] < self.rate_limit
+            if allowed:
+                window[1] += 1
+            return allowed, max(0, self.rate_limit - window[1]), int(window[0] + self.rate_window)
+
+    def _inject_error(self):
+        with self._lock:
+            if self.error_rate and self._rng.random() < self.error_rate:
+                return self._rng.choice(self.error_statuses)
+        return None
+
+    # --- Représentation JSON ---
+    def gist_json(self, gist, files, version):
+        files_json = {}
+        for filename, content in files.items():
+            raw = content.encode("utf-8")
+            truncated = len(raw) > self.truncate_bytes
+            files_json[filename] = {
+                "filename": filename,
+                "type": "application/json" if filename.endswith(".json") else "text/plain",
+                "language": "JSON" if filename.endswith(".json") else "Text",
+                "raw_url": f"{self.url}/raw/{gist.id}/{version}/{filename}",
+                "size": len(raw),
+                "truncated": truncated,
+                "content": raw[:self.truncate_bytes].decode("utf-8", "ignore") if truncated else content,
+            }
+        return {
+            "id": gist.id,
+            "url": f"{self.url}/gists/{gist.id}",
+            "files": files_json,
+            "created_at": gist.created_at,
+            "updated_at": gist.updated_at,
+            "history": [{"version": rev["version"], "committed_at": rev["committed_at"]} for rev in gist.history],
+        }
+
+
+class _FakeGistHandler(BaseHTTPRequestHandler):
+    fake = None  # FakeGistServer, fixé par FakeGistServer.start
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload=None, body=None, headers=None, content_type="application/json; charset=utf-8"):
+        if body is None:
+            body = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+        with self.fake._lock:
+            self.fake.stats[f"{self.command} {status}"] += 1
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _guard(self):
+        """Latency, rate limit and error injection; return the headers to add, or None if already answered."""
+        self.fake._sleep()
+        token = self.headers.get("Authorization", "anonymous")
+        allowed, remaining, reset = self.fake._rate_limit_state(token)
+        headers = {
+            "X-RateLimit-Limit": str(self.fake.rate_limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(reset),
+        }
+        if not allowed:
+            self._send(403, {"message": "API rate limit exceeded", "documentation_url": "https://docs.github.com/rest/overview/resources-in-the-rest-api#rate-limiting"}, headers=headers)
+            return None
+        error_status = self.fake._inject_error()
+        if error_status:
+            self._send(error_status, {"message": "Injected server error"}, headers=headers)
+            return None
+        return headers
+
+    def do_GET(self):
+        parts = [unquote(p) for p in urlsplit(self.path).path.strip("/").split("/")]
+        if parts == ["_stats"]:
+            with self.fake._lock:
+                stats = {"requests": dict(self.fake.stats), "gists": len(self.fake.gists)}
+            return self._send(200, stats)
+        headers = self._guard()
+        if headers is None:
+            return
+        if len(parts) >= 4 and parts[0] == "raw":
+            return self._get_raw(parts[1], parts[2], "/".join(parts[3:]), headers)
+        if len(parts) in (2, 3) and parts[0] == "gists":
+            return self._get_gist(parts[1], parts[2] if len(parts) == 3 else None, headers)
+        self._send(404, {"message": "Not Found"}, headers=headers)
+
+    def _get_gist(self, gist_id, version, headers):
+        gist = self.fake.get_gist(gist_id)
+        if gist is None:
+            return self._send(404, {"message": "Not Found"}, headers=headers)
+        with self.fake._lock:
+            revision = gist.revision(version) if version else gist.history[0]
+        if revision is None:
+            return self._send(404, {"message": "Not Found"}, headers=headers)
+        with self.fake._lock:
+            etag = f'W/"{revision["version"]}"'
+            not_modified = self.headers.get("If-None-Match") == etag
+            payload = None if not_modified else self.fake.gist_json(gist, revision["files"], revision["version"])
+        if not_modified:
+            return self._send(304, headers={**headers, "ETag": etag})
+        self._send(200, payload, headers={**headers, "ETag": etag})
+
+    def _get_raw(self, gist_id, version, filename, headers):
+        gist = self.fake.get_gist(gist_id, create=False)
+        with self.fake._lock:
+            revision = gist.revision(version) if gist else None
+            content = revision["files"].get(filename) if revision else None
+        if content is None:
+            return self._send(404, {"message": "Not Found"}, headers=headers)
+        self._send(200, body=content.encode("utf-8"), headers=headers, content_type="text/plain; charset=utf-8")
+
+    def do_PATCH(self):
+        body = self._read_body()
+        headers = self._guard()
+        if headers is None:
+            return
+        parts = [unquote(p) for p in urlsplit(self.path).path.strip("/").split("/")]
+        if len(parts) != 2 or parts[0] != "gists":
+            return self._send(404, {"message": "Not Found"}, headers=headers)
+        try:
+            data = json.loads(body.decode("utf-8"))
+            files_patch = data["files"]
+            if not isinstance(files_patch, dict):
+                raise TypeError
+        except (ValueError, KeyError, TypeError):
+            return self._send(422, {"message": "Validation Failed"}, headers=headers)
+        gist = self.fake.get_gist(parts[1])
+        if gist is None:
+            return self._send(404, {"message": "Not Found"}, headers=headers)
+        with self.fake._lock:
+            gist.apply_patch(files_patch)
+            payload = self.fake.gist_json(gist, gist.files, gist.version)
+            etag = f'W/"{gist.version}"'
+        self._send(200, payload, headers={**headers, "ETag": etag})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probabilité d'une erreur 5xx par requête")
+    parser.add_argument("--rate-limit", type=int, default=DEFAULT_RATE_LIMIT)
+    parser.add_argument("--rate-window", type=float, default=DEFAULT_RATE_WINDOW)
+    parser.add_argument("--truncate-bytes", type=int, default=GITHUB_TRUNCATE_BYTES)
+    parser.add_argument("--no-autocreate", action="store_true")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    server = FakeGistServer(
+        args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate, rate_limit=args.rate_limit,
+        rate_window=args.rate_window, truncate_bytes=args.truncate_bytes, autocreate=not args.no_autocreate, seed=args.seed,
+    ).start()
+    print(f"Faux serveur Gist sur {server.url} (GIST_API_URL={server.url}) - Ctrl+C pour arrêter")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
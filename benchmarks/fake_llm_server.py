@@ -0,0 +1,253 @@
+"""OpenAI-compatible chat completion stand-in, for offline execution and throughput tests.
+
+    python -m benchmarks.fake_llm_server --port 8766 --tokens-per-second 40 --latency-ms 300
+
+then set the ``LLM_API_BASE_URL`` secret to ``http://127.0.0.1:8766/v1``. Any
+API key and model are accepted.
+
+Implemented: ``POST /v1/chat/completions`` with ``stream: true`` (SSE over a
+chunked body, one ``data:`` event per token, then ``data: [DONE]``) or a
+plain JSON answer. The reply is a deterministic French text derived from the
+prompt (``--reply-tokens`` words), produced at ``--tokens-per-second`` after a
+first-token latency. Prompts asking for JSON (the assistant meta-prompts) get
+a sentence followed by a fenced use case JSON, with a new use case name each
+time; ``--reply-file`` (or ``reply_text``) forces a fixed reply. Optional
+per-minute rate limit (429 + ``Retry-After``) and random 5xx injection. ``GET /_stats`` returns the request counters and
+the highest number of requests seen in flight at once.
+
+In-process use::
+
+    server = FakeLLMServer(tokens_per_second=0).start()
+    client = AsyncLLMClient(server.url, ...)
+    ...
+    server.stop()
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+DEFAULT_REPLY_TOKENS = 60
+FILLER_WORDS = ("analyse", "du", "document", "selon", "les", "procédures", "de", "La", "Poste", "et", "points", "d'attention")
+
+
+class FakeLLMServer:
+    """Threaded HTTP server answering chat completions; every knob can be changed while it runs."""
+
+    def __init__(self, host="127.0.0.1", port=0, tokens_per_second=50.0, latency_ms=0.0, reply_tokens=DEFAULT_REPLY_TOKENS,
+                 error_rate=0.0, error_statuses=(500, 502, 503), rate_limit_per_minute=None, reply_text=None, seed=None):
+        self.host = host
+        self.port = port
+        self.tokens_per_second = tokens_per_second
+        self.latency_ms = latency_ms
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.rate_limit_per_minute = rate_limit_per_minute
+        self.reply_text = reply_text
+        self.stats = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._minute = [0.0, 0]  # [début de fenêtre, requêtes]
+        self._use_case_counter = 0
+        self._httpd = None
+
+    # --- Cycle de vie ---
+    @property
+    def url(self):
+        """Base URL to give to the client (``LLM_API_BASE_URL``)."""
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self):
+        handler = type("FakeLLMHandler", (_FakeLLMHandler,), {"fake": self})
+        self._httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name="fake-llm-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    # --- Simulation ---
+    def reply_for(self, prompt):
+        """Reply tokens (words with their leading whitespace) for a prompt."""
+        if self.reply_text is not None:
+            return re.findall(r"\s*\S+|\s+", self.reply_text)
+        if "JSON" in prompt:
+            return re.findall(r"\s*\S+|\s+", self.use_case_reply())
+        prompt_words = prompt.split()[:8]
+        words = ["Réponse", "simulée", ":"] + prompt_words
+        while len(words) < self.reply_tokens:
+            words.append(FILLER_WORDS[len(words) % len(FILLER_WORDS)])
+        words = words[:self.reply_tokens]
+        return [words[0]] + [" " + word for word in words[1:]]
+
+    def use_case_reply(self):
+        """Answer to an assistant meta-prompt: a sentence, then one use case as fenced JSON."""
+        with self._lock:
+            self._use_case_counter += 1
+            number = self._use_case_counter
+        use_case = {f"Cas d'usage simulé {number}": {
+            "description": "Cas d'usage produit par le faux serveur LLM.",
+            "template": "Tu es un assistant de La Poste. Analyse le document suivant et réponds en {format_sortie} :\n{document}",
+            "variables": [
+                {"name": "document", "label": "Document à analyser", "type": "text_area", "height": 200},
+                {"name": "format_sortie", "label": "Format de sortie", "type": "selectbox", "options": ["liste", "tableau"], "default": "liste"},
+            ],
+            "tags": ["simulé"],
+        }}
+        return ("Copiez & collez le fichier suivant dans la section **Injecter un cas d'usage** de votre application\n\n"
+                f"```json\n{json.dumps(use_case, ensure_ascii=False, indent=2)}\n```\n")
+
+    def _admit(self):
+        """Rate limit and error injection: ``(status, headers)`` to refuse with, or None."""
+        now = time.time()
+        with self._lock:
+            if self.rate_limit_per_minute:
+                if now - self._minute[0] >= 60:
+                    self._minute = [now, 0]
+                if self._minute[1] >= self.rate_limit_per_minute:
+                    return 429, {"Retry-After": str(max(1, int(self._minute[0] + 60 - now)))}
+                self._minute[1] += 1
+            if self.error_rate and self._rng.random() < self.error_rate:
+                return self._rng.choice(self.error_statuses), {}
+        return None
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+class _FakeLLMHandler(BaseHTTPRequestHandler):
+    fake = None  # FakeLLMServer, fixé par FakeLLMServer.start
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, status):
+        with self.fake._lock:
+            self.fake.stats[f"{self.command} {status}"] += 1
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self._count(status)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if urlsplit(self.path).path.rstrip("/") != "/_stats":
+            return self._send_json(404, {"error": {"message": "Not Found"}})
+        with self.fake._lock:
+            stats = {"requests": dict(self.fake.stats), "in_flight": self.fake.in_flight, "max_in_flight": self.fake.max_in_flight}
+        self._send_json(200, stats)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not urlsplit(self.path).path.rstrip("/").endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": "Not Found"}})
+        try:
+            request = json.loads(body.decode("utf-8"))
+            prompt = "\n".join(str(message.get("content", "")) for message in request["messages"])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return self._send_json(400, {"error": {"message": "Invalid request body"}})
+        refusal = self.fake._admit()
+        if refusal is not None:
+            status, headers = refusal
+            return self._send_json(status, {"error": {"message": "Rate limit reached" if status == 429 else "Injected server error"}}, headers)
+        self.fake._enter()
+        try:
+            if self.fake.latency_ms:
+                time.sleep(self.fake.latency_ms / 1000)
+            tokens = self.fake.reply_for(prompt)
+            model = request.get("model", "fake-model")
+            if request.get("stream"):
+                self._stream(tokens, model)
+            else:
+                if self.fake.tokens_per_second:
+                    time.sleep(len(tokens) / self.fake.tokens_per_second)
+                self._send_json(200, {
+                    "id": "chatcmpl-fake", "object": "chat.completion", "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(tokens), "total_tokens": len(prompt.split()) + len(tokens)},
+                })
+        except (BrokenPipeError, ConnectionResetError): # Client parti (annulation)
+            self._count("disconnected")
+        finally:
+            self.fake._leave()
+
+    def _stream(self, tokens, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        delay = 1 / self.fake.tokens_per_second if self.fake.tokens_per_second else 0
+        for index, token in enumerate(tokens):
+            finish_reason = "stop" if index == len(tokens) - 1 else None
+            event = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": finish_reason}]}
+            self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+            if delay:
+                time.sleep(delay)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.close_connection = True
+        self._count(200)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="0 = sans délai")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="délai avant le premier token")
+    parser.add_argument("--reply-tokens", type=int, default=DEFAULT_REPLY_TOKENS)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probabilité d'une erreur 5xx par requête")
+    parser.add_argument("--rate-limit", type=int, default=None, help="requêtes par minute (429 au-delà)")
+    parser.add_argument("--reply-file", default=None, help="réponse fixe (texte du fichier) pour tous les prompts")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    reply_text = None
+    if args.reply_file:
+        with open(args.reply_file, encoding="utf-8") as reply_file:
+            reply_text = reply_file.read()
+    server = FakeLLMServer(
+        args.host, args.port, args.tokens_per_second, args.latency_ms, args.reply_tokens, args.error_rate,
+        rate_limit_per_minute=args.rate_limit, reply_text=reply_text, seed=args.seed,
+    ).start()
+    print(f"Faux serveur LLM sur {server.url} (LLM_API_BASE_URL={server.url}) - Ctrl+C pour arrêter")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""Multi-session load test: many headless app sessions against the fake Gist server.
+
+    python -m benchmarks.load_test_sessions --sessions 50 --concurrency 8 --latency-ms 80
+    python -m benchmarks.load_test_sessions --script interpro1.py --use-cases 5000 --json load.json
+
+Each session is a Streamlit ``AppTest`` and goes through
+accueil -> choix du métier -> bibliothèque -> recherche -> édition ->
+« Générer Prompt » -> injection JSON. Each step is timed from the widget
+interaction to the end of the resulting rerun(s); the report gives per-step latency percentiles, PATCHes (saves) per second seen by
+the fake Gist and the process RSS growth per session.
+
+AppTest is not thread-safe (it swaps a process-wide Runtime in and out), so
+concurrency comes from worker processes: ``--concurrency`` processes each play
+their share of the sessions back to back, all against the same fake Gist.
+``st.cache_resource`` is therefore shared per worker, not globally. This
+measures server-side rerun cost only (no browser, no websocket).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from streamlit.testing.v1 import AppTest
+
+import gist_store
+from benchmarks.fake_gist_server import FakeGistServer
+from benchmarks.synthetic_library import generate_library_of_size
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GIST_DATA_FILENAME = "prompt_templates_data_v3.json"  # Identique aux apps
+STEPS = ("accueil", "select_family", "library", "search", "edit", "generate", "inject")
+SEARCH_TERMS = ("contrat", "synthèse", "client", "rapport", "facture")
+INJECT_TEMPLATE = "Rédigez une réponse à {destinataire} au sujet de {objet}. Ton : {{ton}}."
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def _rss_kib():
+    """Current resident set size (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 if sys.platform == "darwin" else peak
+
+
+def _find_button(at, label=None, key=None):
+    for button in at.button:
+        if (key is not None and button.key == key) or (label is not None and button.label == label):
+            return button
+    return None
+
+
+class SessionDriver:
+    """Runs the scripted navigation of one user and records the duration of each rerun."""
+
+    def __init__(self, script_path, secrets, family, use_case, session_idx, step_timeout, search_term):
+        self.at = AppTest.from_file(script_path, default_timeout=step_timeout)
+        for name, value in secrets.items():
+            self.at.secrets[name] = value
+        self.family = family
+        self.use_case = use_case
+        self.session_idx = session_idx
+        self.search_term = search_term
+        self.timings = []  # (step, ms, error)
+
+    def _step(self, name, action):
+        start = time.perf_counter()
+        error = None
+        try:
+            action()
+            if self.at.exception:
+                error = str(self.at.exception[0].value)[:200]
+        except Exception as e:  # Timeout AppTest, widget introuvable...
+            error = f"{type(e).__name__}: {e}"[:200]
+        self.timings.append((name, (time.perf_counter() - start) * 1000, error))
+        return error is None
+
+    def _set_state(self, **values):
+        for name, value in values.items():
+            self.at.session_state[name] = value
+
+    def _goto(self, view_mode, **values):
+        self._set_state(view_mode=view_mode, **values)
+        self.at.run()
+
+    def _select_family(self):
+        button = _find_button(self.at, label="📚 Je souhaite utiliser / modifier un prompt existant")
+        if button is None:
+            return self._goto("select_family_for_library")
+        button.click().run()
+
+    def _library(self):
+        family_id = self.at.session_state["library_index"].family_id(self.family)
+        button = _find_button(self.at, key=f"select_family_for_lib_btn_{family_id}")
+        if button is None:
+            return self._goto("library", library_selected_family_for_display=self.family)
+        button.click().run()
+
+    def _search(self):
+        self._set_state(library_search_term=self.search_term)
+        self.at.run()
+
+    def _edit(self):
+        self._set_state(library_search_term="")
+        self._goto("edit", family_selector_edition=self.family, use_case_selector_edition=self.use_case)
+
+    def _generate(self):
+        button = _find_button(self.at, label="🚀 Générer Prompt")
+        if button is None:
+            raise LookupError("Bouton « Générer Prompt » absent de la vue édition")
+        button.click().run()
+
+    def _inject(self):
+        self._goto("inject_manual")
+        self.at.selectbox(key="injection_family_selector").select(self.family).run()
+        use_case_name = f"Charge {self.session_idx} {uuid.uuid4().hex[:6]}"
+        payload = {use_case_name: {"template": INJECT_TEMPLATE, "variables": [
+            {"name": "destinataire", "label": "Destinataire :", "type": "text_input", "default": "Direction"},
+            {"name": "objet", "label": "Objet :", "type": "text_area", "default": "", "height": 100},
+        ], "tags": ["charge"]}}
+        self.at.text_area(key="injection_json_input").input(json.dumps(payload, ensure_ascii=False)).run()
+        self.at.button(key="submit_injection_btn").click().run()
+
+    def run(self):
+        """Play every step in order; stop at the first failing one."""
+        steps = {
+            "accueil": self.at.run, "select_family": self._select_family, "library": self._library,
+            "search": self._search, "edit": self._edit, "generate": self._generate, "inject": self._inject,
+        }
+        for name in STEPS:
+            if not self._step(name, steps[name]):
+                break
+        return self.timings
+
+
+def seed_gist(server, gist_id, n_use_cases, seed):
+    """Push a synthetic library to the fake gist; return ``(family, use_case)`` targets for the sessions."""
+    library = generate_library_of_size(n_use_cases, seed=seed)
+    gist_store.push_library(gist_id, "load-test", library)
+    return [(family, use_case) for family, use_cases in library.items() for use_case in list(use_cases)[:5]]
+
+
+def _run_worker(script_path, secrets, assignments, step_timeout):
+    """Play ``assignments`` (one per session) back to back in this worker process."""
+    os.chdir(APP_DIR)  # Comme « streamlit run » lancé depuis le dépôt (snapshot .cache, images)
+    rss_before = _rss_kib()
+    all_timings = []
+    for session_idx, family, use_case, search_term in assignments:
+        driver = SessionDriver(script_path, secrets, family, use_case, session_idx, step_timeout, search_term)
+        all_timings.append(driver.run())
+    return all_timings, rss_before, _rss_kib()
+
+
+def run_load_test(script="interpro1_light.py", sessions=20, concurrency=4, n_use_cases=1000, latency_ms=50.0,
+                  jitter_ms=0.0, error_rate=0.0, step_timeout=60.0, seed=42):
+    server = FakeGistServer(latency_ms=latency_ms, jitter_ms=jitter_ms, seed=seed).start()
+    previous_base_url = gist_store.GIST_API_URL
+    gist_store.set_api_base_url(server.url)
+    gist_id = f"load-{uuid.uuid4().hex[:12]}"
+    snapshot_file = os.path.join(APP_DIR, gist_store.snapshot_path(gist_id, GIST_DATA_FILENAME))
+    concurrency = max(1, min(concurrency, sessions))
+    try:
+        targets = seed_gist(server, gist_id, n_use_cases, seed)
+        server.error_rate = error_rate  # Injection d'erreurs seulement après l'amorçage
+        server.stats.clear()
+        secrets = {"GIST_ID": gist_id, "GITHUB_PAT": "load-test", "GIST_API_URL": server.url}
+        script_path = os.path.join(APP_DIR, script)
+        assignments = [[] for _ in range(concurrency)]
+        for i in range(sessions):
+            family, use_case = targets[i % len(targets)]
+            assignments[i % concurrency].append((i, family, use_case, SEARCH_TERMS[i % len(SEARCH_TERMS)]))
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=concurrency, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(_run_worker, script_path, secrets, worker_assignments, step_timeout) for worker_assignments in assignments]
+            results = [future.result() for future in futures]
+        wall_s = time.perf_counter() - start
+        server_stats = dict(server.stats)
+    finally:
+        server.stop()
+        gist_store.set_api_base_url(previous_base_url)
+        if os.path.exists(snapshot_file):
+            os.remove(snapshot_file)
+    all_timings = [timings for worker_timings, _, _ in results for timings in worker_timings]
+    rss_growth = sum(after - before for _, before, after in results)
+    rss_workers = sum(after for _, _, after in results)
+    return _report(all_timings, server_stats, wall_s, rss_workers, rss_growth, sessions, concurrency, script)
+
+
+def _report(all_timings, server_stats, wall_s, rss_workers, rss_growth, sessions, concurrency, script):
+    per_step = defaultdict(list)
+    errors = defaultdict(list)
+    for timings in all_timings:
+        for step, ms, error in timings:
+            per_step[step].append(ms)
+            if error:
+                errors[step].append(error)
+    steps = {}
+    for step in STEPS:
+        values = sorted(per_step.get(step, []))
+        steps[step] = {
+            "runs": len(values),
+            "errors": len(errors.get(step, [])),
+            "mean_ms": statistics.fmean(values) if values else None,
+            **{f"p{pct}_ms": _percentile(values, pct) for pct in (50, 90, 95, 99)},
+            "max_ms": values[-1] if values else None,
+            "sample_error": errors[step][0] if errors.get(step) else None,
+        }
+    saves = sum(count for key, count in server_stats.items() if key.startswith("PATCH 2"))
+    return {
+        "script": script,
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "wall_s": wall_s,
+        "completed_sessions": sum(1 for timings in all_timings if len(timings) == len(STEPS) and not timings[-1][2]),
+        "steps": steps,
+        "gist_requests": server_stats,
+        "saves": saves,
+        "saves_per_s": saves / wall_s if wall_s else None,
+        "rss_workers_kib": rss_workers,
+        "rss_per_session_kib": rss_growth / sessions if sessions else None,
+    }
+
+
+def _fmt(value):
+    return f"{value:.0f}" if value is not None else "-"
+
+
+def print_report(report):
+    print(f"{report['script']} : {report['sessions']} sessions ({report['concurrency']} simultanées), "
+          f"{report['completed_sessions']} complètes en {report['wall_s']:.1f} s")
+    print(f"{'étape':<15}{'runs':>6}{'err':>5}{'p50 ms':>9}{'p90 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for step, row in report["steps"].items():
+        print(f"{step:<15}{row['runs']:>6}{row['errors']:>5}{_fmt(row['p50_ms']):>9}{_fmt(row['p90_ms']):>9}"
+              f"{_fmt(row['p95_ms']):>9}{_fmt(row['p99_ms']):>9}{_fmt(row['max_ms']):>9}")
+        if row["sample_error"]:
+            print(f"    ex. d'erreur : {row['sample_error']}")
+    print(f"Sauvegardes Gist : {report['saves']} ({report['saves_per_s']:.2f}/s) - requêtes : {report['gist_requests']}")
+    print(f"RSS des workers : {report['rss_workers_kib'] / 1024:.0f} MiB au total, "
+          f"~{report['rss_per_session_kib']:.0f} KiB de croissance par session")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--script", default="interpro1_light.py", choices=["interpro1.py", "interpro1_light.py"])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4, help="nombre de processus workers")
+    parser.add_argument("--use-cases", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--step-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="écrit aussi le rapport complet dans ce fichier")
+    args = parser.parse_args()
+    report = run_load_test(args.script, args.sessions, args.concurrency, args.use_cases, args.latency_ms,
+                           args.jitter_ms, args.error_rate, args.step_timeout, args.seed)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
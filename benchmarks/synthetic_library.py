@@ -0,0 +1,132 @@
+"""Seeded generator of synthetic prompt libraries (same structure as the Gist data).
+
+    from benchmarks.synthetic_library import generate_library
+    library = generate_library(n_families=20, use_cases_per_family=250, seed=42)
+"""
+import random
+from datetime import datetime, timedelta
+
+from library_ids import legacy_use_case_id
+
+FAMILY_NAMES = [
+    "Achat", "RH", "Finance", "Comptabilité", "Juridique", "Marketing", "Communication", "Logistique",
+    "Courrier", "Colis", "Service Client", "Informatique", "Data / IA", "Immobilier", "Sécurité",
+    "Qualité", "Formation", "Stratégie", "Audit", "Relations Sociales",
+]
+ACTIONS = [
+    "Résumer", "Analyser", "Rédiger", "Comparer", "Extraire", "Synthétiser", "Reformuler", "Classer",
+    "Vérifier", "Traduire", "Structurer", "Évaluer",
+]
+OBJECTS = [
+    "un contrat fournisseur", "des CV candidats", "un rapport financier", "un appel d'offres", "des e-mails clients",
+    "une note de service", "un compte rendu de réunion", "des réclamations", "un cahier des charges",
+    "une facture", "un procès-verbal", "une politique interne", "des avis clients", "un bilan comptable",
+]
+AUDIENCES = ["la direction", "les managers", "les équipes terrain", "le grand public", "des profils techniques", "les partenaires"]
+OUTPUT_FORMATS = ["une liste à puces", "un tableau markdown", "un texte de deux pages", "un JSON structuré", "un e-mail prêt à envoyer"]
+TAGS = ["synthèse", "extraction", "rédaction", "analyse", "juridique", "rh", "finance", "client", "interne", "urgent", "modèle", "relecture"]
+VARIABLE_SPECS = [
+    ("document_source", "Collez le document à traiter :", "text_area"),
+    ("contexte", "Contexte de la demande :", "text_area"),
+    ("nom_client", "Nom du client :", "text_input"),
+    ("destinataire", "Destinataire :", "text_input"),
+    ("ton", "Ton souhaité :", "selectbox"),
+    ("langue", "Langue de sortie :", "selectbox"),
+    ("date_echeance", "Date d'échéance :", "date_input"),
+    ("date_document", "Date du document :", "date_input"),
+    ("nombre_points", "Nombre de points clés :", "number_input"),
+    ("budget", "Budget (k€) :", "number_input"),
+]
+SELECT_OPTIONS = {"ton": ["Formel", "Neutre", "Chaleureux"], "langue": ["Français", "Anglais", "Espagnol"]}
+
+TEMPLATE_SECTIONS = """# RÔLE
+Vous êtes un expert {domaine} au sein du groupe La Poste. Vous maîtrisez les procédures internes et le vocabulaire métier.
+
+# MISSION
+{action} {objet} pour {audience}.
+
+# CONTEXTE
+{contexte_block}
+
+# INSTRUCTIONS
+1. Lisez attentivement les éléments fournis.
+2. Identifiez les informations clés, les risques et les points d'attention.
+3. Produisez une réponse claire, factuelle et sans invention.
+4. Si une information manque, signalez-la explicitement.
+
+# FORMAT DE SORTIE
+Présentez le résultat sous la forme d'{format_sortie}. Utilisez {{{{titre}}}} comme titre si pertinent.
+
+# RÈGLES
+- Ne divulguez aucune donnée personnelle.
+- Restez concis : pas plus de {limite} mots.
+- Citez les passages source entre guillemets.
+"""
+
+
+def _variable(rng, name, label, var_type):
+    var = {"name": name, "label": label, "type": var_type}
+    if var_type == "text_area":
+        var["default"] = ""
+        var["height"] = rng.choice([100, 150, 200, 300])
+    elif var_type == "text_input":
+        var["default"] = rng.choice(["", "La Poste", "Direction"])
+    elif var_type == "selectbox":
+        var["options"] = list(SELECT_OPTIONS[name])
+        var["default"] = var["options"][0]
+    elif var_type == "date_input":
+        var["default"] = (datetime(2025, 1, 1) + timedelta(days=rng.randint(0, 365))).strftime("%Y-%m-%d")
+    elif var_type == "number_input":
+        var["default"] = float(rng.randint(1, 10))
+        var["min_value"] = 0.0
+        var["max_value"] = 100.0
+        var["step"] = 1.0
+    return var
+
+
+def generate_use_case(rng, family_name):
+    variables = [_variable(rng, *spec) for spec in rng.sample(VARIABLE_SPECS, rng.randint(2, 6))]
+    contexte_block = "\n".join(f"- {var['label']} {{{var['name']}}}" for var in variables)
+    template = TEMPLATE_SECTIONS.format(
+        domaine=family_name.lower(), action=rng.choice(ACTIONS), objet=rng.choice(OBJECTS),
+        audience=rng.choice(AUDIENCES), contexte_block=contexte_block,
+        format_sortie=rng.choice(OUTPUT_FORMATS), limite=rng.choice([200, 300, 500, 800]),
+    )
+    created = datetime(2025, 1, 1) + timedelta(minutes=rng.randint(0, 500000))
+    return {
+        "template": template,
+        "variables": variables,
+        "tags": sorted(rng.sample(TAGS, rng.randint(0, 4))),
+        "usage_count": rng.randint(0, 500),
+        "created_at": created.isoformat(),
+        "updated_at": (created + timedelta(days=rng.randint(0, 90))).isoformat(),
+    }
+
+
+def generate_library(n_families=10, use_cases_per_family=10, seed=0):
+    """Return a library dict ``{family: {use_case_name: config}}`` in saved (JSON) form."""
+    rng = random.Random(seed)
+    library = {}
+    for family_idx in range(n_families):
+        base_name = FAMILY_NAMES[family_idx % len(FAMILY_NAMES)]
+        family_name = base_name if family_idx < len(FAMILY_NAMES) else f"{base_name} {family_idx // len(FAMILY_NAMES) + 1}"
+        use_cases = {}
+        for uc_idx in range(use_cases_per_family):
+            uc_name = f"{rng.choice(ACTIONS)} {rng.choice(OBJECTS)} #{uc_idx + 1}"
+            use_cases[uc_name] = generate_use_case(rng, base_name)
+            use_cases[uc_name]["id"] = legacy_use_case_id(family_name, uc_name)  # Bibliothèque déjà migrée (IDs enregistrés)
+        library[family_name] = use_cases
+    return library
+
+
+def generate_library_of_size(n_use_cases, seed=0, max_use_cases_per_family=500):
+    """Library with exactly ``n_use_cases`` use cases spread over as few families as needed."""
+    n_families = max(1, -(-n_use_cases // max_use_cases_per_family))
+    per_family = -(-n_use_cases // n_families)
+    library = generate_library(n_families, per_family, seed)
+    extra = n_families * per_family - n_use_cases
+    for family_name in reversed(list(library)):
+        while extra and library[family_name]:
+            library[family_name].pop(next(reversed(library[family_name])))
+            extra -= 1
+    return library
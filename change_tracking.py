@@ -0,0 +1,57 @@
+"""Per-use-case content hashes and dirty flags, so no-op saves never reach the Gist."""
+import hashlib
+import json
+
+# Champs qui changent à chaque sauvegarde sans refléter une modification du contenu
+VOLATILE_FIELDS = ("updated_at",)
+
+
+def use_case_fingerprint(config):
+    """Stable hash of a use case config, ignoring volatile fields (dates are serialized with str)."""
+    relevant = {key: value for key, value in config.items() if key not in VOLATILE_FIELDS}
+    canonical = json.dumps(relevant, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _library_layout(library):
+    return [(family_name, tuple(use_cases)) for family_name, use_cases in library.items()]
+
+
+class DirtyTracker:
+    """Remembers the fingerprint of each use case as last loaded/saved.
+
+    Content edits go through ``record_change`` (which tells the caller whether
+    anything really changed); structural edits (families or use cases added,
+    removed, renamed, reordered) are detected by comparing the library layout.
+    """
+
+    def __init__(self, library):
+        self.reset(library)
+
+    def reset(self, library):
+        self.fingerprints = {
+            (family_name, uc_name): use_case_fingerprint(config)
+            for family_name, use_cases in library.items() for uc_name, config in use_cases.items()
+        }
+        self.saved_layout = _library_layout(library)
+        self.dirty = set()
+
+    def record_change(self, family_name, use_case_name, config):
+        """Flag the use case as dirty if its content differs from the saved version."""
+        key = (family_name, use_case_name)
+        if self.fingerprints.get(key) == use_case_fingerprint(config):
+            self.dirty.discard(key)
+            return False
+        self.dirty.add(key)
+        return True
+
+    def has_changes(self, library):
+        return bool(self.dirty) or _library_layout(library) != self.saved_layout
+
+    def mark_saved(self, library):
+        """Update fingerprints after a successful save.
+
+        Every use case is rehashed: edits that bypass ``record_change`` (the
+        usage counter, for instance) were saved too.
+        """
+        self.reset(library)
@@ -0,0 +1,298 @@
+"""Context-window-aware splitting of a long variable, and map-reduce execution over the chunks.
+
+A use case whose variable holds a whole document (pasted, or bound with
+``document_ingestion``) can render a prompt larger than the model's context
+window. ``plan_map_reduce`` splits that variable into overlapping chunks sized
+so that each rendered prompt fits (template + chunk + room for the answer),
+renders one "map" prompt per chunk and keeps the instruction for the "reduce"
+prompt that merges the partial answers. ``MapReduceJob`` runs the map prompts
+concurrently on ``BACKGROUND_LOOP`` (within the client's concurrency and rate
+bounds), then the reduce prompt; when the partial answers do not fit in one
+reduce prompt, they are merged in several rounds. A partial answer longer than
+half the room of a reduce prompt is truncated, so each round at least halves
+their number, and the rounds are capped (``MAX_REDUCE_ROUNDS``).
+
+``split_text`` prefers paragraph breaks, then sentence ends, then whitespace,
+and cuts hard only inside a very long word. Boundaries are found by one regex
+pass per kind and every search walks forward in those sorted lists, so
+splitting is linear in the length of the document. Sizes are in tokens, counted
+with ``count_tokens`` (the model's tokenizer, ``token_counting``; by default a
+length estimate at ``CHARS_PER_TOKEN``): chunks are cut in characters at the
+document's own characters-per-token ratio, and every map prompt is counted and
+the split redone smaller if one of them still exceeds the window.
+"""
+import re
+from collections import namedtuple
+
+from llm_client import BACKGROUND_LOOP
+from render_cache import render_use_case_prompt
+
+CHARS_PER_TOKEN = 3.0  # Estimation prudente pour du français (moins de 4 caractères par token en moyenne)
+DEFAULT_CONTEXT_TOKENS = 128000
+DEFAULT_OUTPUT_RESERVE_TOKENS = 4096
+DEFAULT_OVERLAP_RATIO = 0.1
+MIN_CHUNK_TOKENS = 250
+CHUNK_SAFETY = 0.95  # Marge sur le rapport caractères/token du document (il varie d'un extrait à l'autre)
+MAX_SPLIT_ATTEMPTS = 4
+MAX_REDUCE_ROUNDS = 5
+SECTION_TOKENS = 16  # Titre "## Extrait n" et sauts de ligne d'une réponse partielle
+TRUNCATION_MARK = " […]"
+CHUNK_HEADER = "[Extrait {number}/{total}]\n"
+CHUNKED_PLACEHOLDER = "[Document long, traité extrait par extrait ; les réponses partielles sont fournies ci-dessous]"
+
+REDUCE_TEMPLATE = """Une consigne a été appliquée séparément à chacun des {total} extraits d'un document trop long pour être traité en une fois. Les réponses obtenues pour chaque extrait sont données ci-dessous, dans l'ordre du document (les extraits se chevauchent légèrement).
+
+Rédige la réponse finale à la consigne pour l'ensemble du document : fusionne les réponses partielles, supprime les répétitions, résous les contradictions en le signalant, et respecte le format demandé par la consigne.
+
+# CONSIGNE D'ORIGINE
+{instruction}
+
+# RÉPONSES PARTIELLES
+{partials}"""
+
+Chunk = namedtuple("Chunk", "index start end text")
+MapReducePlan = namedtuple("MapReducePlan", "variable chunks map_prompts instruction budget_tokens count_tokens")
+
+_PARAGRAPH_RE = re.compile(r"\n[ \t]*\n\s*")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…;:])[\"»)\]]*\s+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def estimate_tokens(text):
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def fits_context(prompt, context_tokens, reserve_tokens=DEFAULT_OUTPUT_RESERVE_TOKENS, count_tokens=estimate_tokens):
+    """``count_tokens``: the model's tokenizer when known (``token_counting``), else the length estimate."""
+    return count_tokens(prompt) + reserve_tokens <= context_tokens
+
+
+class _Cursor:
+    """Forward-only search in sorted positions: over a whole split, each position is passed once."""
+
+    def __init__(self, positions):
+        self.positions = positions
+        self.index = 0
+
+    def last_at_most(self, limit, floor):
+        """Largest position <= ``limit``, if it is > ``floor`` (``limit`` never decreases between calls)."""
+        positions = self.positions
+        while self.index < len(positions) and positions[self.index] <= limit:
+            self.index += 1
+        if self.index and positions[self.index - 1] > floor:
+            return positions[self.index - 1]
+        return None
+
+    def first_at_least(self, limit):
+        """Smallest position >= ``limit`` (``limit`` never decreases between calls)."""
+        positions = self.positions
+        while self.index < len(positions) and positions[self.index] < limit:
+            self.index += 1
+        return positions[self.index] if self.index < len(positions) else None
+
+
+def split_text(text, max_chars, overlap_chars=0):
+    """Chunks of at most ``max_chars``, cut at the best boundary in their second half.
+
+    Consecutive chunks share about ``overlap_chars`` (starting at a sentence,
+    else a word), capped at half a chunk so the split always moves forward.
+    """
+    if max_chars <= 0:
+        raise ValueError("max_chars doit être positif")
+    if len(text) <= max_chars:
+        return [Chunk(0, 0, len(text), text)]
+    overlap_chars = max(0, min(overlap_chars, max_chars // 2 - 1))
+    sentences = [match.end() for match in _SENTENCE_RE.finditer(text)]
+    spaces = [match.end() for match in _SPACE_RE.finditer(text)]
+    end_cursors = [_Cursor([match.end() for match in _PARAGRAPH_RE.finditer(text)]), _Cursor(sentences), _Cursor(spaces)]
+    start_cursors = [_Cursor(sentences), _Cursor(spaces)]
+    chunks = []
+    start = 0
+    while True:
+        limit = start + max_chars
+        if limit >= len(text):
+            chunks.append(Chunk(len(chunks), start, len(text), text[start:]))
+            return chunks
+        floor = start + max_chars // 2 # Une coupure garde au moins une demi-taille d'extrait
+        end = None
+        for cursor in end_cursors:
+            end = cursor.last_at_most(limit, floor)
+            if end is not None:
+                break
+        if end is None:
+            end = limit # Aucun blanc dans la seconde moitié : coupure franche
+        chunks.append(Chunk(len(chunks), start, end, text[start:end]))
+        next_start = end
+        if overlap_chars:
+            for cursor in start_cursors:
+                candidate = cursor.first_at_least(end - overlap_chars)
+                if candidate is not None and candidate < end:
+                    next_start = candidate
+                    break
+        start = max(next_start, floor + 1) # Progression garantie (recouvrement < demi-extrait)
+
+
+def largest_variable(values):
+    """Name of the longest value, the one worth splitting."""
+    return max(values, key=lambda name: len(str(values[name])), default=None)
+
+
+def plan_map_reduce(title, template, values, variable, context_tokens, reserve_tokens=DEFAULT_OUTPUT_RESERVE_TOKENS,
+                    overlap_ratio=DEFAULT_OVERLAP_RATIO, count_tokens=estimate_tokens):
+    """Split ``values[variable]`` so each rendered map prompt fits the context window.
+
+    ``template`` is already expanded and ``values`` formatted (documents resolved).
+    ValueError when the template and the other values leave no room for a chunk.
+    """
+    budget = context_tokens - reserve_tokens
+    header = CHUNK_HEADER.format(number=999, total=999)
+    overhead = count_tokens(render_use_case_prompt(title, template, {**values, variable: header}))
+    room = budget - overhead
+    if room < MIN_CHUNK_TOKENS:
+        raise ValueError(f"Le template et les autres variables occupent déjà ~{overhead} tokens : "
+                         f"pas de place pour des extraits dans une fenêtre de {context_tokens} tokens.")
+    text = str(values[variable])
+    chars_per_token = len(text) / max(1, count_tokens(text))
+    max_chunk = max(1, int(room * chars_per_token * CHUNK_SAFETY))
+    for _ in range(MAX_SPLIT_ATTEMPTS):
+        chunks = split_text(text, max_chunk, int(max_chunk * overlap_ratio))
+        map_prompts = [
+            render_use_case_prompt(title, template, {**values, variable: CHUNK_HEADER.format(number=chunk.index + 1, total=len(chunks)) + chunk.text})
+            for chunk in chunks
+        ]
+        largest = max(count_tokens(prompt) for prompt in map_prompts)
+        if largest <= budget:
+            break
+        # Un extrait plus dense que la moyenne du document dépasse : nouveau découpage, plus fin
+        max_chunk = max(1, int(max_chunk * room / max(1, largest - overhead) * CHUNK_SAFETY))
+    else:
+        raise ValueError(f"Impossible de découper {{{variable}}} en extraits de moins de {room} tokens.")
+    instruction = render_use_case_prompt(title, template, {**values, variable: CHUNKED_PLACEHOLDER})
+    return MapReducePlan(variable, chunks, map_prompts, instruction, budget, count_tokens)
+
+
+def _reduce_overhead(instruction, partials, count_tokens):
+    return count_tokens(REDUCE_TEMPLATE.format(total=len(partials), instruction=instruction, partials=""))
+
+
+def truncate_partials(instruction, partials, budget_tokens, count_tokens=estimate_tokens):
+    """``partials`` with those longer than half the room of a reduce prompt cut, so any two fit together.
+
+    Returns ``(partials, number truncated)``, or ``(None, 0)`` when the instruction leaves no room.
+    """
+    allowed = (budget_tokens - _reduce_overhead(instruction, partials, count_tokens)) // 2 - SECTION_TOKENS
+    if allowed < MIN_CHUNK_TOKENS:
+        return None, 0
+    kept, truncated = [], 0
+    for partial in partials:
+        tokens = count_tokens(partial)
+        if tokens > allowed:
+            partial = partial[:int(len(partial) * allowed / tokens * CHUNK_SAFETY)].rstrip() + TRUNCATION_MARK
+            truncated += 1
+        kept.append(partial)
+    return kept, truncated
+
+
+def reduce_prompts(instruction, partials, budget_tokens, count_tokens=estimate_tokens, first_number=1):
+    """Reduce prompts merging ``partials``: one if they fit, else consecutive groups that each fit."""
+    overhead = _reduce_overhead(instruction, partials, count_tokens)
+    sections = [f"## Extrait {number}\n{partial.strip()}\n" for number, partial in enumerate(partials, first_number)]
+    groups, current, size = [], [], 0
+    for section in sections:
+        section_tokens = count_tokens(section) + 1
+        if current and overhead + size + section_tokens > budget_tokens:
+            groups.append(current)
+            current, size = [], 0
+        current.append(section)
+        size += section_tokens
+    groups.append(current)
+    return [REDUCE_TEMPLATE.format(total=len(partials), instruction=instruction, partials="\n".join(group)) for group in groups]
+
+
+class MapReduceJob:
+    """Map prompts then reduce prompt(s) on ``BACKGROUND_LOOP``, polled from a script thread."""
+
+    def __init__(self, client, plan, use_cache=True):
+        self.plan = plan
+        self.stage = "map" # map, reduce, done
+        self.reduce_rounds = 0
+        self.truncated_partials = 0
+        self.map_results = [None] * len(plan.map_prompts)
+        self.error = None
+        self.result = None # CompletionResult du prompt de synthèse
+        self._map_parts = [[] for _ in plan.map_prompts]
+        self._reduce_parts = []
+        self._future = BACKGROUND_LOOP.submit(self._run(client, use_cache))
+
+    def _on_map_delta(self, index, delta):
+        self._map_parts[index].append(delta)
+
+    def _on_map_result(self, index, result):
+        self.map_results[index] = result
+
+    async def _run(self, client, use_cache):
+        results = await client.run_batch(self.plan.map_prompts, self._on_map_delta, self._on_map_result, True, use_cache)
+        failed = [index + 1 for index, result in enumerate(results) if result.status != "ok"]
+        if failed:
+            self.error = f"Échec sur les extraits {', '.join(map(str, failed))} : {results[failed[0] - 1].error or results[failed[0] - 1].status}"
+            self.stage = "done"
+            return
+        partials = [result.text for result in results]
+        self.stage = "reduce"
+        plan = self.plan
+        while True:
+            self.reduce_rounds += 1
+            if self.reduce_rounds > MAX_REDUCE_ROUNDS:
+                self.error = f"Synthèse interrompue après {MAX_REDUCE_ROUNDS} tours : les réponses partielles restent trop longues."
+                self.stage = "done"
+                return
+            partials, truncated = truncate_partials(plan.instruction, partials, plan.budget_tokens, plan.count_tokens)
+            if partials is None:
+                self.error = "La consigne occupe presque toute la fenêtre de contexte : pas de place pour les réponses partielles."
+                self.stage = "done"
+                return
+            self.truncated_partials += truncated
+            prompts = reduce_prompts(plan.instruction, partials, plan.budget_tokens, plan.count_tokens)
+            if len(prompts) > 1 and len(prompts) >= len(partials): # Aucune fusion : un tour de plus ne réduirait rien
+                self.error = "Synthèse impossible : les réponses partielles ne peuvent pas être regroupées dans la fenêtre de contexte."
+                self.stage = "done"
+                return
+            if len(prompts) == 1:
+                self.result = await client.complete(prompts[0], self._reduce_parts.append, True, use_cache)
+                if self.result.status != "ok":
+                    self.error = f"Échec de la synthèse : {self.result.error or self.result.status}"
+                self.stage = "done"
+                return
+            # Réponses partielles trop longues pour une seule synthèse : fusion par groupes, puis nouveau tour
+            results = await client.run_batch(prompts, stream=False, use_cache=use_cache)
+            if any(result.status != "ok" for result in results):
+                self.error = "Échec d'une synthèse intermédiaire."
+                self.stage = "done"
+                return
+            partials = [result.text for result in results]
+
+    @property
+    def map_texts(self):
+        return ["".join(parts) for parts in self._map_parts]
+
+    @property
+    def reduce_text(self):
+        return "".join(self._reduce_parts)
+
+    @property
+    def maps_done(self):
+        return sum(result is not None for result in self.map_results)
+
+    @property
+    def done(self):
+        return self._future.done()
+
+    def cancel(self):
+        self._future.cancel()
+
+    def wait(self, timeout=None):
+        try:
+            self._future.result(timeout)
+        except Exception: # Annulation : les textes partiels restent disponibles
+            pass
+        return self
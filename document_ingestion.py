@@ -0,0 +1,384 @@
+"""Text extraction from uploaded documents (PDF, EML, DOCX, TXT), bound to variables by reference.
+
+Use cases whose assistant form listed document sources (``doc_source``) have
+``text_area`` variables meant to receive a whole document. Pasting a
+multi-MB text makes every rerun ship it through the widget, the form and the
+``st.code`` of the generated prompt. Here an uploaded file is extracted once,
+in a background worker, and the variable receives a short reference token
+(``document_reference``); the full text is substituted only where it is really
+needed: the prompt sent to the LLM endpoint and the downloaded prompt
+(``resolve_document_references``).
+
+* Extraction streams: each extractor yields ``(text, progress)`` pieces (a PDF
+  page, a batch of DOCX paragraphs, an e-mail part), so the UI shows progress
+  and the beginning of the text while a large file is still being read.
+* Cache: extracted texts are stored on disk by SHA-256 of the file bytes
+  (``DocumentStore``), so uploading the same file again, in any session, is
+  instant. Least recently used files are deleted beyond ``max_bytes``.
+* PDF: ``pypdf`` is used when installed; without it a minimal parser reads
+  the text operators of the (Flate-compressed) content streams, which covers
+  simple PDFs but not fonts with custom encodings.
+* DOCX and EML only need the standard library; attachments of an e-mail in a
+  supported format are extracted after its body.
+"""
+import email
+import email.policy
+import hashlib
+import html
+import io
+import os
+import re
+import threading
+import time
+import zipfile
+import zlib
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+import metrics
+
+try:
+    import pypdf
+except ImportError: # Dépendance optionnelle
+    pypdf = None
+
+SUPPORTED_EXTENSIONS = ("pdf", "eml", "docx", "txt")
+DEFAULT_STORE_DIRECTORY = os.path.join(".cache", "documents")
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+MAX_MEMORY_CHARS = 20_000_000  # Textes récents gardés en mémoire (évite de relire le disque à chaque rerun)
+INGESTION_WORKERS = 2
+DOCX_PARAGRAPHS_PER_PIECE = 200
+
+DocumentRef = namedtuple("DocumentRef", "digest name chars")
+
+_REFERENCE_RE = re.compile(r"⟦📎[^⟧]*?·\s*([0-9a-f]{64})⟧")
+
+
+def file_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def format_count(number):
+    """``1234567`` -> ``"1 234 567"`` (séparateur de milliers français)."""
+    return f"{number:,}".replace(",", " ")
+
+
+def document_reference(ref):
+    """Token standing for the document in variable values and generated prompts."""
+    name = ref.name.replace("⟦", "").replace("⟧", "").replace("·", "-")
+    return f"⟦📎 {name} · {format_count(ref.chars)} caractères · {ref.digest}⟧"
+
+
+def resolve_document_references(text, store):
+    """Replace every reference token by its document text (tokens of unknown documents are kept)."""
+    if "⟦📎" not in text:
+        return text
+    def _replace(match):
+        document_text = store.get(match.group(1))
+        return match.group(0) if document_text is None else document_text
+    return _REFERENCE_RE.sub(_replace, text)
+
+
+# --- Extracteurs : générateurs de (texte, progression entre 0 et 1) ---
+def _decode_text(data):
+    for encoding in ("utf-8-sig", "cp1252"):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("latin-1") # pragma: no cover (cp1252 n'échoue que sur 5 octets)
+
+
+def iter_txt(data):
+    yield _decode_text(data).replace("\r\n", "\n"), 1.0
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def iter_docx(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        xml_file = archive.open("word/document.xml")
+        total = archive.getinfo("word/document.xml").file_size or 1
+        paragraphs, runs = [], []
+        for event, element in ElementTree.iterparse(xml_file, events=("end",)):
+            if element.tag == _W + "t":
+                runs.append(element.text or "")
+            elif element.tag == _W + "tab":
+                runs.append("\t")
+            elif element.tag in (_W + "br", _W + "cr"):
+                runs.append("\n")
+            elif element.tag == _W + "p":
+                paragraphs.append("".join(runs))
+                runs = []
+                element.clear()
+                if len(paragraphs) >= DOCX_PARAGRAPHS_PER_PIECE:
+                    yield "\n".join(paragraphs) + "\n", min(0.99, xml_file.tell() / total)
+                    paragraphs = []
+        yield "\n".join(paragraphs), 1.0
+
+
+_TAG_RE = re.compile(r"<(script|style)\b.*?</\1>|<[^>]+>", re.DOTALL | re.IGNORECASE)
+
+
+def _html_to_text(markup):
+    text = re.sub(r"<br\s*/?>|</p>|</div>|</tr>|</li>", "\n", markup, flags=re.IGNORECASE)
+    return re.sub(r"\n{3,}", "\n\n", html.unescape(_TAG_RE.sub("", text))).strip()
+
+
+def iter_eml(data):
+    message = email.message_from_bytes(data, policy=email.policy.default)
+    headers = [f"{name} : {message[name]}" for name in ("From", "To", "Cc", "Date", "Subject") if message[name]]
+    yield "\n".join(headers) + "\n\n", 0.1
+    bodies, html_bodies, attachments = [], [], []
+    for part in message.walk():
+        if part.is_multipart():
+            continue
+        filename = part.get_filename()
+        if filename or part.get_content_disposition() == "attachment":
+            attachments.append(part)
+        elif part.get_content_type() == "text/plain":
+            bodies.append(part.get_content())
+        elif part.get_content_type() == "text/html":
+            html_bodies.append(_html_to_text(part.get_content()))
+    yield "\n\n".join(bodies or html_bodies).strip() + "\n", 0.5 if attachments else 1.0
+    for index, part in enumerate(attachments, 1):
+        filename = part.get_filename() or "pièce jointe"
+        payload = part.get_payload(decode=True) or b""
+        yield f"\n--- Pièce jointe : {filename} ---\n", 0.5 + 0.5 * (index - 0.5) / len(attachments)
+        extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+        if extension not in SUPPORTED_EXTENSIONS:
+            yield "(format non pris en charge, non extraite)\n", 0.5 + 0.5 * index / len(attachments)
+            continue
+        for text, _ in iter_document_text(filename, payload):
+            yield text, 0.5 + 0.5 * (index - 0.5) / len(attachments)
+        yield "\n", 0.5 + 0.5 * index / len(attachments)
+
+
+def iter_pdf(data):
+    if pypdf is not None:
+        reader = pypdf.PdfReader(io.BytesIO(data))
+        total = len(reader.pages) or 1
+        for index, page in enumerate(reader.pages, 1):
+            yield (page.extract_text() or "") + "\n\n", index / total
+        return
+    yield from _iter_pdf_streams(data)
+
+
+# Parseur minimal (sans pypdf) : flux de contenu décompressés, opérateurs de texte Tj, TJ, ' et "
+_STREAM_RE = re.compile(rb"<<(.*?)>>\s*stream\r?\n(.*?)\r?\nendstream", re.DOTALL)
+_TEXT_BLOCK_RE = re.compile(rb"BT\b(.*?)\bET\b", re.DOTALL)
+_TEXT_TOKEN_RE = re.compile(rb"\((?:\\.|[^\\)])*\)|\[(?:\\.|[^\]])*\]\s*TJ|T\*|-?[\d.]+\s+-?[\d.]+\s+T[dD]|'|\"")
+_STRING_RE = re.compile(rb"\(((?:\\.|[^\\)])*)\)", re.DOTALL)
+_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f", b"(": b"(", b")": b")", b"\\": b"\\"}
+
+
+def _pdf_string(raw):
+    unescaped = re.sub(rb"\\([0-7]{1,3}|.)", lambda m: bytes([int(m.group(1), 8) & 0xFF]) if m.group(1)[:1].isdigit() else _ESCAPES.get(m.group(1), m.group(1)), raw, flags=re.DOTALL)
+    if unescaped.startswith(b"\xfe\xff"):
+        return unescaped[2:].decode("utf-16-be", "replace")
+    return unescaped.decode("cp1252", "replace")
+
+
+def _content_text(content):
+    lines = []
+    for block in _TEXT_BLOCK_RE.finditer(content):
+        line = []
+        for token in _TEXT_TOKEN_RE.finditer(block.group(1)):
+            value = token.group(0)
+            if value.startswith(b"("):
+                line.append(_pdf_string(value[1:-1]))
+            elif value.startswith(b"["):
+                line.append("".join(_pdf_string(item) for item in _STRING_RE.findall(value)))
+            elif not line or line[-1].endswith(("\n", " ")):
+                continue
+            elif value.endswith((b"Td", b"TD")) and float(value.split()[1]) == 0:
+                line.append(" ") # Déplacement horizontal : même ligne
+            else:
+                line.append("\n")
+        lines.append("".join(line).rstrip())
+    return "\n".join(line for line in lines if line)
+
+
+def _iter_pdf_streams(data):
+    streams = list(_STREAM_RE.finditer(data))
+    total = len(streams) or 1
+    for index, match in enumerate(streams, 1):
+        dictionary, body = match.groups()
+        if b"/Subtype" in dictionary or b"/Type /XObject" in dictionary or b"/Type/XObject" in dictionary:
+            continue # Images, polices
+        if b"/FlateDecode" in dictionary:
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                continue
+        elif b"/Filter" in dictionary:
+            continue # Autres filtres (DCT, LZW...) : pas du texte exploitable
+        text = _content_text(body)
+        if text:
+            yield text + "\n\n", index / total
+    yield "", 1.0
+
+
+EXTRACTORS = {"pdf": iter_pdf, "eml": iter_eml, "docx": iter_docx, "txt": iter_txt}
+
+
+def document_format(filename):
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    return extension if extension in EXTRACTORS else None
+
+
+def iter_document_text(filename, data):
+    """Extract ``data`` according to the extension of ``filename``; ValueError for unsupported formats."""
+    extension = document_format(filename)
+    if extension is None:
+        raise ValueError(f"Format non pris en charge : {filename} (formats acceptés : {', '.join(SUPPORTED_EXTENSIONS)})")
+    return EXTRACTORS[extension](data)
+
+
+# --- Cache disque des textes extraits ---
+class DocumentStore:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, max_memory_chars=MAX_MEMORY_CHARS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_memory_chars = max_memory_chars
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # empreinte -> texte, les plus récents à la fin
+        self._memory_chars = 0
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}.txt.z")
+
+    def _remember(self, digest, text):
+        if digest in self._memory:
+            self._memory.move_to_end(digest)
+            return
+        self._memory[digest] = text
+        self._memory_chars += len(text)
+        while self._memory_chars > self.max_memory_chars and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_chars -= len(evicted)
+
+    def get(self, digest):
+        with self._lock:
+            text = self._memory.get(digest)
+            if text is not None:
+                self._memory.move_to_end(digest)
+                return text
+        try:
+            with open(self._path(digest), "rb") as stored:
+                text = zlib.decompress(stored.read()).decode("utf-8")
+            os.utime(self._path(digest)) # Date d'accès pour l'éviction LRU
+        except (OSError, zlib.error):
+            return None
+        with self._lock:
+            self._remember(digest, text)
+        return text
+
+    def put(self, digest, text):
+        path = self._path(digest)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as stored:
+            stored.write(zlib.compress(text.encode("utf-8")))
+        os.replace(temporary, path)
+        with self._lock:
+            self._remember(digest, text)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".txt.z"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError: # pragma: no cover (supprimé par un autre processus)
+                pass
+            total -= size
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_document_store(directory=DEFAULT_STORE_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+    with _stores_lock:
+        store = _stores.get(directory)
+        if store is None:
+            store = _stores[directory] = DocumentStore(directory, max_bytes)
+        store.max_bytes = max_bytes
+        return store
+
+
+# --- Extraction en arrière-plan ---
+_executor = ThreadPoolExecutor(max_workers=INGESTION_WORKERS, thread_name_prefix="document-ingestion")
+
+
+class IngestionJob:
+    """Extraction of one uploaded file on the worker pool, polled from a script thread."""
+
+    def __init__(self, filename, data, store):
+        self.name = filename
+        self.format = document_format(filename) or "inconnu"
+        self.size = len(data)
+        self.digest = file_digest(data)
+        self.progress = 0.0
+        self.error = None
+        self.cached = False
+        self.started = time.monotonic()
+        self._parts = []
+        self._cancelled = threading.Event()
+        self._future = None
+        cached_text = store.get(self.digest)
+        if cached_text is not None:
+            self._parts, self.progress, self.cached = [cached_text], 1.0, True
+            metrics.DOCUMENT_INGESTIONS.inc(format=self.format, outcome="cached")
+        else:
+            self._future = _executor.submit(self._run, data, store)
+
+    def _run(self, data, store):
+        started = time.perf_counter()
+        try:
+            for text, progress in iter_document_text(self.name, data):
+                if self._cancelled.is_set():
+                    metrics.DOCUMENT_INGESTIONS.inc(format=self.format, outcome="cancelled")
+                    return
+                self._parts.append(text)
+                self.progress = progress
+            store.put(self.digest, self.text)
+            metrics.DOCUMENT_INGESTIONS.inc(format=self.format, outcome="extracted")
+            metrics.DOCUMENT_INGESTION_DURATION.observe(time.perf_counter() - started, format=self.format)
+        except Exception as e: # Fichier corrompu ou format inattendu
+            self.error = str(e) or type(e).__name__
+            metrics.DOCUMENT_INGESTIONS.inc(format=self.format, outcome="error")
+
+    @property
+    def done(self):
+        return self._future is None or self._future.done()
+
+    @property
+    def text(self):
+        """Text extracted so far (complete once ``done``)."""
+        return "".join(self._parts)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def wait(self, timeout=None):
+        if self._future is not None:
+            self._future.result(timeout)
+        return self
+
+    @property
+    def reference(self):
+        """``DocumentRef`` of the extracted text, once extraction succeeded."""
+        if not self.done or self.error or self._cancelled.is_set():
+            return None
+        return DocumentRef(self.digest, self.name, len(self.text))
@@ -0,0 +1,219 @@
+"""Fixture-based evaluation of a use case: render, execute in parallel, check, compare template versions.
+
+A use case can carry test fixtures, saved with it in the library::
+
+    "fixtures": [{"name": "Contrat court",
+                  "values": {"document": "..."},
+                  "checks": [{"type": "regex", "pattern": "résiliation", "flags": "i"},
+                             {"type": "keywords", "required": ["préavis"], "forbidden": ["je ne peux pas"]},
+                             {"type": "json_schema", "schema": {"type": "object", "required": ["points"]}}]}]
+
+``evaluate_use_case`` renders every fixture with one or several templates (the
+saved one and the draft being edited), executes all the prompts as a single
+``LLMJob``: the client's bounded concurrency on the background loop is the
+worker pool, and its response cache makes re-evaluating an unchanged version
+free. Each output is checked and one ``EvaluationReport`` (pass rate, latency)
+is returned per template version, so a regression shows up before the draft
+is saved. The version is a hash of the expanded template and the variables.
+
+``jsonschema`` is optional: without it a subset of JSON Schema (type,
+required, properties, items, enum, lengths, pattern) is checked.
+"""
+import hashlib
+import json
+import re
+import time
+from collections import namedtuple
+
+from json_extraction import JSONObjectExtractor
+from library_core import format_values_for_template
+from llm_client import LLMJob
+from render_cache import render_use_case_prompt
+from template_fragments import expand_template
+
+try:
+    import jsonschema
+except ImportError: # Dépendance optionnelle
+    jsonschema = None
+
+FIXTURES_FIELD = "fixtures"
+CHECK_TYPES = ("regex", "keywords", "json_schema")
+DEFAULT_TIMEOUT_S = 600
+
+CheckResult = namedtuple("CheckResult", "type passed detail")
+FixtureResult = namedtuple("FixtureResult", "name prompt output status passed checks latency_s cached error")
+EvaluationReport = namedtuple("EvaluationReport", "version label results pass_rate latency_p50_s latency_p95_s cached evaluated_at")
+
+
+def template_version(template, variables=None, fragments=None):
+    """Short hash identifying what an evaluation ran: expanded template + variable definitions."""
+    canonical = json.dumps([expand_template(template or "", fragments or {}), variables or []],
+                           sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:10]
+
+
+# --- Vérifications ---
+_JSON_TYPES = {
+    "object": dict, "array": list, "string": str, "boolean": bool, "null": type(None),
+    "number": (int, float), "integer": int,
+}
+
+
+def _type_matches(instance, expected):
+    if isinstance(instance, bool) and expected in ("number", "integer"):
+        return False
+    if expected == "integer" and isinstance(instance, float):
+        return instance.is_integer()
+    python_type = _JSON_TYPES.get(expected)
+    return python_type is None or isinstance(instance, python_type)
+
+
+def _subset_errors(instance, schema, path="$"):
+    """Errors for the JSON Schema subset checked without ``jsonschema``."""
+    if not isinstance(schema, dict):
+        return []
+    expected = schema.get("type")
+    if expected is not None:
+        expected_types = expected if isinstance(expected, list) else [expected]
+        if not any(_type_matches(instance, item) for item in expected_types):
+            return [f"{path} : type attendu {expected}"]
+    errors = []
+    if "enum" in schema and instance not in schema["enum"]:
+        errors.append(f"{path} : valeur hors de {schema['enum']}")
+    if isinstance(instance, dict):
+        errors += [f"{path} : champ requis '{name}' absent" for name in schema.get("required", []) if name not in instance]
+        for name, sub_schema in (schema.get("properties") or {}).items():
+            if name in instance:
+                errors += _subset_errors(instance[name], sub_schema, f"{path}.{name}")
+    if isinstance(instance, list):
+        if "minItems" in schema and len(instance) < schema["minItems"]:
+            errors.append(f"{path} : au moins {schema['minItems']} éléments attendus")
+        if "maxItems" in schema and len(instance) > schema["maxItems"]:
+            errors.append(f"{path} : au plus {schema['maxItems']} éléments attendus")
+        if isinstance(schema.get("items"), dict):
+            for index, item in enumerate(instance):
+                errors += _subset_errors(item, schema["items"], f"{path}[{index}]")
+    if isinstance(instance, str):
+        if "minLength" in schema and len(instance) < schema["minLength"]:
+            errors.append(f"{path} : au moins {schema['minLength']} caractères attendus")
+        if "maxLength" in schema and len(instance) > schema["maxLength"]:
+            errors.append(f"{path} : au plus {schema['maxLength']} caractères attendus")
+        if "pattern" in schema and not re.search(schema["pattern"], instance):
+            errors.append(f"{path} : ne respecte pas le motif {schema['pattern']}")
+    return errors
+
+
+def validate_json_schema(instance, schema):
+    """List of validation errors (empty when valid)."""
+    if jsonschema is None:
+        return _subset_errors(instance, schema)
+    validator_class = jsonschema.validators.validator_for(schema)
+    try:
+        validator_class.check_schema(schema)
+    except jsonschema.exceptions.SchemaError as error:
+        return [f"schéma invalide : {error.message}"]
+    return [f"{'.'.join(['$'] + [str(part) for part in error.absolute_path])} : {error.message}"
+            for error in validator_class(schema).iter_errors(instance)]
+
+
+def parse_json_output(output):
+    """JSON value of an answer: the whole answer, else the object it contains (fenced or not)."""
+    try:
+        return json.loads(output.strip())
+    except ValueError:
+        pass
+    value = JSONObjectExtractor().finish(output)
+    if value is None:
+        raise ValueError("aucun JSON valide dans la réponse")
+    return value
+
+
+_REGEX_FLAGS = {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL}
+
+
+def run_check(output, check):
+    check_type = check.get("type")
+    if check_type == "regex":
+        flags = 0
+        for letter in check.get("flags", ""):
+            flags |= _REGEX_FLAGS.get(letter, 0)
+        try:
+            found = re.search(check.get("pattern", ""), output, flags) is not None
+        except re.error as error:
+            return CheckResult(check_type, False, f"expression invalide : {error}")
+        return CheckResult(check_type, found, "" if found else f"motif introuvable : {check.get('pattern', '')}")
+    if check_type == "keywords":
+        folded = output.casefold()
+        missing = [word for word in check.get("required", []) if word.casefold() not in folded]
+        present = [word for word in check.get("forbidden", []) if word.casefold() in folded]
+        details = ([f"absents : {', '.join(missing)}"] if missing else []) + ([f"interdits présents : {', '.join(present)}"] if present else [])
+        return CheckResult(check_type, not details, " ; ".join(details))
+    if check_type == "json_schema":
+        try:
+            value = parse_json_output(output)
+        except ValueError as error:
+            return CheckResult(check_type, False, str(error))
+        errors = validate_json_schema(value, check.get("schema") or {})
+        return CheckResult(check_type, not errors, " ; ".join(errors[:5]))
+    return CheckResult(str(check_type), False, f"type de vérification inconnu : {check_type}")
+
+
+def run_checks(output, checks):
+    return [run_check(output, check) for check in checks or []]
+
+
+# --- Exécution ---
+def fixture_values(fixture, variables):
+    """Template values of a fixture: its own values, variable defaults for the others."""
+    values = {var["name"]: var.get("default") for var in variables or [] if isinstance(var, dict) and var.get("name")}
+    values.update(fixture.get("values") or {})
+    return format_values_for_template(values)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def evaluate_use_case(client, title, config, templates, fragments=None, timeout=DEFAULT_TIMEOUT_S):
+    """Evaluate every fixture of ``config`` with each template of ``templates`` ({label: template}).
+
+    All prompts go out in one batch. Blocks until done (or ``timeout``); returns
+    one ``EvaluationReport`` per label, in order.
+    """
+    fixtures = config.get(FIXTURES_FIELD) or []
+    variables = config.get("variables", [])
+    plan = []  # (label, fixture, prompt)
+    for label, template in templates.items():
+        expanded = expand_template(template or "", fragments or {})
+        for fixture in fixtures:
+            plan.append((label, fixture, render_use_case_prompt(title, expanded, fixture_values(fixture, variables))))
+    job = LLMJob(client, [prompt for _, _, prompt in plan], stream=False)
+    results = job.wait(timeout)
+    if not job.done: # pragma: no cover
+        job.cancel()
+        results = job.wait(5)
+
+    fixture_results = {label: [] for label in templates}
+    for (label, fixture, prompt), result in zip(plan, results):
+        ok = result is not None and result.status == "ok"
+        output = result.text if result is not None else ""
+        checks = run_checks(output, fixture.get("checks")) if ok else []
+        fixture_results[label].append(FixtureResult(
+            fixture.get("name", ""), prompt, output, result.status if result is not None else "cancelled",
+            ok and all(check.passed for check in checks), checks,
+            result.latency_s if result is not None else 0.0, bool(result is not None and result.cached),
+            result.error if result is not None else None,
+        ))
+    reports = []
+    evaluated_at = time.time() # Commun aux rapports d'une même évaluation
+    for label, template in templates.items():
+        label_results = fixture_results[label]
+        latencies = [item.latency_s for item in label_results if item.status == "ok" and not item.cached]
+        reports.append(EvaluationReport(
+            template_version(template, variables, fragments), label, label_results,
+            sum(item.passed for item in label_results) / len(label_results) if label_results else 0.0,
+            _percentile(latencies, 0.5), _percentile(latencies, 0.95),
+            sum(item.cached for item in label_results), evaluated_at,
+        ))
+    return reports
@@ -0,0 +1,293 @@
+"""Gist persistence helpers shared by the Streamlit apps.
+
+No Streamlit import here: the functions raise ``requests`` exceptions and the
+apps turn them into ``st.error``/``st.info`` messages. This also lets the
+background reconciliation thread talk to GitHub without a script context.
+"""
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from perf_spans import span
+from storage_codec import DEFAULT_ENCODING, encode_payload, decode_payload
+
+# Surchargeable (variable d'environnement ou set_api_base_url) pour viser benchmarks/fake_gist_server.py
+GIST_API_URL = os.environ.get("GIST_API_URL", "https://api.github.com").rstrip("/")
+GIST_REQUEST_TIMEOUT = 20  # secondes
+RAW_STREAM_CHUNK_SIZE = 64 * 1024
+RAW_FETCH_WORKERS = 4
+
+MANIFEST_FILENAME = "prompt_library_manifest.json"
+SHARD_FILENAME_PREFIX = "prompt_family_"
+SHARDED_LAYOUT_VERSION = 1
+
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_DIR = ".cache"
+
+
+def set_api_base_url(base_url):
+    """Point the client at another Gist API base URL; a falsy value keeps the current one."""
+    global GIST_API_URL
+    if base_url:
+        GIST_API_URL = base_url.rstrip("/")
+    return GIST_API_URL
+
+
+def is_rate_limited(response):
+    """True for GitHub's rate-limit answer (403/429 with no remaining quota), as opposed to an auth error."""
+    return response is not None and response.status_code in (403, 429) and response.headers.get("X-RateLimit-Remaining") == "0"
+
+
+def _gist_headers(github_pat):
+    return {"Authorization": f"token {github_pat}", "Accept": "application/vnd.github.v3+json"}
+
+
+def fetch_gist(gist_id, github_pat):
+    """GET the gist metadata and (possibly truncated) file contents."""
+    with span("gist.get"):
+        response = requests.get(f"{GIST_API_URL}/gists/{gist_id}", headers=_gist_headers(github_pat), timeout=GIST_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+
+def _read_gist_file_entry(file_entry, github_pat):
+    """Return the full content of a gist file entry.
+
+    The API truncates contents above ~1 MB (``truncated: true``); those are
+    streamed from ``raw_url`` instead of being silently cut.
+    """
+    if not file_entry.get("truncated") and file_entry.get("content") is not None:
+        return file_entry["content"]
+    with span("gist.get_raw"), requests.get(file_entry["raw_url"], headers={"Authorization": f"token {github_pat}"}, stream=True, timeout=GIST_REQUEST_TIMEOUT) as response:
+        response.raise_for_status()
+        chunks = [chunk for chunk in response.iter_content(chunk_size=RAW_STREAM_CHUNK_SIZE) if chunk]
+    return b"".join(chunks).decode("utf-8")
+
+
+def fetch_gist_file(gist_id, github_pat, filename):
+    """Return the content of ``filename`` in the gist, or None if the file does not exist.
+
+    Raises ``requests`` exceptions (HTTPError carries the response), KeyError on
+    an unexpected payload and ValueError if the body is not JSON.
+    """
+    gist_data = fetch_gist(gist_id, github_pat)
+    if filename not in gist_data["files"]:
+        return None
+    return _read_gist_file_entry(gist_data["files"][filename], github_pat)
+
+
+def patch_gist_files(gist_id, github_pat, files_content):
+    """PATCH the given ``{filename: content}`` mapping into the gist (None deletes the file)."""
+    data = {"files": {name: ({"content": content} if content is not None else None) for name, content in files_content.items()}}
+    with span("gist.patch"):
+        response = requests.patch(f"{GIST_API_URL}/gists/{gist_id}", headers=_gist_headers(github_pat), json=data, timeout=GIST_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response
+
+
+# --- Layout shardé : un fichier Gist par famille + un manifeste ---
+LibraryPayload = namedtuple("LibraryPayload", ["content", "manifest", "missing_shards"])
+
+
+def shard_filename(family_name):
+    """Stable, Gist-safe file name for a family shard."""
+    ascii_name = unicodedata.normalize("NFKD", family_name).encode("ascii", "ignore").decode("ascii")
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", ascii_name).strip("_")[:40] or "famille"
+    name_hash = hashlib.sha1(family_name.encode("utf-8")).hexdigest()[:8]
+    return f"{SHARD_FILENAME_PREFIX}{slug}_{name_hash}.json"
+
+
+def dump_library(library_data):
+    """Canonical JSON text of a whole library (used for snapshots and checksums)."""
+    return json.dumps(library_data, indent=4, ensure_ascii=False)
+
+
+def build_sharded_files(library_data, encoding=DEFAULT_ENCODING, fragments=None):
+    """Return ``(manifest, {filename: content})`` for a preprocessed library dict.
+
+    Shared template fragments (``template_fragments``) are small and
+    library-wide: they are stored in the manifest itself.
+    """
+    manifest = {"layout_version": SHARDED_LAYOUT_VERSION, "encoding": encoding, "families": {}}
+    if fragments:
+        manifest["fragments"] = dict(sorted(fragments.items()))
+    files = {}
+    for family_name, use_cases in library_data.items():
+        filename = shard_filename(family_name)
+        shard_content = encode_payload(use_cases, encoding)
+        files[filename] = shard_content
+        manifest["families"][family_name] = {"file": filename, "sha256": content_checksum(shard_content), "use_cases": len(use_cases)}
+    return manifest, files
+
+
+def fetch_library(gist_id, github_pat, legacy_filename):
+    """Load the library from the gist, sharded layout first, legacy single file otherwise.
+
+    Returns a ``LibraryPayload`` whose ``content`` is the library JSON text
+    (None when the gist holds neither layout), the manifest (None for the
+    legacy layout) and the families whose shard file is missing.
+    """
+    gist_files = fetch_gist(gist_id, github_pat)["files"]
+    if MANIFEST_FILENAME not in gist_files:
+        if legacy_filename not in gist_files:
+            return LibraryPayload(None, None, [])
+        return LibraryPayload(_read_gist_file_entry(gist_files[legacy_filename], github_pat), None, [])
+
+    manifest = json.loads(_read_gist_file_entry(gist_files[MANIFEST_FILENAME], github_pat))
+    families_meta = manifest.get("families", {})
+    missing_shards = [name for name, meta in families_meta.items() if meta.get("file") not in gist_files]
+    available = [(name, meta["file"]) for name, meta in families_meta.items() if name not in missing_shards]
+    # Les shards tronqués sont récupérés en parallèle via raw_url
+    with ThreadPoolExecutor(max_workers=RAW_FETCH_WORKERS) as pool:
+        contents = list(pool.map(lambda item: _read_gist_file_entry(gist_files[item[1]], github_pat), available))
+    library_data = {name: decode_payload(content) for (name, _), content in zip(available, contents)}
+    for name in missing_shards:
+        families_meta.pop(name, None)
+    return LibraryPayload(dump_library(library_data), manifest, missing_shards)
+
+
+def push_library(gist_id, github_pat, library_data, previous_manifest=None, encoding=DEFAULT_ENCODING, fragments=None):
+    """Save the library in the sharded layout, PATCHing only the shards that changed.
+
+    ``previous_manifest`` is the manifest the caller loaded or last saved;
+    without it every shard is written. Shards of removed/renamed families are
+    deleted. ``fragments`` replaces the shared fragments; None keeps those of
+    ``previous_manifest``. Returns ``(manifest, patched_filenames)``.
+    """
+    if fragments is None:
+        fragments = (previous_manifest or {}).get("fragments")
+    manifest, files = build_sharded_files(library_data, encoding, fragments)
+    previous_families = (previous_manifest or {}).get("families", {})
+    previous_by_file = {meta.get("file"): meta.get("sha256") for meta in previous_families.values()}
+    changes = {
+        filename: content for filename, content in files.items()
+        if previous_manifest is None or previous_by_file.get(filename) != content_checksum(content)
+    }
+    for filename in previous_by_file:
+        if filename and filename not in files:
+            changes[filename] = None
+    if (previous_manifest is None or previous_manifest.get("families") != manifest["families"] or previous_manifest.get("encoding") != encoding
+            or previous_manifest.get("fragments") != manifest.get("fragments")):
+        changes[MANIFEST_FILENAME] = json.dumps(manifest, indent=2, ensure_ascii=False)
+    if changes:
+        patch_gist_files(gist_id, github_pat, changes)
+    return manifest, sorted(changes)
+
+
+# --- Snapshot disque de la dernière bibliothèque valide ---
+def content_checksum(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def snapshot_path(gist_id, filename, snapshot_dir=SNAPSHOT_DIR):
+    key = hashlib.sha256(f"{gist_id}:{filename}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(snapshot_dir, f"library_snapshot_{key}.json")
+
+
+def write_snapshot(path, content, manifest=None):
+    """Atomically store ``content`` (raw library JSON) with version and checksum.
+
+    ``manifest`` is the sharded-layout manifest matching ``content`` (None for
+    the legacy single-file layout); it lets a session started from the
+    snapshot PATCH only the shards it changes.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    envelope = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "saved_at": datetime.now().isoformat(),
+        "sha256": content_checksum(content),
+        "content": content,
+        "manifest": manifest,
+    }
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(envelope, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return envelope
+
+
+def read_snapshot(path):
+    """Return the snapshot envelope, or None if absent, from another version or corrupted."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            envelope = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(envelope, dict) or envelope.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        return None
+    content = envelope.get("content")
+    if not isinstance(content, str) or content_checksum(content) != envelope.get("sha256"):
+        return None
+    return envelope
+
+
+class LibraryReconciler:
+    """Refreshes the snapshot from the gist in a background thread.
+
+    One instance per process (held by ``st.cache_resource``). Sessions started
+    from the snapshot call ``request_refresh`` and later ``latest`` to pick up
+    a remote version whose checksum differs from the one they loaded.
+    """
+
+    def __init__(self, min_interval=30.0):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_started = 0.0
+        self._latest = None  # (checksum, content, manifest)
+        self.last_error = None
+
+    def request_refresh(self, gist_id, github_pat, filename, snapshot_file):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            if time.monotonic() - self._last_started < self.min_interval:
+                return False
+            self._last_started = time.monotonic()
+            self._thread = threading.Thread(
+                target=self._refresh, args=(gist_id, github_pat, filename, snapshot_file),
+                name="gist-reconciler", daemon=True,
+            )
+            self._thread.start()
+            return True
+
+    def _refresh(self, gist_id, github_pat, filename, snapshot_file):
+        try:
+            payload = fetch_library(gist_id, github_pat, filename)
+            content = payload.content
+            if content is None or payload.missing_shards:
+                return
+            loaded = json.loads(content)
+            if not loaded or not isinstance(loaded, dict):
+                return  # Ne jamais remplacer un snapshot valide par un contenu vide
+            checksum = content_checksum(content)
+            current = read_snapshot(snapshot_file)
+            if current is None or current["sha256"] != checksum:
+                write_snapshot(snapshot_file, content, payload.manifest)
+            with self._lock:
+                self._latest = (checksum, content, payload.manifest)
+                self.last_error = None
+        except Exception as e:  # Réseau, JSON, disque : on garde le snapshot existant
+            with self._lock:
+                self.last_error = str(e)
+
+    def record_local_save(self, content, manifest=None):
+        """Remember content just pushed by this process so it is not seen as a remote change."""
+        with self._lock:
+            self._latest = (content_checksum(content), content, manifest)
+
+    def latest(self):
+        with self._lock:
+            return copy.copy(self._latest)
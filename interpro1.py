@@ -2,11 +2,67 @@ import streamlit as st
 from datetime import datetime, date
 import copy
 import json
+import time
 import requests
+import perf_spans
+import metrics
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from storage_codec import resolve_encoding
+from change_tracking import DirtyTracker
+from library_ids import LibraryIndex, assign_new_use_case_id
+from render_cache import RENDER_CACHE
+from template_lint import lint_use_case
+from template_fragments import expand_template, factor_fragment, find_includes
+from session_memory import SESSION_MEMORY, EVICTED_FLAG_KEY
+from llm_client import DEFAULT_MAX_CONCURRENCY, DEFAULT_MODEL, DEFAULT_REQUESTS_PER_MINUTE, LLMJob, get_client
+from response_cache import DEFAULT_CACHE_PATH, get_response_cache
+from json_extraction import JSONObjectExtractor
+from library_search import LibrarySearchIndex
+from similar_prompts import DUPLICATE_SIMILARITY, SimilarPromptsIndex
+from prompt_minifier import minify_template
+from token_counting import BPETokenizer, estimate_cost, get_token_counter, model_prices
+from chunking import DEFAULT_CONTEXT_TOKENS, DEFAULT_OUTPUT_RESERVE_TOKENS, MapReduceJob, fits_context, largest_variable, plan_map_reduce
+from document_ingestion import DEFAULT_STORE_DIRECTORY, SUPPORTED_EXTENSIONS, IngestionJob, document_reference, format_count, get_document_store, resolve_document_references
+from evaluation import FIXTURES_FIELD, evaluate_use_case
+from library_core import format_values_for_template, parse_default_value, _preprocess_for_saving, _postprocess_after_loading, collect_all_tags, filter_use_cases
+from gist_store import fetch_library, push_library, dump_library, content_checksum, snapshot_path, read_snapshot, write_snapshot, LibraryReconciler, set_api_base_url, is_rate_limited
 
 # --- PAGE CONFIGURATION (MUST BE THE FIRST STREAMLIT COMMAND) ---
 st.set_page_config(layout="wide", page_title="🛠️ Le laboratoire des Prompts IA", initial_sidebar_state="collapsed" )
 
+# --- Instrumentation optionnelle : spans des reruns (secret PERF_PROFILING, cf. perf_spans.py) et métriques (secret METRICS_PORT, cf. metrics.py) ---
+perf_spans.enable(st.secrets.get("PERF_PROFILING", False))
+if st.secrets.get("METRICS_PORT"):
+    metrics.start_metrics_server(st.secrets.get("METRICS_PORT"))
+# --- Mémoire par session : plafond (secret SESSION_MEMORY_CAP_MB) et éviction des sessions inactives (secret SESSION_IDLE_TTL_MINUTES), cf. session_memory.py ---
+SESSION_MEMORY.configure(float(st.secrets.get("SESSION_MEMORY_CAP_MB", 0)) * 1024 * 1024, float(st.secrets.get("SESSION_IDLE_TTL_MINUTES", 0)) * 60)
+# --- Exécution des prompts sur un endpoint compatible OpenAI (secret LLM_API_BASE_URL, cf. llm_client.py) ; sans ce secret, pas d'exécution ---
+# Réponses mises en cache sur disque (cf. response_cache.py) : secrets LLM_CACHE_MAX_MB (0 = désactivé) et LLM_CACHE_TTL_HOURS
+LLM_CLIENT = None
+LLM_RESPONSE_CACHE = None
+if st.secrets.get("LLM_API_BASE_URL"):
+    try:
+        if float(st.secrets.get("LLM_CACHE_MAX_MB", 200)) > 0:
+            LLM_RESPONSE_CACHE = get_response_cache(DEFAULT_CACHE_PATH, float(st.secrets.get("LLM_CACHE_MAX_MB", 200)) * 1024 * 1024, float(st.secrets.get("LLM_CACHE_TTL_HOURS", 168)) * 3600)
+        LLM_CLIENT = get_client(
+            st.secrets["LLM_API_BASE_URL"], st.secrets.get("LLM_API_KEY"), st.secrets.get("LLM_MODEL", DEFAULT_MODEL),
+            int(st.secrets.get("LLM_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)), float(st.secrets.get("LLM_REQUESTS_PER_MINUTE", DEFAULT_REQUESTS_PER_MINUTE)),
+            response_cache=LLM_RESPONSE_CACHE,
+        )
+    except ValueError as e: # pragma: no cover
+        st.error(f"Configuration LLM invalide : {e}")
+# Fenêtre de contexte du modèle et place réservée à sa réponse (secrets LLM_CONTEXT_TOKENS, LLM_OUTPUT_RESERVE_TOKENS), cf. chunking.py
+LLM_CONTEXT_TOKENS = int(st.secrets.get("LLM_CONTEXT_TOKENS", DEFAULT_CONTEXT_TOKENS))
+LLM_OUTPUT_RESERVE_TOKENS = int(st.secrets.get("LLM_OUTPUT_RESERVE_TOKENS", DEFAULT_OUTPUT_RESERVE_TOKENS))
+# Comptage des tokens hors ligne pour le modèle configuré (vocabulaires BPE dans tokenizer_vocabs/, sinon estimation) et prix
+# indicatifs, remplaçables par les secrets LLM_PRICE_INPUT_PER_MTOK et LLM_PRICE_OUTPUT_PER_MTOK (USD par million de tokens), cf. token_counting.py
+TOKEN_COUNTER = get_token_counter(st.secrets.get("LLM_MODEL", DEFAULT_MODEL))
+LLM_PRICES = model_prices(st.secrets.get("LLM_MODEL", DEFAULT_MODEL), st.secrets.get("LLM_PRICE_INPUT_PER_MTOK"), st.secrets.get("LLM_PRICE_OUTPUT_PER_MTOK"))
+# --- Documents déposés (PDF, EML, DOCX, TXT) : textes extraits mis en cache par empreinte (secret DOCUMENT_CACHE_MAX_MB), cf. document_ingestion.py ---
+DOCUMENT_STORE = get_document_store(DEFAULT_STORE_DIRECTORY, float(st.secrets.get("DOCUMENT_CACHE_MAX_MB", 500)) * 1024 * 1024)
+perf_spans.start_rerun()
+perf_spans.begin("css")
+
 # --- CUSTOM CSS FOR SIDEBAR TOGGLE TEXT ---
 st.markdown("""
     <style>
@@ -110,10 +166,13 @@ st.markdown("""
         
     <style>
 """, unsafe_allow_html=True)
+perf_spans.end("css")
 
 # --- Initial Data Structure & Constants ---
 CURRENT_YEAR = datetime.now().year
 GIST_DATA_FILENAME = "prompt_templates_data_v3.json"
+LIBRARY_SNAPSHOT_DIR = ".cache" # Snapshot local de la bibliothèque (cf. gist_store.py)
+DEFAULT_STORAGE_ENCODING = "json-compact" # Surchargeable via le secret STORAGE_ENCODING (json, json-compact, gzip-json, msgpack)
 
 # --- Function to load prompt templates from files ---
 def load_prompt_template(filename):
@@ -153,133 +212,8 @@ for family, use_cases in INITIAL_PROMPT_TEMPLATES.items(): # Initial cleanup
             if "is_favorite" in uc_config: # pragma: no cover
                 del uc_config["is_favorite"]
 
-# --- Utility Functions (User's original versions, with height fix in _postprocess_after_loading) ---
-def parse_default_value(value_str, var_type):
-    if not value_str:
-        if var_type == "number_input": return 0.0
-        if var_type == "date_input": return datetime.now().date()
-        return ""
-    if var_type == "number_input":
-        try: return float(value_str)
-        except ValueError: return 0.0
-    elif var_type == "date_input":
-        try: return datetime.strptime(value_str, "%Y-%m-%d").date()
-        except (ValueError, TypeError):
-            return value_str if isinstance(value_str, date) else datetime.now().date()
-    return value_str
-
-def _preprocess_for_saving(data_to_save):
-    processed_data = copy.deepcopy(data_to_save)
-    for family_name in list(processed_data.keys()):
-        use_cases_in_family = processed_data[family_name]
-        if not isinstance(use_cases_in_family, dict): # pragma: no cover
-            st.error(f"Données corrompues (famille non-dict): '{family_name}'. Suppression.")
-            del processed_data[family_name]
-            continue
-        for use_case_name in list(use_cases_in_family.keys()):
-            config = use_cases_in_family[use_case_name]
-            if not isinstance(config, dict): # pragma: no cover
-                st.error(f"Données corrompues (cas d'usage non-dict): '{use_case_name}' dans '{family_name}'. Suppression.")
-                del processed_data[family_name][use_case_name]
-                continue
-            if not isinstance(config.get("variables"), list):
-                config["variables"] = []
-            for var_info in config.get("variables", []):
-                if isinstance(var_info, dict):
-                    if var_info.get("type") == "date_input" and isinstance(var_info.get("default"), date):
-                        var_info["default"] = var_info["default"].strftime("%Y-%m-%d")
-                    if var_info.get("type") == "number_input":
-                        if "default" in var_info and var_info["default"] is not None:
-                            var_info["default"] = float(var_info["default"])
-                        if "min_value" in var_info and var_info["min_value"] is not None:
-                            var_info["min_value"] = float(var_info["min_value"])
-                        if "max_value" in var_info and var_info["max_value"] is not None:
-                            var_info["max_value"] = float(var_info["max_value"])
-                        if "step" in var_info and var_info["step"] is not None:
-                            var_info["step"] = float(var_info["step"])
-                        else: 
-                            var_info["step"] = 1.0
-                    # Ensure height for text_area is an int if it exists (it should be already from other functions)
-                    if var_info.get("type") == "text_area":
-                        if "height" in var_info and var_info["height"] is not None:
-                            try:
-                                var_info["height"] = int(var_info["height"])
-                            except (ValueError, TypeError): # pragma: no cover
-                                var_info["height"] = 100 # Should not happen if data is clean
-
-            config.setdefault("tags", [])
-            if "is_favorite" in config: # pragma: no cover
-                del config["is_favorite"]
-            config.setdefault("usage_count", 0)
-            config.setdefault("created_at", datetime.now().isoformat())
-            config.setdefault("updated_at", datetime.now().isoformat())
-    return processed_data
-
-def _postprocess_after_loading(loaded_data): # User's trusted version + height fix
-    processed_data = copy.deepcopy(loaded_data)
-    now_iso = datetime.now().isoformat()
-    for family_name in list(processed_data.keys()):
-        use_cases_in_family = processed_data[family_name]
-        if not isinstance(use_cases_in_family, dict): # pragma: no cover
-            st.warning(f"Données corrompues (famille non-dict): '{family_name}'. Ignorée.")
-            del processed_data[family_name]
-            continue
-        for use_case_name in list(use_cases_in_family.keys()):
-            config = use_cases_in_family[use_case_name]
-            if not isinstance(config, dict): # pragma: no cover
-                st.warning(f"Données corrompues (cas d'usage non-dict): '{use_case_name}' dans '{family_name}'. Ignoré.")
-                del processed_data[family_name][use_case_name]
-                continue
-            if not isinstance(config.get("variables"), list):
-                config["variables"] = []
-            for var_info in config.get("variables", []):
-                if isinstance(var_info, dict):
-                    if var_info.get("type") == "date_input" and isinstance(var_info.get("default"), str):
-                        try:
-                            var_info["default"] = datetime.strptime(var_info["default"], "%Y-%m-%d").date()
-                        except ValueError:
-                            var_info["default"] = datetime.now().date()
-                    if var_info.get("type") == "number_input":
-                        if "default" in var_info and var_info["default"] is not None:
-                            var_info["default"] = float(var_info["default"])
-                        else: 
-                            var_info["default"] = 0.0
-                        if "min_value" in var_info and var_info["min_value"] is not None:
-                            var_info["min_value"] = float(var_info["min_value"])
-                        if "max_value" in var_info and var_info["max_value"] is not None:
-                            var_info["max_value"] = float(var_info["max_value"])
-                        if "step" in var_info and var_info["step"] is not None:
-                            var_info["step"] = float(var_info["step"])
-                        else: 
-                            var_info["step"] = 1.0
-
-                    # --- ADDED ROBUST HEIGHT VALIDATION ---
-                    if var_info.get("type") == "text_area":
-                        height_val = var_info.get("height")
-                        if height_val is not None:
-                            try:
-                                h = int(height_val)
-                                if h >= 68:
-                                    var_info["height"] = h
-                                else:
-                                    var_info["height"] = 68 # Set to minimum if too small
-                                    # st.warning(f"Hauteur pour '{var_info.get('name', 'N/A')}' ajustée à 68px (minimum).")
-                            except (ValueError, TypeError):
-                                var_info["height"] = 100 # Default if invalid
-                        # If height_val was None, 'height' key might not be in var_info, or it's None.
-                        # The st.text_area widget call will handle None by using its internal default.
-                        # Or we can explicitly set a default:
-                        # else:
-                        #     var_info["height"] = 100 # Default if not present
-
-            config.setdefault("tags", [])
-            if "is_favorite" in config: # pragma: no cover
-                del config["is_favorite"]
-            config.setdefault("usage_count", 0)
-            config.setdefault("created_at", now_iso)
-            config.setdefault("updated_at", now_iso)
-            if not isinstance(config.get("tags"), list): config["tags"] = []
-    return processed_data
+# --- Utility Functions ---
+# parse_default_value, _preprocess_for_saving et _postprocess_after_loading sont dans library_core.py
 
 # --- NEW: Simplified function to prepare newly injected use case config ---
 def _prepare_newly_injected_use_case_config(uc_config_from_json):
@@ -289,6 +223,7 @@ def _prepare_newly_injected_use_case_config(uc_config_from_json):
     prepared_config["created_at"] = now_iso_created
     prepared_config["updated_at"] = now_iso_updated
     prepared_config["usage_count"] = 0 
+    assign_new_use_case_id(prepared_config) # Toujours un ID neuf, même si le JSON en contient un
 
     if "template" not in prepared_config or not isinstance(prepared_config["template"], str): # pragma: no cover
         prepared_config["template"] = "" 
@@ -325,65 +260,187 @@ def _prepare_newly_injected_use_case_config(uc_config_from_json):
     return prepared_config
 
 # --- Gist Interaction Functions (User's original versions) ---
+set_api_base_url(st.secrets.get("GIST_API_URL")) # API Gist alternative (ex. benchmarks/fake_gist_server.py), sinon api.github.com
+
 def get_gist_content(gist_id, github_pat):
-    headers = {"Authorization": f"token {github_pat}", "Accept": "application/vnd.github.v3+json"}
+    """Return the library payload (content + manifest of the sharded layout), None on error."""
+    started = time.perf_counter()
     try:
-        response = requests.get(f"https://api.github.com/gists/{gist_id}", headers=headers)
-        response.raise_for_status()
-        gist_data = response.json()
-        if GIST_DATA_FILENAME in gist_data["files"]:
-            return gist_data["files"][GIST_DATA_FILENAME]["content"]
+        with perf_spans.span("gist.fetch_library"):
+            payload = fetch_library(gist_id, github_pat, GIST_DATA_FILENAME)
+        metrics.observe_gist_call("get", time.perf_counter() - started)
+        if payload.missing_shards: # pragma: no cover
+            st.warning(f"Fichiers Gist manquants pour les métiers : {', '.join(payload.missing_shards)}. Ils sont ignorés.")
+        if payload.content is not None:
+            return payload
         else:
             st.info(f"Fichier '{GIST_DATA_FILENAME}' non trouvé dans Gist. Initialisation.")
-            return "{}" 
+            return payload._replace(content="{}")
     except requests.exceptions.HTTPError as http_err: # pragma: no cover
-        if response.status_code == 404: st.error(f"Erreur Gist (get): Gist avec ID '{gist_id}' non trouvé (404). Vérifiez l'ID.")
-        elif response.status_code in [401, 403]: st.error(f"Erreur Gist (get): Problème d'authentification (PAT GitHub invalide ou permissions insuffisantes).")
+        status_code = http_err.response.status_code if http_err.response is not None else None
+        metrics.observe_gist_call("get", time.perf_counter() - started, status_code, ok=False)
+        if is_rate_limited(http_err.response): st.error("Erreur Gist (get): Limite de requêtes GitHub atteinte (403). Réessayez dans quelques minutes.")
+        elif status_code == 404: st.error(f"Erreur Gist (get): Gist avec ID '{gist_id}' non trouvé (404). Vérifiez l'ID.")
+        elif status_code in [401, 403]: st.error(f"Erreur Gist (get): Problème d'authentification (PAT GitHub invalide ou permissions insuffisantes).")
         else: st.error(f"Erreur HTTP Gist (get): {http_err}")
-        return None 
+        return None
     except requests.exceptions.RequestException as e: # pragma: no cover
+        metrics.observe_gist_call("get", time.perf_counter() - started, ok=False)
         st.error(f"Erreur de connexion Gist (get): {e}")
         return None
     except KeyError: # pragma: no cover
+        metrics.observe_gist_call("get", time.perf_counter() - started, ok=False)
         st.error(f"Erreur Gist (get): Fichier '{GIST_DATA_FILENAME}' non trouvé ou structure Gist inattendue.")
         return None
     except json.JSONDecodeError: # pragma: no cover
-         st.error(f"Erreur Gist (get): Réponse de l'API Gist n'est pas un JSON valide.") 
-         return None 
-
-def update_gist_content(gist_id, github_pat, new_content_json_string):
-    headers = {"Authorization": f"token {github_pat}", "Accept": "application/vnd.github.v3+json"}
-    data = {"files": {GIST_DATA_FILENAME: {"content": new_content_json_string}}}
+         metrics.observe_gist_call("get", time.perf_counter() - started, ok=False)
+         st.error(f"Erreur Gist (get): Réponse de l'API Gist n'est pas un JSON valide.")
+         return None
+
+def update_gist_content(gist_id, github_pat, library_data, previous_manifest=None, fragments=None):
+    """Push the library (one Gist file per family, only changed ones). Returns the new manifest, None on error."""
+    started = time.perf_counter()
+    metrics.GIST_SAVES_IN_FLIGHT.inc()
     try:
-        response = requests.patch(f"https://api.github.com/gists/{gist_id}", headers=headers, json=data)
-        response.raise_for_status()
-        return True
+        storage_encoding = resolve_encoding(st.secrets.get("STORAGE_ENCODING", DEFAULT_STORAGE_ENCODING))
+        with perf_spans.span("gist.push_library"):
+            new_manifest, _patched_files = push_library(gist_id, github_pat, library_data, previous_manifest, storage_encoding, fragments)
+        metrics.observe_gist_call("patch", time.perf_counter() - started)
+        return new_manifest
     except requests.exceptions.HTTPError as http_err: # pragma: no cover
-        if response.status_code == 404: st.error(f"Erreur Gist (update): Gist avec ID '{gist_id}' non trouvé (404). Impossible de sauvegarder.")
-        elif response.status_code in [401, 403]: st.error(f"Erreur Gist (update): Problème d'authentification (PAT GitHub invalide ou permissions insuffisantes pour écrire).")
-        elif response.status_code == 422: st.error(f"Erreur Gist (update): Les données n'ont pas pu être traitées par GitHub (422). Vérifiez le format du JSON. Détails: {response.text}")
+        response = http_err.response
+        status_code = response.status_code if response is not None else None
+        metrics.observe_gist_call("patch", time.perf_counter() - started, status_code, ok=False)
+        if is_rate_limited(response): st.error("Erreur Gist (update): Limite de requêtes GitHub atteinte (403). Sauvegarde non effectuée, réessayez dans quelques minutes.")
+        elif status_code == 404: st.error(f"Erreur Gist (update): Gist avec ID '{gist_id}' non trouvé (404). Impossible de sauvegarder.")
+        elif status_code in [401, 403]: st.error(f"Erreur Gist (update): Problème d'authentification (PAT GitHub invalide ou permissions insuffisantes pour écrire).")
+        elif status_code == 422: st.error(f"Erreur Gist (update): Les données n'ont pas pu être traitées par GitHub (422). Vérifiez le format du JSON. Détails: {response.text}")
         else: st.error(f"Erreur HTTP Gist (update): {http_err}")
-        return False
+        return None
     except requests.exceptions.RequestException as e: # pragma: no cover
+        metrics.observe_gist_call("patch", time.perf_counter() - started, ok=False)
         st.error(f"Erreur de connexion Gist (update): {e}")
-        return False
+        return None
+    finally:
+        metrics.GIST_SAVES_IN_FLIGHT.dec()
+
+# --- Snapshot local de la dernière bibliothèque valide (démarrage instantané, mode hors-ligne) ---
+@st.cache_resource(show_spinner=False)
+def get_library_reconciler():
+    return LibraryReconciler()
+
+def _library_snapshot_file(gist_id):
+    return snapshot_path(gist_id, GIST_DATA_FILENAME, LIBRARY_SNAPSHOT_DIR)
+
+def _current_session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "bare"
+
+def account_session_memory():
+    """Measure this session, apply the memory cap and evict idle sessions (cf. session_memory.py)."""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    # Sans Gist, la bibliothèque n'existe que dans la session : elle n'est jamais évincée
+    library_evictable = bool(st.secrets.get("GIST_ID") and st.secrets.get("GITHUB_PAT"))
+    with perf_spans.span("session_memory"):
+        SESSION_MEMORY.account(ctx.session_id, ctx.session_state, st.session_state.view_mode, library_evictable)
+
+def _store_library_snapshot(gist_id, json_string, manifest):
+    """Write the snapshot and remember which library version (and shards) this session holds."""
+    st.session_state.library_content_checksum = content_checksum(json_string)
+    metrics.SESSIONS.touch(_current_session_id(), library_bytes=len(json_string))
+    st.session_state.library_manifest = manifest
+    try:
+        write_snapshot(_library_snapshot_file(gist_id), json_string, manifest)
+    except OSError as e: # pragma: no cover - disque en lecture seule, quota...
+        st.sidebar.warning(f"Snapshot local non écrit : {e}")
+
+def apply_remote_library_update():
+    """Swap in the library fetched by the background reconciler if it differs from ours.
+
+    With unsaved local changes the remote version stays pending: the user either
+    saves (the local version then replaces the remote one) or loads it explicitly.
+    """
+    latest = get_library_reconciler().latest()
+    if not latest or not st.session_state.get('library_content_checksum'):
+        return
+    latest_checksum, latest_content, latest_manifest = latest
+    if latest_checksum == st.session_state.library_content_checksum:
+        return
+    try:
+        loaded_data = json.loads(latest_content)
+    except json.JSONDecodeError: # pragma: no cover
+        return
+    if not loaded_data or not isinstance(loaded_data, dict):
+        return
+    tracker = st.session_state.get('library_dirty_tracker')
+    if tracker is not None and tracker.has_changes(st.session_state.editable_prompts) and not st.session_state.pop('library_remote_update_accepted', False):
+        st.sidebar.warning("🔄 Une version plus récente de la bibliothèque est disponible sur Gist, mais vous avez des modifications non sauvegardées. "
+                           "Sauvegardez pour conserver les vôtres (elles remplaceront la version distante), ou chargez la version distante.")
+        if st.sidebar.button("Charger la version distante (modifications locales perdues)", key="accept_remote_library_update"):
+            st.session_state.library_remote_update_accepted = True
+            st.rerun()
+        return
+    st.session_state.editable_prompts = _postprocess_after_loading(loaded_data)
+    st.session_state.library_content_checksum = latest_checksum
+    st.session_state.library_manifest = latest_manifest
+    st.session_state.library_dirty_tracker = DirtyTracker(st.session_state.editable_prompts)
+    st.toast("Bibliothèque mise à jour depuis Gist.", icon="🔄")
+
+def save_editable_prompts_to_gist(fragments=None):
+    """Save the library; ``fragments`` (not None) also replaces the shared template fragments.
 
-def save_editable_prompts_to_gist():
-    GIST_ID = st.secrets.get("GIST_ID") 
-    GITHUB_PAT = st.secrets.get("GITHUB_PAT") 
+    Returns False when the Gist save failed (the session keeps its changes).
+    """
+    GIST_ID = st.secrets.get("GIST_ID")
+    GITHUB_PAT = st.secrets.get("GITHUB_PAT")
+    tracker = st.session_state.get('library_dirty_tracker')
+    if fragments is None and tracker is not None and 'editable_prompts' in st.session_state and not tracker.has_changes(st.session_state.editable_prompts):
+        return True # Contenu identique à la dernière sauvegarde : aucun envoi
     if not GIST_ID or not GITHUB_PAT: # pragma: no cover
+        if fragments is not None: # Sans Gist, les fragments ne vivent que dans la session
+            st.session_state.library_manifest = {**(st.session_state.get('library_manifest') or {}), "fragments": fragments}
         st.sidebar.warning("Secrets Gist (GIST_ID/GITHUB_PAT) non configurés. Sauvegarde sur GitHub désactivée.")
-        return
+        return True
     if 'editable_prompts' in st.session_state:
         data_to_save = _preprocess_for_saving(st.session_state.editable_prompts)
         try:
-            json_string = json.dumps(data_to_save, indent=4, ensure_ascii=False)
-            if update_gist_content(GIST_ID, GITHUB_PAT, json_string):
+            json_string = dump_library(data_to_save)
+            new_manifest = update_gist_content(GIST_ID, GITHUB_PAT, data_to_save, st.session_state.get('library_manifest'), fragments)
+            if new_manifest is not None:
+                 _store_library_snapshot(GIST_ID, json_string, new_manifest)
+                 get_library_reconciler().record_local_save(json_string, new_manifest)
+                 if tracker is not None: tracker.mark_saved(st.session_state.editable_prompts)
                  st.toast("💾 Données sauvegardées sur Gist!", icon="☁️") # Feedback
-            else: 
-                st.warning("Sauvegarde Gist échouée.") 
+                 return True
+            st.warning("Sauvegarde Gist échouée.")
         except Exception as e: # pragma: no cover
             st.error(f"Erreur préparation données pour Gist: {e}")
+    return False
+
+def save_use_case_if_changed(family_name, use_case_name):
+    """Bump updated_at and save only if the use case content really changed. Returns True if saved."""
+    config = st.session_state.editable_prompts[family_name][use_case_name]
+    if not st.session_state.library_dirty_tracker.record_change(family_name, use_case_name, config):
+        return False
+    config["updated_at"] = datetime.now().isoformat()
+    save_editable_prompts_to_gist()
+    return True
+
+def rename_or_move_use_case(use_case_id, target_family, new_name):
+    """Rename a use case and/or move it to another family, by ID (config, ID and usage counter kept). Returns its new location, None if it no longer exists."""
+    library = st.session_state.editable_prompts
+    location = st.session_state.library_index.locate(library, use_case_id)
+    if location is None:
+        return None
+    if location[0] == target_family:
+        st.session_state.library_index.rename_use_case(library, target_family, location[1], new_name)
+    else:
+        st.session_state.library_index.move_use_case(library, use_case_id, target_family, new_name)
+    library[target_family][new_name]["updated_at"] = datetime.now().isoformat()
+    save_editable_prompts_to_gist()
+    return target_family, new_name
 
 def load_editable_prompts_from_gist():
     GIST_ID = st.secrets.get("GIST_ID")
@@ -391,31 +448,571 @@ def load_editable_prompts_from_gist():
     if not GIST_ID or not GITHUB_PAT: # pragma: no cover
         st.sidebar.warning("Secrets Gist (GIST_ID/GITHUB_PAT) non configurés. Utilisation des modèles par défaut locaux.")
         return copy.deepcopy(INITIAL_PROMPT_TEMPLATES)
-    raw_content = get_gist_content(GIST_ID, GITHUB_PAT) 
-    if raw_content: 
+    # 1. Snapshot local valide : démarrage sans attendre GitHub, réconciliation en arrière-plan
+    snapshot_file = _library_snapshot_file(GIST_ID)
+    snapshot = read_snapshot(snapshot_file)
+    if snapshot:
+        try:
+            loaded_data = json.loads(snapshot["content"])
+            if loaded_data and isinstance(loaded_data, dict):
+                st.session_state.library_content_checksum = snapshot["sha256"]
+                metrics.SESSIONS.touch(_current_session_id(), library_bytes=len(snapshot["content"]))
+                st.session_state.library_manifest = snapshot.get("manifest")
+                get_library_reconciler().request_refresh(GIST_ID, GITHUB_PAT, GIST_DATA_FILENAME, snapshot_file)
+                return _postprocess_after_loading(loaded_data)
+        except (json.JSONDecodeError, TypeError, ValueError): # pragma: no cover
+            pass
+    # 2. Pas de snapshot : chargement synchrone depuis Gist
+    gist_payload = get_gist_content(GIST_ID, GITHUB_PAT)
+    raw_content = gist_payload.content if gist_payload else None
+    if raw_content:
         try:
             loaded_data = json.loads(raw_content)
-            if not loaded_data or not isinstance(loaded_data, dict): 
+            if not loaded_data or not isinstance(loaded_data, dict):
                 raise ValueError("Contenu Gist vide ou mal structuré.")
+            _store_library_snapshot(GIST_ID, raw_content, gist_payload.manifest)
             return _postprocess_after_loading(loaded_data)
-        except (json.JSONDecodeError, TypeError, ValueError) as e: 
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
             st.info(f"Erreur chargement Gist ('{str(e)[:50]}...'). Initialisation avec modèles par défaut.")
-    else: 
+    else:
         st.info("Gist vide ou inaccessible. Initialisation avec modèles par défaut.")
     initial_data = copy.deepcopy(INITIAL_PROMPT_TEMPLATES)
-    if GIST_ID and GITHUB_PAT and (raw_content is None or raw_content == "{}"): # Try to save defaults if Gist was empty
-        data_to_save_init = _preprocess_for_saving(initial_data) 
+    # Initialisation du Gist uniquement si le fichier y est absent/vide : jamais sur erreur réseau
+    # (raw_content None), pour ne pas écraser des données distantes momentanément inaccessibles.
+    if GIST_ID and GITHUB_PAT and raw_content == "{}":
+        data_to_save_init = _preprocess_for_saving(initial_data)
         try:
-            json_string_init = json.dumps(data_to_save_init, indent=4, ensure_ascii=False)
-            if update_gist_content(GIST_ID, GITHUB_PAT, json_string_init):
+            init_manifest = update_gist_content(GIST_ID, GITHUB_PAT, data_to_save_init)
+            if init_manifest is not None:
+                st.session_state.library_manifest = init_manifest
                 st.info("Modèles par défaut sauvegardés sur Gist pour initialisation.")
         except Exception as e: # pragma: no cover
             st.error(f"Erreur sauvegarde initiale sur Gist: {e}")
     return initial_data
 
+# --- Panneau de performance (debug, caché) : secret PERF_PROFILING + paramètre d'URL ?perf=1 ---
+def render_perf_debug_panel():
+    if not perf_spans.is_enabled() or st.query_params.get("perf") != "1":
+        return
+    with st.sidebar.expander("⏱️ Performance (debug)", expanded=False):
+        spans_summary = perf_spans.summary()
+        if not spans_summary:
+            st.caption("Aucune mesure pour l'instant.")
+            return
+        st.caption("Durées en ms sur les derniers échantillons de chaque span (toutes sessions confondues).")
+        st.dataframe([{"span": name, **stats} for name, stats in spans_summary.items()], hide_index=True, use_container_width=True)
+        render_stats = RENDER_CACHE.stats()
+        st.caption(f"Cache des prompts générés : {render_stats['hit_rate']:.0%} de hits ({render_stats['hits']}/{render_stats['hits'] + render_stats['misses']}), {render_stats['entries']} entrées, {render_stats['chars'] // 1024} K caractères.")
+        if LLM_RESPONSE_CACHE is not None:
+            llm_cache_stats = LLM_RESPONSE_CACHE.stats()
+            st.caption(f"Cache des réponses LLM : {llm_cache_stats['hit_rate']:.0%} de hits ({llm_cache_stats['hits']}/{llm_cache_stats['hits'] + llm_cache_stats['misses']}), {llm_cache_stats['entries']} réponses, {llm_cache_stats['bytes'] // 1024} Kio compressés.")
+        st.caption(f"Comptage des tokens ({TOKEN_COUNTER.name}) : {TOKEN_COUNTER.hits}/{TOKEN_COUNTER.hits + TOKEN_COUNTER.misses} textes déjà comptés (mémoïsés par empreinte).")
+        st.download_button("📥 Exporter (JSON)", data=perf_spans.export_json(), file_name="perf_spans.json", mime="application/json", key="perf_spans_export_btn")
+        if st.button("Réinitialiser les mesures", key="perf_spans_reset_btn"):
+            perf_spans.reset()
+            st.rerun()
+
+# --- Analyse statique des templates : placeholders / variables, accolades (cf. template_lint.py) ---
+def render_template_lint(config):
+    for issue in lint_use_case(config, prompt_fragments):
+        (st.error if issue.level == "error" else st.warning)(issue.message, icon="🧩")
+
+def render_injection_lint_report():
+    """Show, once, the template issues found in the use cases injected by the previous run."""
+    report = st.session_state.pop('injection_lint_report', None)
+    if report:
+        with st.expander(f"🧩 Templates injectés à vérifier ({len(report)})", expanded=True):
+            for uc_name, messages in report.items():
+                st.markdown(f"**{uc_name}**\n" + "\n".join(f"- {message}" for message in messages))
+
+# --- Injection de cas d'usage JSON dans un métier (vue "Injecter JSON" et assistant automatique) ---
+def inject_use_cases(target_family_name, injected_data):
+    """Add the use cases of ``injected_data`` ({name: config}) to a family, save, then open the first one."""
+    if target_family_name not in st.session_state.editable_prompts: 
+        st.error(f"Le métier de destination '{target_family_name}' n'existe plus ou n'a pas été correctement sélectionnée.") 
+        return
+    family_prompts = st.session_state.editable_prompts[target_family_name]
+    successful_injections = []
+    failed_injections = []
+    injection_lint_report = {}
+    first_new_uc_name = None
+    for uc_name, uc_config_json in injected_data.items():
+        uc_name_stripped = uc_name.strip()
+        if not uc_name_stripped: 
+            failed_injections.append(f"Nom de cas d'usage vide ignoré.")
+            continue
+        if not isinstance(uc_config_json, dict) or "template" not in uc_config_json: 
+            failed_injections.append(f"'{uc_name_stripped}': Configuration invalide ou template manquant.")
+            continue
+        if uc_name_stripped in family_prompts: 
+            st.warning(f"Le cas d'usage '{uc_name_stripped}' existe déjà dans le métier '{target_family_name}'. Il a été ignoré.")
+            failed_injections.append(f"'{uc_name_stripped}': Existe déjà, ignoré.")
+            continue
+
+        prepared_uc_config = _prepare_newly_injected_use_case_config(uc_config_json)
+
+        if not prepared_uc_config.get("template"): 
+            failed_injections.append(f"'{uc_name_stripped}': Template invalide après traitement.")
+            continue
+        family_prompts[uc_name_stripped] = prepared_uc_config
+        successful_injections.append(uc_name_stripped)
+        injected_issues = lint_use_case(prepared_uc_config, prompt_fragments)
+        if injected_issues:
+            injection_lint_report[uc_name_stripped] = [issue.message for issue in injected_issues]
+        if first_new_uc_name is None: 
+            first_new_uc_name = uc_name_stripped
+    metrics.INJECTIONS.inc(len(successful_injections), outcome="ok")
+    metrics.INJECTIONS.inc(len(failed_injections), outcome="failed")
+    if successful_injections:
+        if injection_lint_report:
+            st.session_state.injection_lint_report = injection_lint_report # Affiché par la vue édition après le rerun
+        save_editable_prompts_to_gist()
+        st.success(f"{len(successful_injections)} cas d'usage injectés avec succès dans '{target_family_name}': {', '.join(successful_injections)}")
+        st.session_state.injection_json_text = "" 
+        if first_new_uc_name: 
+            st.session_state.view_mode = "edit"
+            st.session_state.force_select_family_name = target_family_name
+            st.session_state.force_select_use_case_name = first_new_uc_name
+            st.session_state.go_to_config_section = True
+            st.session_state.active_generated_prompt = "" # <--- AJOUTEZ CETTE LIGNE ICI
+            st.rerun()
+    if failed_injections:
+        for fail_msg in failed_injections: 
+            st.error(f"Échec d'injection : {fail_msg}")
+    if not successful_injections and not failed_injections: 
+        st.info("Aucun cas d'usage n'a été trouvé dans le JSON fourni ou tous étaient vides/invalides.")
+
+# --- Documents déposés : texte extrait en arrière-plan, lié aux variables text_area par référence (cf. document_ingestion.py) ---
+def _render_ingestion_progress(job, refreshing):
+    if job.done:
+        if refreshing:
+            st.rerun() # Arrête le rafraîchissement et lie le document
+        return
+    st.progress(job.progress, text=f"Extraction de {job.name} : {format_count(len(job.text))} caractères lus")
+    if job.text:
+        st.caption(job.text[:300] + "…")
+
+def _finish_ingestion(use_case_id, ingestion, bindings):
+    job = ingestion["job"]
+    del st.session_state.document_ingestions[use_case_id]
+    if job.error:
+        st.error(f"Extraction impossible pour {job.name} : {job.error}")
+    elif job.reference is None: # pragma: no cover (annulée)
+        return
+    elif not job.reference.chars:
+        st.warning(f"Aucun texte trouvé dans {job.name} (document scanné ?). Rien n'a été lié.")
+    else:
+        bindings[ingestion["variable"]] = job.reference
+        st.success(f"{job.name} lié à {{{ingestion['variable']}}}{' (déjà extrait)' if job.cached else ''}.")
+
+def render_document_binding(config):
+    """Upload panel for the text_area variables of a use case; returns {variable: DocumentRef} of its bound documents."""
+    use_case_id = config["id"]
+    bindings = st.session_state.document_bindings.setdefault(use_case_id, {})
+    text_area_names = [var["name"] for var in config.get("variables", []) if isinstance(var, dict) and var.get("type") == "text_area" and "name" in var]
+    for name in [name for name in bindings if name not in text_area_names]:
+        del bindings[name] # Variable supprimée ou changée de type
+    if not text_area_names:
+        return bindings
+    ingestion = st.session_state.document_ingestions.get(use_case_id)
+    with st.expander(f"📎 Remplir une variable depuis un document ({len(bindings)} lié{'s' if len(bindings) > 1 else ''})", expanded=ingestion is not None):
+        for name, ref in list(bindings.items()):
+            col_doc, col_unbind = st.columns([5, 1])
+            col_doc.caption(f"{{{name}}} ← 📎 {ref.name} ({format_count(ref.chars)} caractères)")
+            if col_unbind.button("Détacher", key=f"doc_unbind_{use_case_id}_{name}"):
+                del bindings[name]
+                st.rerun()
+        target = st.selectbox("Variable à remplir :", text_area_names, key=f"doc_target_{use_case_id}")
+        uploaded = st.file_uploader(f"Document ({', '.join(ext.upper() for ext in SUPPORTED_EXTENSIONS)}) :", type=list(SUPPORTED_EXTENSIONS),
+                                    key=f"doc_upload_{use_case_id}_{st.session_state.document_uploader_generation}", disabled=ingestion is not None)
+        if uploaded is not None and ingestion is None:
+            ingestion = {"job": IngestionJob(uploaded.name, uploaded.getvalue(), DOCUMENT_STORE), "variable": target}
+            st.session_state.document_ingestions[use_case_id] = ingestion
+            st.session_state.document_uploader_generation += 1 # Nouveau widget vide : le fichier déposé est libéré
+        if ingestion is not None:
+            if ingestion["job"].done:
+                _finish_ingestion(use_case_id, ingestion, bindings)
+            else:
+                st.fragment(_render_ingestion_progress, run_every=0.3)(ingestion["job"], True)
+                if st.button("⏹️ Annuler l'extraction", key=f"doc_cancel_{use_case_id}"):
+                    ingestion["job"].cancel()
+                    del st.session_state.document_ingestions[use_case_id]
+                    st.rerun()
+    return bindings
+
+def render_bound_document(var_info, ref):
+    """Form field of a text_area variable bound to a document: the reference token, not the text."""
+    st.markdown(f"**{var_info['label']}**")
+    st.caption(f"📎 {ref.name} : {format_count(ref.chars)} caractères, insérés en entier dans le prompt envoyé au modèle ou téléchargé.")
+    return document_reference(ref)
+
+def render_full_prompt_download(widget_key):
+    """Download of the generated prompt with the bound documents substituted (only when it references some)."""
+    prompt = st.session_state.active_generated_prompt
+    if "⟦📎" not in prompt:
+        return
+    st.download_button("⬇️ Télécharger le prompt complet (documents inclus)", data=lambda: resolve_document_references(prompt, DOCUMENT_STORE).encode("utf-8"),
+                       file_name="prompt.txt", mime="text/plain", key=f"full_prompt_download_{widget_key}", on_click="ignore")
+
+# --- Exécution du prompt généré sur l'endpoint LLM, réponse en streaming (cf. llm_client.py) ---
+def _render_llm_answer(job, refreshing):
+    st.markdown("**🤖 Réponse du modèle :**")
+    if not job.done:
+        st.markdown(job.texts[0] + " ▌")
+        return
+    if refreshing: # Fin du streaming : rerun complet pour arrêter le rafraîchissement et réafficher les boutons
+        st.rerun()
+    result = job.results[0]
+    st.markdown(result.text or "*Réponse vide.*")
+    if result.status == "error":
+        st.error(f"Échec de l'exécution : {result.error}")
+    elif result.status == "cancelled":
+        st.warning("Exécution annulée (réponse partielle).")
+    elif result.cached:
+        st.caption(f"⚡ Réponse servie par le cache local (prompt et paramètres identiques) : aucun appel ni token ({LLM_CLIENT.model})")
+    else:
+        st.caption(f"⏱️ {result.latency_s:.1f} s, premier token après {result.first_token_s or 0:.2f} s ({LLM_CLIENT.model})")
+
+def render_llm_execution(widget_key):
+    """Run button, cancel button and streamed answer for the generated prompt (only with LLM_API_BASE_URL)."""
+    if LLM_CLIENT is None:
+        return
+    execution = st.session_state.get('llm_execution')
+    job = execution["job"] if execution and execution["key"] == widget_key else None
+    running = job is not None and not job.done
+    col_run, col_cancel = st.columns(2)
+    if col_run.button("▶️ Exécuter le prompt", key=f"llm_run_{widget_key}", disabled=running, use_container_width=True):
+        job = LLMJob(LLM_CLIENT, [resolve_document_references(st.session_state.active_generated_prompt, DOCUMENT_STORE)])
+        st.session_state.llm_execution = {"key": widget_key, "job": job}
+        running = True
+    if running and col_cancel.button("⏹️ Annuler", key=f"llm_cancel_{widget_key}", use_container_width=True):
+        job.cancel()
+        job.wait(5)
+        st.rerun() # Réaffiche le bouton d'exécution, actif
+    if job is not None and not running and job.results[0].cached and col_cancel.button("🔄 Relancer sans cache", key=f"llm_refresh_{widget_key}", use_container_width=True):
+        st.session_state.llm_execution = {"key": widget_key, "job": LLMJob(LLM_CLIENT, [resolve_document_references(st.session_state.active_generated_prompt, DOCUMENT_STORE)], use_cache=False)}
+        st.rerun()
+    if job is not None:
+        st.fragment(_render_llm_answer, run_every=0.3 if running else None)(job, running)
+
+# --- Recherche dans la bibliothèque : index trigrammes tolérant aux fautes et aux accents (cf. library_search.py) ---
+def search_family_use_cases(family_name, use_cases, search_term, selected_tags):
+    """Use cases of ``family_name`` passing the tag filter and matching the search box, best match first.
+
+    Returns ``(use_cases, other_families)``: ``other_families`` counts the matches in the other families.
+    """
+    tagged = filter_use_cases(use_cases, "", selected_tags)
+    if not search_term.strip():
+        return {name: tagged[name] for name in sorted(tagged)}, {}
+    index = st.session_state.library_search_index
+    with perf_spans.span("library_search"):
+        index.sync(st.session_state.editable_prompts) # Seuls les cas d'usage modifiés depuis la dernière recherche sont réindexés
+        results = index.search(search_term)
+    other_families = {}
+    for (family, _), _ in results:
+        if family != family_name:
+            other_families[family] = other_families.get(family, 0) + 1
+    return {name: tagged[name] for (family, name), _ in results if family == family_name and name in tagged}, other_families
+
+# --- Prompts similaires : voisins TF-IDF précalculés et mis à jour à chaque modification (cf. similar_prompts.py) ---
+def synced_similar_prompts():
+    """The similar prompts index, brought in line with the library (only changed use cases are recomputed)."""
+    index = st.session_state.similar_prompts_index
+    with perf_spans.span("similar_prompts"):
+        index.sync(st.session_state.editable_prompts)
+    return index
+
+def format_similarity(item, family_name):
+    label = item.name if item.family == family_name else f"{item.name} ({item.family})"
+    return f"{label} · {item.similarity:.0%}"
+
+def render_similar_prompts(family_name, use_case_name):
+    """Panel of the use cases closest to the one shown, each with a button to open it."""
+    similar = synced_similar_prompts().similar(family_name, use_case_name)
+    if not similar:
+        return
+    current_id = st.session_state.editable_prompts[family_name][use_case_name]["id"]
+    duplicates = sum(item.similarity >= DUPLICATE_SIMILARITY for item in similar)
+    title = f"🧭 Prompts similaires ({len(similar)})" + (f" · {duplicates} quasi-doublon(s)" if duplicates else "")
+    with st.expander(title, expanded=False):
+        if duplicates:
+            st.caption("Un quasi-doublon existe déjà : réutilisez-le ou enrichissez-le plutôt que d'en créer un nouveau.")
+        for item in similar:
+            target_id = st.session_state.editable_prompts[item.family][item.name]["id"]
+            col_similar_name, col_similar_open = st.columns([4, 1])
+            col_similar_name.markdown(("⚠️ " if item.similarity >= DUPLICATE_SIMILARITY else "") + format_similarity(item, family_name))
+            if col_similar_open.button("Ouvrir", key=f"similar_open_{current_id}_{target_id}", use_container_width=True):
+                st.session_state.view_mode = "edit"; st.session_state.force_select_family_name = item.family; st.session_state.force_select_use_case_name = item.name; st.session_state.go_to_config_section = False; st.session_state.active_generated_prompt = ""; st.session_state.variable_type_to_create = None; st.session_state.editing_variable_info = None; st.session_state.confirming_delete_details = None
+                st.rerun()
+
+# --- Prompt compact : template minifié avant substitution, sur option (cf. prompt_minifier.py) ---
+def generation_template(config):
+    """Expanded template used for generation, minified when the compact prompt option is on."""
+    template = expand_template(config.get("template", ""), prompt_fragments)
+    return minify_template(template) if st.session_state.minify_generated_prompt else template
+
+# --- Taille du prompt généré : tokens et coût estimé, part de chaque variable (cf. token_counting.py) ---
+def render_token_usage(form_values):
+    """Token count and estimated input cost of the generated prompt, with the share of each variable."""
+    prompt = resolve_document_references(st.session_state.active_generated_prompt, DOCUMENT_STORE)
+    prompt_tokens = TOKEN_COUNTER.count(prompt)
+    if TOKEN_COUNTER.exact:
+        method = f"tokenizer {TOKEN_COUNTER.name}"
+    elif isinstance(TOKEN_COUNTER.tokenizer, BPETokenizer): # Sans tiktoken ni regex : pré-découpage approché
+        method = f"tokenizer {TOKEN_COUNTER.name}, approché"
+    else:
+        method = "estimation hors ligne"
+    summary = f"🔢 {format_count(prompt_tokens)} tokens ({method})"
+    if LLM_PRICES:
+        summary += f" · coût estimé de l'envoi : {estimate_cost(prompt_tokens, LLM_PRICES[0]):.4f} $, puis {LLM_PRICES[1]:g} $ par million de tokens de réponse"
+    st.caption(summary)
+    values = format_values_for_template(form_values)
+    if not values or not prompt_tokens:
+        return
+    with st.expander("🔢 Tokens par variable", expanded=False):
+        rows = []
+        for name, value in values.items():
+            value_tokens = TOKEN_COUNTER.count(resolve_document_references(value, DOCUMENT_STORE))
+            row = {"Variable": f"{{{name}}}", "Tokens": value_tokens, "Part du prompt": f"{value_tokens / prompt_tokens:.0%}"}
+            if LLM_PRICES:
+                row["Coût estimé ($)"] = round(estimate_cost(value_tokens, LLM_PRICES[0]), 5)
+            rows.append(row)
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+
+# --- Prompt plus long que la fenêtre de contexte : découpage de sa plus longue variable et exécution map-reduce (cf. chunking.py) ---
+def _render_map_reduce(job, refreshing):
+    total = len(job.plan.map_prompts)
+    if job.stage == "map":
+        st.progress(job.maps_done / total, text=f"Extraits traités : {job.maps_done}/{total}")
+    elif job.stage == "reduce":
+        st.progress(1.0, text=f"Synthèse des {total} réponses partielles" + (f" (tour {job.reduce_rounds})" if job.reduce_rounds > 1 else "") + "…")
+    if job.reduce_text:
+        st.markdown(job.reduce_text + ("" if job.done else " ▌"))
+    if not job.done:
+        return
+    if refreshing:
+        st.rerun() # Arrête le rafraîchissement périodique
+    if job.error:
+        st.error(job.error)
+    elif job.result is None:
+        st.warning("Exécution annulée.")
+    else:
+        st.caption(f"⏱️ {total} extraits de {{{job.plan.variable}}} traités en parallèle, puis synthèse ({LLM_CLIENT.model})")
+        if job.truncated_partials:
+            st.caption(f"✂️ {job.truncated_partials} réponse(s) partielle(s) tronquée(s) pour tenir dans la fenêtre de la synthèse.")
+    with st.expander(f"Réponses par extrait ({job.maps_done}/{total})"):
+        for index, text in enumerate(job.map_texts, 1):
+            st.markdown(f"**Extrait {index}**")
+            st.markdown(text or "*(pas de réponse)*")
+
+def render_context_window_check(widget_key, title, template, form_values):
+    """Warning when the generated prompt exceeds the context window; map-reduce execution over chunks of its longest variable."""
+    prompt = resolve_document_references(st.session_state.active_generated_prompt, DOCUMENT_STORE)
+    if fits_context(prompt, LLM_CONTEXT_TOKENS, LLM_OUTPUT_RESERVE_TOKENS, TOKEN_COUNTER.count):
+        return
+    st.warning(f"⚠️ Ce prompt fait environ {format_count(TOKEN_COUNTER.count(prompt))} tokens : avec {format_count(LLM_OUTPUT_RESERVE_TOKENS)} tokens réservés à la réponse, "
+               f"il dépasse la fenêtre de contexte du modèle ({format_count(LLM_CONTEXT_TOKENS)} tokens). Le modèle en ignorera une partie ou refusera la requête.")
+    if LLM_CLIENT is None:
+        return
+    values = {name: resolve_document_references(value, DOCUMENT_STORE) for name, value in format_values_for_template(form_values).items()}
+    variable = largest_variable(values)
+    if variable is None: # pragma: no cover (prompt long sans variable)
+        return
+    execution = st.session_state.get('map_reduce_execution')
+    job = execution["job"] if execution and execution["key"] == widget_key else None
+    running = job is not None and not job.done
+    st.caption(f"Exécution par extraits : {{{variable}}} est découpée en extraits qui se chevauchent, un prompt par extrait est exécuté, puis une synthèse. "
+               "Les prompts sont rendus à partir du template et du formulaire (les retouches manuelles du prompt ne sont pas reprises).")
+    col_run, col_cancel = st.columns(2)
+    if col_run.button("✂️ Exécuter par extraits (map-reduce)", key=f"map_reduce_run_{widget_key}", disabled=running, use_container_width=True):
+        try:
+            plan = plan_map_reduce(title, template, values, variable, LLM_CONTEXT_TOKENS, LLM_OUTPUT_RESERVE_TOKENS, count_tokens=TOKEN_COUNTER.count)
+        except ValueError as e:
+            st.error(str(e))
+            return
+        job = MapReduceJob(LLM_CLIENT, plan)
+        st.session_state.map_reduce_execution = {"key": widget_key, "job": job}
+        running = True
+    if running and col_cancel.button("⏹️ Annuler", key=f"map_reduce_cancel_{widget_key}", use_container_width=True):
+        job.cancel()
+        job.wait(5)
+        st.rerun()
+    if job is not None:
+        st.fragment(_render_map_reduce, run_every=0.3 if running else None)(job, running)
+
+# --- Assistant en boucle fermée : méta-prompt envoyé à l'endpoint LLM, JSON extrait pendant le streaming puis injecté ---
+def _render_assistant_stream(run, refreshing):
+    job = run["job"]
+    answer = job.texts[0]
+    run["extractor"].feed(answer[run["consumed"]:]) # Seul le texte arrivé depuis le dernier rafraîchissement est analysé
+    run["consumed"] = len(answer)
+    extracted = run["extractor"].result or (run["extractor"].finish(answer) if job.done else None)
+    if extracted is not None:
+        # JSON complet : injection immédiate ; la fin éventuelle de la réponse n'est plus lue, le stream est coupé
+        if not job.done:
+            job.cancel()
+        st.session_state.assistant_auto_injection_pending = {"family": run["family"], "data": extracted}
+        st.session_state.assistant_llm_run = None
+        st.rerun()
+    with st.expander("🤖 Réponse du modèle", expanded=True):
+        st.markdown(answer + ("" if job.done else " ▌"))
+    if not job.done:
+        return
+    if refreshing:
+        st.rerun()
+    result = job.results[0]
+    if result.status == "error":
+        st.error(f"Échec de l'appel au modèle : {result.error}")
+    elif result.status == "cancelled":
+        st.warning("Génération annulée.")
+    else:
+        st.error("Aucun objet JSON valide dans la réponse du modèle. Corrigez-la puis injectez-la manuellement.")
+    if answer and st.button("💉 Injecter cette réponse manuellement", key="assistant_auto_to_manual_btn"):
+        st.session_state.view_mode = "inject_manual"
+        st.session_state.injection_json_text = answer
+        st.session_state.assistant_llm_run = None
+        st.rerun()
+
+def render_assistant_auto_injection():
+    """Send the meta-prompt to the LLM endpoint and inject the returned JSON without copy/paste (only with LLM_API_BASE_URL)."""
+    if LLM_CLIENT is None:
+        return
+    pending = st.session_state.pop('assistant_auto_injection_pending', None)
+    if pending is not None:
+        inject_use_cases(pending["family"], pending["data"]) # Succès : bascule vers la vue édition du nouveau cas d'usage
+    families = list(st.session_state.editable_prompts.keys())
+    if not families: # pragma: no cover
+        return
+    st.subheader("🤖 Génération et injection automatiques")
+    meta_prompt = st.session_state.generated_meta_prompt_for_llm
+    run = st.session_state.get('assistant_llm_run')
+    if run is not None and run["meta_prompt"] != meta_prompt:
+        run = None # Méta-prompt régénéré entre-temps
+    running = run is not None and not run["job"].done
+    target_family = st.selectbox("Métier de destination :", families, key="assistant_auto_family_selector", disabled=running)
+    col_run, col_cancel = st.columns(2)
+    if col_run.button("🚀 Envoyer au modèle et injecter", key="assistant_auto_run_btn", type="primary", disabled=running, use_container_width=True):
+        # Sans cache : relancer le même méta-prompt doit produire une nouvelle proposition
+        run = {"job": LLMJob(LLM_CLIENT, [meta_prompt], use_cache=False), "extractor": JSONObjectExtractor(), "consumed": 0,
+               "family": target_family, "meta_prompt": meta_prompt}
+        st.session_state.assistant_llm_run = run
+        running = True
+    if running and col_cancel.button("⏹️ Annuler", key="assistant_auto_cancel_btn", use_container_width=True):
+        run["job"].cancel()
+        run["job"].wait(5)
+        st.rerun()
+    if run is not None:
+        st.fragment(_render_assistant_stream, run_every=0.3 if running else None)(run, running)
+    st.markdown("---")
+
+# --- Jeux de test d'un cas d'usage : évaluation parallèle du template enregistré et du brouillon ---
+MAX_EVALUATION_HISTORY = 20
+
+def _split_keywords(text):
+    return [word.strip() for word in text.split(",") if word.strip()]
+
+def _render_fixture_form(family_name, use_case_name, config, widget_key):
+    with st.form(key=f"fixture_form_{widget_key}", clear_on_submit=True):
+        st.markdown("##### Ajouter un jeu de test")
+        fixture_name = st.text_input("Nom du jeu de test :")
+        values = {}
+        for var_info in config.get("variables", []):
+            if 'name' in var_info:
+                values[var_info['name']] = st.text_area(f"{var_info.get('label', var_info['name'])} ({{{var_info['name']}}}) :", height=68,
+                                                        help="Vide : valeur par défaut de la variable.")
+        st.markdown("Vérifications de la réponse (facultatives) :")
+        regex = st.text_input("Expression régulière attendue (insensible à la casse) :")
+        required = st.text_input("Mots-clés obligatoires (séparés par des virgules) :")
+        forbidden = st.text_input("Mots-clés interdits (séparés par des virgules) :")
+        schema_text = st.text_area("Schéma JSON que la réponse doit respecter :", height=100)
+        if not st.form_submit_button("➕ Ajouter le jeu de test"):
+            return
+    checks = []
+    if regex.strip():
+        checks.append({"type": "regex", "pattern": regex.strip(), "flags": "i"})
+    if _split_keywords(required) or _split_keywords(forbidden):
+        checks.append({"type": "keywords", "required": _split_keywords(required), "forbidden": _split_keywords(forbidden)})
+    if schema_text.strip():
+        try:
+            checks.append({"type": "json_schema", "schema": json.loads(schema_text)})
+        except json.JSONDecodeError as e:
+            st.error(f"Schéma JSON invalide : {e}")
+            return
+    fixtures = config.get(FIXTURES_FIELD) or []
+    fixtures.append({"name": fixture_name.strip() or f"Jeu {len(fixtures) + 1}",
+                     "values": {name: value for name, value in values.items() if value.strip()}, "checks": checks})
+    config[FIXTURES_FIELD] = fixtures
+    if save_use_case_if_changed(family_name, use_case_name): st.success("Jeu de test ajouté !")
+
+def _render_evaluation_reports(history):
+    st.dataframe([{
+        "Version": report.version, "Template": report.label, "Réussite": f"{report.pass_rate:.0%}",
+        "p50 (s)": round(report.latency_p50_s, 2), "p95 (s)": round(report.latency_p95_s, 2), "En cache": report.cached,
+        "Heure": datetime.fromtimestamp(report.evaluated_at).strftime("%H:%M:%S"),
+    } for report in reversed(history)], use_container_width=True, hide_index=True)
+    latest = [report for report in history if report.evaluated_at == history[-1].evaluated_at]
+    if len(latest) == 2:
+        saved_report, draft_report = latest
+        if draft_report.pass_rate < saved_report.pass_rate:
+            st.warning(f"⚠️ Régression : le brouillon réussit {draft_report.pass_rate:.0%} des jeux de test contre {saved_report.pass_rate:.0%} pour le template enregistré.")
+        elif draft_report.pass_rate > saved_report.pass_rate:
+            st.success(f"Le brouillon réussit {draft_report.pass_rate:.0%} des jeux de test contre {saved_report.pass_rate:.0%} pour le template enregistré.")
+    for report in latest:
+        st.markdown(f"**{report.label}** (version `{report.version}`)")
+        for result in report.results:
+            if result.passed:
+                st.markdown(f"✅ {result.name} ({result.latency_s:.1f} s{', cache' if result.cached else ''})")
+            elif result.status != "ok":
+                st.markdown(f"❌ {result.name} : appel {result.status} {result.error or ''}")
+            else:
+                failures = " ; ".join(f"{check.type} : {check.detail}" for check in result.checks if not check.passed)
+                st.markdown(f"❌ {result.name} : {failures}")
+
+def render_evaluation_panel(family_name, use_case_name, config, widget_key):
+    """Test fixtures of a use case and evaluation of the saved template against the draft in the editor."""
+    fixtures = config.get(FIXTURES_FIELD) or []
+    with st.expander(f"🧪 Jeux de test et évaluation ({len(fixtures)})", expanded=False):
+        for index, fixture in enumerate(fixtures):
+            col_fixture, col_delete = st.columns([5, 1])
+            check_types = ", ".join(check.get("type", "?") for check in fixture.get("checks", [])) or "aucune vérification"
+            col_fixture.markdown(f"**{fixture.get('name', f'Jeu {index + 1}')}** : {len(fixture.get('values', {}))} valeur(s), {check_types}")
+            if col_delete.button("🗑️", key=f"fixture_delete_{widget_key}_{index}", help="Supprimer ce jeu de test"):
+                del fixtures[index]
+                save_use_case_if_changed(family_name, use_case_name)
+                st.rerun()
+        _render_fixture_form(family_name, use_case_name, config, widget_key)
+        st.markdown("---")
+        if LLM_CLIENT is None:
+            st.caption("Configurez LLM_API_BASE_URL dans les secrets pour évaluer les jeux de test.")
+            return
+        if not fixtures:
+            st.caption("Ajoutez au moins un jeu de test pour évaluer ce cas d'usage.")
+            return
+        saved_template = config.get("template", "")
+        draft_template = st.session_state.get(f"template_text_area_{widget_key}", saved_template)
+        templates = {"Enregistré": saved_template}
+        if draft_template != saved_template:
+            templates["Brouillon"] = draft_template # Comparé avant d'être sauvegardé
+        history_key = config.get("id") or f"{family_name}/{use_case_name}"
+        if st.button(f"🧪 Évaluer ({len(fixtures)} jeu(x) × {len(templates)} version(s))", key=f"evaluate_{widget_key}", use_container_width=True):
+            with st.spinner("Exécution des jeux de test..."):
+                reports = evaluate_use_case(LLM_CLIENT, use_case_name, config, templates, prompt_fragments)
+            history = st.session_state.evaluation_history.setdefault(history_key, [])
+            history.extend(reports)
+            del history[:-MAX_EVALUATION_HISTORY]
+        history = st.session_state.evaluation_history.get(history_key)
+        if history:
+            _render_evaluation_reports(history)
+
 # --- Session State Initialization ---
+perf_spans.begin("session_init")
 if 'editable_prompts' not in st.session_state:
     st.session_state.editable_prompts = load_editable_prompts_from_gist()
+    st.session_state.library_dirty_tracker = DirtyTracker(st.session_state.editable_prompts)
+else:
+    apply_remote_library_update()
+if 'library_index' not in st.session_state:
+    st.session_state.library_index = LibraryIndex(st.session_state.editable_prompts) # IDs stables des métiers / cas d'usage (clés de widgets)
 if 'view_mode' not in st.session_state:
     st.session_state.view_mode = "accueil" # Nouvelle vue par défaut
 
@@ -435,10 +1032,18 @@ if 'confirming_delete_details' not in st.session_state: st.session_state.confirm
 if 'confirming_delete_family_name' not in st.session_state: st.session_state.confirming_delete_family_name = None
 if 'library_search_term' not in st.session_state: st.session_state.library_search_term = ""
 if 'library_selected_tags' not in st.session_state: st.session_state.library_selected_tags = []
+if 'library_search_index' not in st.session_state: st.session_state.library_search_index = LibrarySearchIndex() # Rempli à la première recherche
+if 'similar_prompts_index' not in st.session_state: st.session_state.similar_prompts_index = SimilarPromptsIndex() # Calculé au premier affichage d'un cas d'usage
 if 'variable_type_to_create' not in st.session_state: st.session_state.variable_type_to_create = None
 if 'active_generated_prompt' not in st.session_state: st.session_state.active_generated_prompt = ""
+if 'minify_generated_prompt' not in st.session_state: st.session_state.minify_generated_prompt = False # Option « Prompt compact » du formulaire de génération
+if 'document_bindings' not in st.session_state: st.session_state.document_bindings = {} # id du cas d'usage -> {variable: DocumentRef}
+if 'document_ingestions' not in st.session_state: st.session_state.document_ingestions = {} # id du cas d'usage -> extraction en cours
+if 'document_uploader_generation' not in st.session_state: st.session_state.document_uploader_generation = 0
 if 'duplicating_use_case_details' not in st.session_state: st.session_state.duplicating_use_case_details = None
+if 'moving_use_case_details' not in st.session_state: st.session_state.moving_use_case_details = None # Renommage / déplacement en cours (par ID)
 if 'go_to_config_section' not in st.session_state: st.session_state.go_to_config_section = False
+if 'evaluation_history' not in st.session_state: st.session_state.evaluation_history = {} # id du cas d'usage -> rapports d'évaluation
 
 if 'injection_selected_family' not in st.session_state:
     st.session_state.injection_selected_family = None
@@ -456,7 +1061,21 @@ if 'assistant_mode' not in st.session_state:
 if 'assistant_existing_prompt_value' not in st.session_state:
     st.session_state.assistant_existing_prompt_value = ""
 
+metrics.SESSIONS.touch(_current_session_id())
+metrics.set_library_size(st.session_state.editable_prompts)
+# Fragments partagés ({>nom} dans les templates), stockés dans le manifeste de la bibliothèque
+prompt_fragments = (st.session_state.get('library_manifest') or {}).get('fragments') or {}
+if st.session_state.get(EVICTED_FLAG_KEY):
+    # Session évincée pendant son inactivité : les clés supprimées viennent d'être recréées / rechargées ci-dessus
+    if "editable_prompts" in st.session_state[EVICTED_FLAG_KEY]:
+        st.toast("Session inactive : bibliothèque rechargée depuis la sauvegarde partagée.", icon="♻️")
+    else:
+        st.toast("Session inactive : les brouillons temporaires (prompt généré, JSON collé...) ont été effacés.", icon="♻️")
+    del st.session_state[EVICTED_FLAG_KEY]
+perf_spans.end("session_init")
+
 # --- Sidebar Navigation with Tabs ---
+perf_spans.begin("sidebar")
 st.sidebar.header("Menu Principal")
 tab_bibliotheque, tab_edition_generation, tab_injection = st.sidebar.tabs([
     "📚 Bibliothèque",
@@ -593,7 +1212,7 @@ with tab_edition_generation:
                     elif renamed_family_name in st.session_state.editable_prompts:
                         st.error(f"Un métier nommé '{renamed_family_name}' existe déjà.")
                     else:
-                        st.session_state.editable_prompts[renamed_family_name] = st.session_state.editable_prompts.pop(current_selected_family_for_edit_logic)
+                        st.session_state.library_index.rename_family(st.session_state.editable_prompts, current_selected_family_for_edit_logic, renamed_family_name)
                         save_editable_prompts_to_gist()
                         st.success(f"Métier '{current_selected_family_for_edit_logic}' renommé en '{renamed_family_name}'.")
                         st.session_state.force_select_family_name = renamed_family_name 
@@ -610,7 +1229,7 @@ with tab_edition_generation:
                 st.warning(f"Supprimer '{current_selected_family_for_edit_logic}' et tous ses cas d'usage ? Action irréversible.")
 
                 _text_confirm_delete = f"Oui, supprimer définitivement '{current_selected_family_for_edit_logic}'"
-                if st.button(_text_confirm_delete, type="primary", key=f"confirm_del_fam_sb_{current_selected_family_for_edit_logic}", use_container_width=True):
+                if st.button(_text_confirm_delete, type="primary", key=f"confirm_del_fam_sb_{st.session_state.library_index.family_id(current_selected_family_for_edit_logic)}", use_container_width=True):
                     deleted_fam_name = current_selected_family_for_edit_logic 
                     del st.session_state.editable_prompts[current_selected_family_for_edit_logic]
                     save_editable_prompts_to_gist()
@@ -623,12 +1242,12 @@ with tab_edition_generation:
                     st.session_state.view_mode = "edit" 
                     st.rerun()
 
-                if st.button("Non, annuler la suppression", key=f"cancel_del_fam_sb_{current_selected_family_for_edit_logic}", use_container_width=True):
+                if st.button("Non, annuler la suppression", key=f"cancel_del_fam_sb_{st.session_state.library_index.family_id(current_selected_family_for_edit_logic)}", use_container_width=True):
                     st.session_state.confirming_delete_family_name = None
                     st.session_state.view_mode = "edit"
                     st.rerun()
             else:
-                if st.button(f"🗑️ Supprimer le métier Sélectionnée", key=f"del_fam_btn_sb_{current_selected_family_for_edit_logic}"):
+                if st.button(f"🗑️ Supprimer le métier Sélectionnée", key=f"del_fam_btn_sb_{st.session_state.library_index.family_id(current_selected_family_for_edit_logic)}"):
                     st.session_state.confirming_delete_family_name = current_selected_family_for_edit_logic
                     st.session_state.view_mode = "edit"
                     st.rerun()
@@ -679,6 +1298,7 @@ with tab_edition_generation:
                                 "variables": [], "tags": [],
                                 "usage_count": 0, "created_at": now_iso_create, "updated_at": now_iso_update
                             }
+                            assign_new_use_case_id(st.session_state.editable_prompts[parent_family_val][uc_name_val])
                             save_editable_prompts_to_gist()
                             st.success(f"Cas d'usage '{uc_name_val}' créé avec succès dans '{parent_family_val}'.")
                             st.session_state.show_create_new_use_case_form = False 
@@ -688,6 +1308,50 @@ with tab_edition_generation:
                             st.session_state.active_generated_prompt = "" 
                             st.rerun()
 
+    with st.expander("🧱 Fragments partagés", expanded=False):
+        st.caption("Texte commun (rôle, contexte La Poste, règles de sortie...) stocké une seule fois et inclus dans les templates avec {>nom}. Modifier un fragment met à jour tous les templates qui l'incluent.")
+        new_fragment_option = "➕ Nouveau fragment"
+        selected_fragment = st.selectbox("Fragment :", [new_fragment_option] + sorted(prompt_fragments), key="fragment_selector_sidebar")
+        is_new_fragment = selected_fragment == new_fragment_option
+        fragment_users = [] if is_new_fragment else [
+            (family_name, uc_name) for family_name, use_cases in st.session_state.editable_prompts.items()
+            for uc_name, uc_config in use_cases.items() if selected_fragment in find_includes(uc_config.get("template", ""))
+        ]
+        with st.form(f"fragment_form_{selected_fragment}"):
+            fragment_name_input = st.text_input("Nom (lettres, chiffres, _) :", value="" if is_new_fragment else selected_fragment, disabled=not is_new_fragment)
+            fragment_text_input = st.text_area("Texte du fragment :", value=prompt_fragments.get(selected_fragment, ""), height=150)
+            factor_into_templates = st.checkbox("Remplacer ce texte par {>nom} dans les templates qui le contiennent", value=is_new_fragment)
+            submitted_fragment = st.form_submit_button("💾 Enregistrer le fragment")
+        if submitted_fragment:
+            fragment_name = fragment_name_input.strip() if is_new_fragment else selected_fragment
+            if not fragment_name.isidentifier():
+                st.error("Nom de fragment invalide : lettres, chiffres et _ uniquement, sans espace.")
+            elif is_new_fragment and fragment_name in prompt_fragments:
+                st.error(f"Le fragment '{fragment_name}' existe déjà.")
+            elif not fragment_text_input.strip():
+                st.error("Le texte du fragment ne peut pas être vide.")
+            else:
+                library = st.session_state.editable_prompts
+                templates_before = {(family_name, uc_name): config.get("template", "") for family_name, use_cases in library.items() for uc_name, config in use_cases.items()}
+                factored_use_cases = factor_fragment(library, fragment_name, fragment_text_input) if factor_into_templates else []
+                for family_name, uc_name in factored_use_cases:
+                    st.session_state.library_dirty_tracker.record_change(family_name, uc_name, library[family_name][uc_name])
+                if save_editable_prompts_to_gist(fragments={**prompt_fragments, fragment_name: fragment_text_input}):
+                    st.success(f"Fragment '{fragment_name}' enregistré" + (f", inclus dans {len(factored_use_cases)} template(s)." if factored_use_cases else "."))
+                    st.rerun()
+                # Fragment non enregistré : les templates retrouvent leur texte (sinon ils incluraient un fragment inexistant)
+                for family_name, uc_name in factored_use_cases:
+                    library[family_name][uc_name]["template"] = templates_before[(family_name, uc_name)]
+                    st.session_state.library_dirty_tracker.record_change(family_name, uc_name, library[family_name][uc_name])
+                st.error(f"Fragment '{fragment_name}' non enregistré : les templates n'ont pas été modifiés.")
+        if not is_new_fragment:
+            st.code(f"{{>{selected_fragment}}}", language=None)
+            st.caption(f"Inclus par {len(fragment_users)} cas d'usage.")
+            if st.button("🗑️ Supprimer le fragment", key=f"delete_fragment_{selected_fragment}", disabled=bool(fragment_users),
+                         help="Retirez d'abord l'inclusion des templates qui l'utilisent." if fragment_users else None):
+                save_editable_prompts_to_gist(fragments={name: text for name, text in prompt_fragments.items() if name != selected_fragment})
+                st.rerun()
+
 # --- Tab: Bibliothèque (Sidebar content) ---
 with tab_bibliotheque:
     st.subheader("Explorer la Bibliothèque de Prompts")
@@ -696,10 +1360,10 @@ with tab_bibliotheque:
         st.session_state.library_search_term = st.text_input(
             "🔍 Rechercher par mot-clé:",
             value=st.session_state.get("library_search_term", ""),
-            placeholder="Nom, template, variable..."
+            placeholder="Nom, template, variable, tag... (accents et fautes de frappe tolérés)"
         )
 
-    all_tags_list = sorted(list(set(tag for family in st.session_state.editable_prompts.values() for uc in family.values() for tag in uc.get("tags", []))))
+    all_tags_list = collect_all_tags(st.session_state.editable_prompts)
     with filter_tag_col:
         st.session_state.library_selected_tags = st.multiselect(
             "🏷️ Filtrer par Tags:",
@@ -719,7 +1383,7 @@ with tab_bibliotheque:
 
         st.write("Sélectionner un métier à afficher :")
         for family_name_bib in sorted_families_bib:
-            button_key = f"lib_family_btn_{family_name_bib.replace(' ', '_').replace('&', '_')}"
+            button_key = f"lib_family_btn_{st.session_state.library_index.family_id(family_name_bib)}"
             is_selected_family = (st.session_state.library_selected_family_for_display == family_name_bib)
             if st.button(
                 family_name_bib,
@@ -754,7 +1418,11 @@ with tab_injection:
         st.session_state.generated_meta_prompt_for_llm = "" # Aussi réinitialiser ici
         st.rerun()
 
+perf_spans.end("sidebar")
+
 # --- Main Display Area ---
+view_span_name = f"view.{st.session_state.view_mode}"
+perf_spans.begin(view_span_name)
 final_selected_family_edition = st.session_state.get('family_selector_edition')
 final_selected_use_case_edition = st.session_state.get('use_case_selector_edition')
 library_family_to_display = st.session_state.get('library_selected_family_for_display')
@@ -817,7 +1485,7 @@ elif st.session_state.view_mode == "select_family_for_library":
         cols = st.columns(num_cols)
         for i, family_name in enumerate(sorted_families):
             with cols[i % num_cols]:
-                if st.button(f"{family_name}", key=f"select_family_for_lib_btn_{family_name}", use_container_width=True, help=f"Voir les prompts du métier '{family_name}'"):
+                if st.button(f"{family_name}", key=f"select_family_for_lib_btn_{st.session_state.library_index.family_id(family_name)}", use_container_width=True, help=f"Voir les prompts du métier '{family_name}'"):
                     st.session_state.library_selected_family_for_display = family_name
                     st.session_state.view_mode = "library" # Redirige vers la bibliothèque avec la famille sélectionnée
                     st.rerun()
@@ -839,25 +1507,20 @@ elif st.session_state.view_mode == "library":
     elif library_family_to_display in st.session_state.editable_prompts:
         st.header(f"Bibliothèque - métier : {library_family_to_display}")
         use_cases_in_family_display = st.session_state.editable_prompts[library_family_to_display]
-        filtered_use_cases = {}
-        search_term_lib = st.session_state.get("library_search_term", "").strip().lower()
-        selected_tags_lib = st.session_state.get("library_selected_tags", [])
-        if use_cases_in_family_display:
-            for uc_name, uc_config in use_cases_in_family_display.items():
-                match_search = True
-                if search_term_lib:
-                    match_search = (search_term_lib in uc_name.lower() or
-                                    search_term_lib in uc_config.get("template", "").lower() or
-                                    any(search_term_lib in var.get("name","").lower() or search_term_lib in var.get("label","").lower() 
-                                        for var in uc_config.get("variables", [])))
-                match_tags = True
-                if selected_tags_lib: match_tags = all(tag in uc_config.get("tags", []) for tag in selected_tags_lib)
-                if match_search and match_tags: filtered_use_cases[uc_name] = uc_config
+        filtered_use_cases, other_family_matches = search_family_use_cases(
+            library_family_to_display,
+            use_cases_in_family_display or {},
+            st.session_state.get("library_search_term", ""),
+            st.session_state.get("library_selected_tags", []),
+        )
+        if other_family_matches:
+            st.caption("🔎 Aussi dans d'autres métiers : " + ", ".join(f"{family} ({count})" for family, count in sorted(other_family_matches.items(), key=lambda item: -item[1])))
         if not filtered_use_cases:
             if not use_cases_in_family_display: st.info(f"Le métier '{library_family_to_display}' ne contient actuellement aucun prompt.")
             else: st.info("Aucun prompt ne correspond à vos critères de recherche/filtre dans cette métier.")
         else:
-            sorted_use_cases_display = sorted(list(filtered_use_cases.keys()))
+            sorted_use_cases_display = list(filtered_use_cases) # Par pertinence si une recherche est saisie, sinon par nom
+            similar_prompts_index = synced_similar_prompts()
             for use_case_name_display in sorted_use_cases_display:
                 prompt_config_display = filtered_use_cases[use_case_name_display]
                 template_display = prompt_config_display.get("template", "_Template non défini._")
@@ -870,13 +1533,15 @@ elif st.session_state.view_mode == "library":
                     created_at_str = prompt_config_display.get('created_at', get_default_dates()[0])
                     updated_at_str = prompt_config_display.get('updated_at', get_default_dates()[1])
                     st.caption(f"Créé le: {datetime.fromisoformat(created_at_str).strftime('%d/%m/%Y %H:%M')} | Modifié le: {datetime.fromisoformat(updated_at_str).strftime('%d/%m/%Y %H:%M')}")
+                    similar_display = similar_prompts_index.similar(library_family_to_display, use_case_name_display, limit=3)
+                    if similar_display: st.caption("🧭 Similaires : " + " | ".join(format_similarity(item, library_family_to_display) for item in similar_display))
 
                     col_btn_lib1, col_btn_lib2 = st.columns(2)
                     with col_btn_lib1:
-                        if st.button(f"✍️ Utiliser ce prompt", key=f"main_lib_use_{library_family_to_display.replace(' ', '_')}_{use_case_name_display.replace(' ', '_')}", use_container_width=True):
+                        if st.button(f"✍️ Utiliser ce prompt", key=f"main_lib_use_{prompt_config_display['id']}", use_container_width=True):
                             st.session_state.view_mode = "edit"; st.session_state.force_select_family_name = library_family_to_display; st.session_state.force_select_use_case_name = use_case_name_display; st.session_state.go_to_config_section = False; st.session_state.active_generated_prompt = ""; st.session_state.variable_type_to_create = None; st.session_state.editing_variable_info = None; st.session_state.confirming_delete_details = None; st.rerun()
                     with col_btn_lib2:
-                        if st.button(f"⚙️ Éditer ce prompt", key=f"main_lib_edit_{library_family_to_display.replace(' ', '_')}_{use_case_name_display.replace(' ', '_')}", use_container_width=True):
+                        if st.button(f"⚙️ Éditer ce prompt", key=f"main_lib_edit_{prompt_config_display['id']}", use_container_width=True):
                             st.session_state.view_mode = "edit"; st.session_state.force_select_family_name = library_family_to_display; st.session_state.force_select_use_case_name = use_case_name_display; st.session_state.go_to_config_section = True; st.session_state.active_generated_prompt = ""; st.session_state.variable_type_to_create = None; st.session_state.editing_variable_info = None; st.session_state.confirming_delete_details = None; st.rerun()
     else: 
         st.info("Aucun métier n'est actuellement sélectionnée dans la bibliothèque ou le métier sélectionné n'existe plus.")
@@ -894,9 +1559,12 @@ elif st.session_state.view_mode == "edit":
     elif not final_selected_use_case_edition: st.info(f"Sélectionnez un cas d'usage dans le métier '{final_selected_family_edition}' ou créez-en un nouveau pour commencer.")
     elif final_selected_family_edition in st.session_state.editable_prompts and final_selected_use_case_edition in st.session_state.editable_prompts[final_selected_family_edition]:
         current_prompt_config = st.session_state.editable_prompts[final_selected_family_edition][final_selected_use_case_edition]
+        uc_widget_key = current_prompt_config["id"] # Clés de widgets par ID : stables au renommage, sans collision
+        render_injection_lint_report()
         st.header(f"Cas d'usage: {final_selected_use_case_edition}")
         created_at_str_edit = current_prompt_config.get('created_at', get_default_dates()[0]); updated_at_str_edit = current_prompt_config.get('updated_at', get_default_dates()[1])
         st.caption(f"Métier : {final_selected_family_edition} | Utilisé {current_prompt_config.get('usage_count', 0)} fois. Créé: {datetime.fromisoformat(created_at_str_edit).strftime('%d/%m/%Y')}, Modifié: {datetime.fromisoformat(updated_at_str_edit).strftime('%d/%m/%Y')}")
+        render_similar_prompts(final_selected_family_edition, final_selected_use_case_edition)
         st.markdown("""
         <div style="border: 1px solid #e0e0e0; border-radius: 5px; padding: 15px; margin-bottom: 20px; background-color: #f9f9f9;">
             <h4 style="margin-top:0;">Comment ça marche ?</h4>
@@ -909,7 +1577,8 @@ elif st.session_state.view_mode == "edit":
         </div>
         """, unsafe_allow_html=True)
         gen_form_values = {}
-        with st.form(key=f"gen_form_{final_selected_family_edition}_{final_selected_use_case_edition}"):
+        document_bindings = render_document_binding(current_prompt_config)
+        with st.form(key=f"gen_form_{uc_widget_key}"):
             if not current_prompt_config.get("variables"): st.info("Ce cas d'usage n'a pas de variables configurées pour la génération.")
             variables_for_form = current_prompt_config.get("variables", [])
             if not isinstance(variables_for_form, list): variables_for_form = [] 
@@ -919,7 +1588,7 @@ elif st.session_state.view_mode == "edit":
                 cols = st.columns(len(chunk))
                 for i, var_info in enumerate(chunk):
                     with cols[i]:
-                        widget_key = f"gen_input_{final_selected_family_edition}_{final_selected_use_case_edition}_{var_info['name']}"; field_default = var_info.get("default"); var_type = var_info.get("type")
+                        widget_key = f"gen_input_{uc_widget_key}_{var_info['name']}"; field_default = var_info.get("default"); var_type = var_info.get("type")
                         if var_type == "text_input": gen_form_values[var_info["name"]] = st.text_input(var_info["label"], value=str(field_default or ""), key=widget_key)
                         elif var_type == "selectbox":
                             opts = var_info.get("options", []); idx = 0 
@@ -937,6 +1606,7 @@ elif st.session_state.view_mode == "edit":
                             if min_val_gen is not None and val_num_gen < min_val_gen: val_num_gen = min_val_gen 
                             if max_val_gen is not None and val_num_gen > max_val_gen: val_num_gen = max_val_gen 
                             gen_form_values[var_info["name"]] = st.number_input(var_info["label"], value=val_num_gen, min_value=min_val_gen,max_value=max_val_gen, step=step_val_gen, key=widget_key, format="%.2f")
+                        elif var_type == "text_area" and var_info["name"] in document_bindings: gen_form_values[var_info["name"]] = render_bound_document(var_info, document_bindings[var_info["name"]])
                         elif var_type == "text_area": 
                             height_val = var_info.get("height")
                             final_height = None 
@@ -948,61 +1618,30 @@ elif st.session_state.view_mode == "edit":
                                 except (ValueError, TypeError): final_height = None 
                             else: final_height = None 
                             gen_form_values[var_info["name"]] = st.text_area(var_info["label"], value=str(field_default or ""), height=final_height, key=widget_key)
+            st.session_state.minify_generated_prompt = st.checkbox("✂️ Prompt compact (moins de tokens)", value=st.session_state.minify_generated_prompt,
+                help="Retire la mise en forme décorative du template (lignes vides, séparateurs, gras des titres, doublons de consignes). Les valeurs saisies et les documents ne sont jamais modifiés.")
             if st.form_submit_button("🚀 Générer Prompt"):
-                processed_values_for_template = {}
-                for k, v_val in gen_form_values.items(): # gen_form_values vient de votre formulaire
-                    if v_val is None:
-                        # On ne met pas les valeurs None dans le dictionnaire,
-                        # donc les placeholders correspondants ne seront pas remplacés (comportement original)
-                        continue 
-                    
-                    if isinstance(v_val, date):
-                        processed_values_for_template[k] = v_val.strftime("%d/%m/%Y")
-                    elif isinstance(v_val, float): # On regroupe ici tous les traitements pour les floats
-                        if v_val.is_integer(): # Si le float est un entier (ex: 50.0)
-                            processed_values_for_template[k] = str(int(v_val)) # Convertir en "50"
-                        else: # S'il s'agit d'un float avec des décimales (ex: 0.125000...)
-                            processed_values_for_template[k] = f"{v_val:.2f}" # Formater avec 2 décimales
-                    else: # Pour tous les autres types (str, bool, etc. qui ne sont ni date ni float)
-                        processed_values_for_template[k] = str(v_val)
-                
-                final_vals_for_prompt = processed_values_for_template # final_vals_for_prompt contient maintenant des chaînes
-
                 try:
-                    prompt_template_content = current_prompt_config.get("template", "")
-                    processed_template = prompt_template_content
-
-                    # 1. Remplacer les variables connues par Streamlit (celles du formulaire)
-                    # Trier par longueur de clé (descendant) pour éviter les substitutions partielles
-                    # (ex: remplacer {jour_semaine} avant {jour})
-                    sorted_vars_for_formatting = sorted(final_vals_for_prompt.items(), key=lambda item: len(item[0]), reverse=True)
-
-                    for var_name, var_value in sorted_vars_for_formatting:
-                        placeholder_streamlit = f"{{{var_name}}}"
-                        # Remplacer uniquement les placeholders exacts et simples
-                        processed_template = processed_template.replace(placeholder_streamlit, str(var_value))
-
-                    # 2. Convertir les doubles accolades (pour le LLM final) en simples accolades
-                    # Ceci suppose que le template original (venant du JSON) utilisait bien {{...}}
-                    # pour les placeholders destinés au LLM final.
-                    formatted_template_content = processed_template.replace("{{", "{").replace("}}", "}")
-
-                    use_case_title = final_selected_use_case_edition 
-                    generated_prompt = f"Sujet : {use_case_title}\n{formatted_template_content}"
-                    st.session_state.active_generated_prompt = generated_prompt
-                    st.success("Prompt généré avec succès!")
-                    st.balloons()
-                    current_prompt_config["usage_count"] = current_prompt_config.get("usage_count", 0) + 1
-                    current_prompt_config["updated_at"] = datetime.now().isoformat()
-                    save_editable_prompts_to_gist()
+                    generated_prompt, from_render_cache = RENDER_CACHE.render(current_prompt_config["id"], final_selected_use_case_edition, generation_template(current_prompt_config), gen_form_values)
+                    if st.session_state.active_generated_prompt != generated_prompt:
+                        st.session_state.active_generated_prompt = generated_prompt
+                        st.session_state.pop(f"editable_generated_prompt_output_{uc_widget_key}", None) # Sinon l'éditeur ci-dessous garde l'ancien prompt
+                    if from_render_cache: # Mêmes entrées que la dernière fois : ni recomptage ni sauvegarde
+                        st.success("Prompt généré avec succès! (entrées identiques : non recompté)")
+                    else:
+                        st.success("Prompt généré avec succès!")
+                        st.balloons()
+                        current_prompt_config["usage_count"] = current_prompt_config.get("usage_count", 0) + 1
+                        save_use_case_if_changed(final_selected_family_edition, final_selected_use_case_edition)
+                        metrics.GENERATIONS.inc(family=final_selected_family_edition, use_case=final_selected_use_case_edition)
 
                 except Exception as e: # Garder un catch-all pour les erreurs imprévues
                     st.error(f"Erreur inattendue lors de la génération du prompt : {e}") # pragma: no cover
-                    st.session_state.active_generated_prompt = f"ERREUR INATTENDUE - TEMPLATE ORIGINAL :\n---\n{prompt_template_content}" # pragma: no cover
+                    st.session_state.active_generated_prompt = f"ERREUR INATTENDUE - TEMPLATE ORIGINAL :\n---\n{current_prompt_config.get('template', '')}" # pragma: no cover
         st.markdown("---")
         if st.session_state.active_generated_prompt:
             st.subheader("✅ Prompt Généré (éditable):")
-            edited_prompt_value = st.text_area("Prompt:", value=st.session_state.active_generated_prompt, height=200, key=f"editable_generated_prompt_output_{final_selected_family_edition}_{final_selected_use_case_edition}", label_visibility="collapsed")
+            edited_prompt_value = st.text_area("Prompt:", value=st.session_state.active_generated_prompt, height=200, key=f"editable_generated_prompt_output_{uc_widget_key}", label_visibility="collapsed")
             if edited_prompt_value != st.session_state.active_generated_prompt: 
                 st.session_state.active_generated_prompt = edited_prompt_value # pragma: no cover
             col_caption, col_indicator = st.columns([1.8, 0.2]) # Ajustez les proportions si nécessaire
@@ -1014,6 +1653,10 @@ elif st.session_state.view_mode == "edit":
 
             if st.session_state.active_generated_prompt:
                 st.code(st.session_state.active_generated_prompt, language='markdown', line_numbers=True)
+                render_token_usage(gen_form_values)
+                render_full_prompt_download(current_prompt_config["id"])
+                render_llm_execution(current_prompt_config["id"])
+                render_context_window_check(current_prompt_config["id"], final_selected_use_case_edition, generation_template(current_prompt_config), gen_form_values)
             else:
                 st.markdown("*Aucun prompt généré à afficher.*")
         
@@ -1025,18 +1668,18 @@ elif st.session_state.view_mode == "edit":
         if st.session_state.confirming_delete_details and st.session_state.confirming_delete_details["family"] == final_selected_family_edition and st.session_state.confirming_delete_details["use_case"] == final_selected_use_case_edition:
             details = st.session_state.confirming_delete_details; st.warning(f"Supprimer '{details['use_case']}' de '{details['family']}' ? Action irréversible.")
             c1_del_uc, c2_del_uc, _ = st.columns([1,1,3])
-            if c1_del_uc.button(f"Oui, supprimer '{details['use_case']}'", key=f"del_yes_{details['family']}_{details['use_case']}", type="primary"):
+            if c1_del_uc.button(f"Oui, supprimer '{details['use_case']}'", key=f"del_yes_{uc_widget_key}", type="primary"):
                 deleted_uc_name_for_msg = details['use_case']; deleted_uc_fam_for_msg = details['family']; del st.session_state.editable_prompts[details["family"]][details["use_case"]]; save_editable_prompts_to_gist(); st.success(f"'{deleted_uc_name_for_msg}' supprimé de '{deleted_uc_fam_for_msg}'.")
                 st.session_state.confirming_delete_details = None; st.session_state.force_select_family_name = deleted_uc_fam_for_msg; st.session_state.force_select_use_case_name = None 
                 if st.session_state.editing_variable_info and st.session_state.editing_variable_info.get("family") == deleted_uc_fam_for_msg and st.session_state.editing_variable_info.get("use_case") == deleted_uc_name_for_msg: st.session_state.editing_variable_info = None # pragma: no cover
                 st.session_state.active_generated_prompt = ""; st.session_state.variable_type_to_create = None; st.session_state.view_mode = "edit"; st.rerun()
-            if c2_del_uc.button("Non, annuler", key=f"del_no_{details['family']}_{details['use_case']}"): st.session_state.confirming_delete_details = None; st.rerun() 
+            if c2_del_uc.button("Non, annuler", key=f"del_no_{uc_widget_key}"): st.session_state.confirming_delete_details = None; st.rerun() 
             st.markdown("---") 
         should_expand_config = st.session_state.get('go_to_config_section', False)
         with st.expander(f"⚙️ Paramétrage du Prompt: {final_selected_use_case_edition}", expanded=should_expand_config):
             st.subheader("Template du Prompt")
-            safe_family_key_part = str(final_selected_family_edition).replace(' ', '_').replace('.', '_').replace('{', '_').replace('}', '_').replace('(', '_').replace(')', '_'); safe_uc_key_part = str(final_selected_use_case_edition).replace(' ', '_').replace('.', '_').replace('{', '_').replace('}', '_').replace('(', '_').replace(')', '_')
-            template_text_area_key = f"template_text_area_{safe_family_key_part}_{safe_uc_key_part}"; new_tpl = st.text_area("Template:", value=current_prompt_config.get('template', ''), height=200, key=template_text_area_key)
+            template_text_area_key = f"template_text_area_{uc_widget_key}"; new_tpl = st.text_area("Template:", value=current_prompt_config.get('template', ''), height=200, key=template_text_area_key)
+            render_template_lint({**current_prompt_config, "template": new_tpl})
             st.markdown("""<style> div[data-testid="stExpander"] div[data-testid="stCodeBlock"] { margin-top: 0.1rem !important; margin-bottom: 0.15rem !important; padding-top: 0.1rem !important; padding-bottom: 0.1rem !important; } div[data-testid="stExpander"] div[data-testid="stCodeBlock"] pre { padding-top: 0.2rem !important; padding-bottom: 0.2rem !important; line-height: 1.1 !important; font-size: 0.85em !important; margin: 0 !important; } </style>""", unsafe_allow_html=True)
             st.markdown("##### Variables disponibles à insérer :"); variables_config = current_prompt_config.get('variables', [])
             if not variables_config: st.caption("Aucune variable définie pour ce prompt. Ajoutez-en ci-dessous.")
@@ -1047,25 +1690,29 @@ elif st.session_state.view_mode == "edit":
                         variable_string_to_display = f"{{{var_info['name']}}}"; target_column = col1 if i % 2 == 0 else col2
                         with target_column: st.code(variable_string_to_display, language=None)
                 st.caption("Survolez une variable ci-dessus et cliquez sur l'icône qui apparaît pour la copier.")
-            save_template_button_key = f"save_template_button_{safe_family_key_part}_{safe_uc_key_part}"
-            if st.button("Sauvegarder Template", key=save_template_button_key): current_prompt_config['template'] = new_tpl; current_prompt_config["updated_at"] = datetime.now().isoformat(); save_editable_prompts_to_gist(); st.success("Template sauvegardé!"); st.rerun()
+            save_template_button_key = f"save_template_button_{uc_widget_key}"
+            if st.button("Sauvegarder Template", key=save_template_button_key):
+                current_prompt_config['template'] = new_tpl
+                if save_use_case_if_changed(final_selected_family_edition, final_selected_use_case_edition): st.success("Template sauvegardé!")
+                else: st.toast("Template inchangé : aucune sauvegarde nécessaire.", icon="ℹ️")
+                st.rerun()
             st.markdown("---"); st.subheader("Variables du Prompt"); current_variables_list = current_prompt_config.get('variables', [])
             if not current_variables_list: st.info("Aucune variable définie.")
             else: pass 
             for idx, var_data in enumerate(list(current_variables_list)): 
-                var_id_for_key = var_data.get('name', f"varidx{idx}").replace(" ", "_"); action_key_prefix = f"var_action_{final_selected_family_edition.replace(' ','_')}_{final_selected_use_case_edition.replace(' ','_')}_{var_id_for_key}"
+                var_id_for_key = var_data.get('name', f"varidx{idx}").replace(" ", "_"); action_key_prefix = f"var_action_{uc_widget_key}_{var_id_for_key}"
                 col_info, col_up, col_down, col_edit, col_delete = st.columns([3, 0.5, 0.5, 0.8, 0.8])
                 with col_info: st.markdown(f"**{idx + 1}. {var_data.get('name', 'N/A')}** ({var_data.get('label', 'N/A')})\n*Type: `{var_data.get('type', 'N/A')}`*")
                 with col_up:
                     disable_up_button = (idx == 0)
-                    if st.button("↑", key=f"{action_key_prefix}_up", help="Monter cette variable", disabled=disable_up_button, use_container_width=True): current_variables_list[idx], current_variables_list[idx-1] = current_variables_list[idx-1], current_variables_list[idx]; current_prompt_config["variables"] = current_variables_list; current_prompt_config["updated_at"] = datetime.now().isoformat(); save_editable_prompts_to_gist(); st.session_state.editing_variable_info = None; st.session_state.variable_type_to_create = None; st.rerun()
+                    if st.button("↑", key=f"{action_key_prefix}_up", help="Monter cette variable", disabled=disable_up_button, use_container_width=True): current_variables_list[idx], current_variables_list[idx-1] = current_variables_list[idx-1], current_variables_list[idx]; current_prompt_config["variables"] = current_variables_list; save_use_case_if_changed(final_selected_family_edition, final_selected_use_case_edition); st.session_state.editing_variable_info = None; st.session_state.variable_type_to_create = None; st.rerun()
                 with col_down:
                     disable_down_button = (idx == len(current_variables_list) - 1)
-                    if st.button("↓", key=f"{action_key_prefix}_down", help="Descendre cette variable", disabled=disable_down_button, use_container_width=True): current_variables_list[idx], current_variables_list[idx+1] = current_variables_list[idx+1], current_variables_list[idx]; current_prompt_config["variables"] = current_variables_list; current_prompt_config["updated_at"] = datetime.now().isoformat(); save_editable_prompts_to_gist(); st.session_state.editing_variable_info = None; st.session_state.variable_type_to_create = None; st.rerun()
+                    if st.button("↓", key=f"{action_key_prefix}_down", help="Descendre cette variable", disabled=disable_down_button, use_container_width=True): current_variables_list[idx], current_variables_list[idx+1] = current_variables_list[idx+1], current_variables_list[idx]; current_prompt_config["variables"] = current_variables_list; save_use_case_if_changed(final_selected_family_edition, final_selected_use_case_edition); st.session_state.editing_variable_info = None; st.session_state.variable_type_to_create = None; st.rerun()
                 with col_edit:
                     if st.button("Modifier", key=f"{action_key_prefix}_edit", use_container_width=True): st.session_state.editing_variable_info = { "family": final_selected_family_edition, "use_case": final_selected_use_case_edition, "index": idx, "data": copy.deepcopy(var_data) }; st.session_state.variable_type_to_create = var_data.get('type'); st.rerun()
                 with col_delete:
-                    if st.button("Suppr.", key=f"{action_key_prefix}_delete", type="secondary", use_container_width=True): variable_name_to_delete = current_variables_list.pop(idx).get('name', 'Variable inconnue'); current_prompt_config["variables"] = current_variables_list; current_prompt_config["updated_at"] = datetime.now().isoformat(); save_editable_prompts_to_gist(); st.success(f"Variable '{variable_name_to_delete}' supprimée."); st.session_state.editing_variable_info = None; st.session_state.variable_type_to_create = None; st.rerun()
+                    if st.button("Suppr.", key=f"{action_key_prefix}_delete", type="secondary", use_container_width=True): variable_name_to_delete = current_variables_list.pop(idx).get('name', 'Variable inconnue'); current_prompt_config["variables"] = current_variables_list; save_use_case_if_changed(final_selected_family_edition, final_selected_use_case_edition); st.success(f"Variable '{variable_name_to_delete}' supprimée."); st.session_state.editing_variable_info = None; st.session_state.variable_type_to_create = None; st.rerun()
             st.markdown("---"); st.subheader("Ajouter une Variable"); is_editing_var = False; variable_data_for_form = {"name": "", "label": "", "type": "", "options": "", "default": ""} 
             if st.session_state.editing_variable_info and st.session_state.editing_variable_info.get("family") == final_selected_family_edition and st.session_state.editing_variable_info.get("use_case") == final_selected_use_case_edition:
                 edit_var_idx = st.session_state.editing_variable_info["index"]
@@ -1080,7 +1727,7 @@ elif st.session_state.view_mode == "edit":
             if not is_editing_var and st.session_state.variable_type_to_create is None:
                 st.markdown("##### 1. Choisissez le type de variable à créer :"); variable_types_map = { "Zone de texte (courte)": "text_input", "Liste choix": "selectbox", "Date": "date_input", "Nombre": "number_input", "Zone de texte (longue)": "text_area" }; num_type_buttons = len(variable_types_map); cols_type_buttons = st.columns(min(num_type_buttons, 5)); button_idx = 0
                 for btn_label, type_val in variable_types_map.items():
-                    if cols_type_buttons[button_idx % len(cols_type_buttons)].button(btn_label, key=f"btn_type_{type_val}_{final_selected_use_case_edition.replace(' ','_')}", use_container_width=True): st.session_state.variable_type_to_create = type_val; st.rerun()
+                    if cols_type_buttons[button_idx % len(cols_type_buttons)].button(btn_label, key=f"btn_type_{type_val}_{uc_widget_key}", use_container_width=True): st.session_state.variable_type_to_create = type_val; st.rerun()
                     button_idx += 1
                 st.markdown("---")
             if st.session_state.variable_type_to_create:
@@ -1094,7 +1741,7 @@ elif st.session_state.view_mode == "edit":
                 st.markdown(f"##### 2. Configurez la variable")
 
                 form_key_suffix = f"_edit_{st.session_state.editing_variable_info['index']}" if is_editing_var and st.session_state.editing_variable_info else "_create"
-                form_var_specific_key = f"form_var_{current_type_for_form}_{final_selected_use_case_edition.replace(' ','_')}{form_key_suffix}"
+                form_var_specific_key = f"form_var_{current_type_for_form}_{uc_widget_key}{form_key_suffix}"
 
                 # --- DÉBUT DU FORMULAIRE ---
                 with st.form(key=form_var_specific_key, clear_on_submit=(not is_editing_var)): 
@@ -1169,7 +1816,7 @@ elif st.session_state.view_mode == "edit":
                                 if var_name_val_submit in existing_var_names_in_uc: st.error(f"Une variable avec le nom technique '{var_name_val_submit}' existe déjà pour ce cas d'usage."); can_proceed_with_save = False # pragma: no cover
                                 else: target_vars_list.append(new_var_data_to_submit); st.success(f"Variable '{var_name_val_submit}' ajoutée avec succès.")
                             if can_proceed_with_save:
-                                current_prompt_config["variables"] = target_vars_list; current_prompt_config["updated_at"] = datetime.now().isoformat(); save_editable_prompts_to_gist()
+                                current_prompt_config["variables"] = target_vars_list; save_use_case_if_changed(final_selected_family_edition, final_selected_use_case_edition)
                                 if not is_editing_var: st.session_state.variable_type_to_create = None
                                 st.rerun()
                 # --- FIN DU BLOC st.form(...) ---
@@ -1186,14 +1833,46 @@ elif st.session_state.view_mode == "edit":
                         st.session_state.editing_variable_info = None 
                     st.rerun()
             st.markdown("---"); st.subheader("🏷️ Tags"); current_tags_str = ", ".join(current_prompt_config.get("tags", []))
-            new_tags_str_input = st.text_input("Tags (séparés par des virgules):", value=current_tags_str, key=f"tags_input_{final_selected_family_edition}_{final_selected_use_case_edition}")
-            if st.button("Sauvegarder Tags", key=f"save_tags_btn_{final_selected_family_edition}_{final_selected_use_case_edition}"): current_prompt_config["tags"] = sorted(list(set(t.strip() for t in new_tags_str_input.split(',') if t.strip()))); current_prompt_config["updated_at"] = datetime.now().isoformat(); save_editable_prompts_to_gist(); st.success("Tags sauvegardés!"); st.rerun()
+            new_tags_str_input = st.text_input("Tags (séparés par des virgules):", value=current_tags_str, key=f"tags_input_{uc_widget_key}")
+            if st.button("Sauvegarder Tags", key=f"save_tags_btn_{uc_widget_key}"):
+                current_prompt_config["tags"] = sorted(list(set(t.strip() for t in new_tags_str_input.split(',') if t.strip())))
+                if save_use_case_if_changed(final_selected_family_edition, final_selected_use_case_edition): st.success("Tags sauvegardés!")
+                else: st.toast("Tags inchangés : aucune sauvegarde nécessaire.", icon="ℹ️")
+                st.rerun()
             # --- FIN DU BLOC if st.session_state.variable_type_to_create: ---
 
             st.markdown("---")
             st.subheader("Actions sur le Cas d'Usage")
 
-            if st.session_state.duplicating_use_case_details and \
+            if st.session_state.moving_use_case_details and st.session_state.moving_use_case_details["id"] == uc_widget_key:
+                st.markdown(f"#### Renommer / déplacer '{final_selected_use_case_edition}' (depuis: {final_selected_family_edition})")
+                with st.form(key=f"form_move_uc_{uc_widget_key}"):
+                    available_families_list = list(st.session_state.editable_prompts.keys())
+                    selected_target_family_for_move = st.selectbox("Métier de destination :", options=available_families_list,
+                                                                   index=available_families_list.index(final_selected_family_edition), key=f"target_family_move_select_{uc_widget_key}")
+                    moved_uc_name_input = st.text_input("Nom du cas d'usage :", value=final_selected_use_case_edition, key=f"move_name_input_{uc_widget_key}")
+                    if st.form_submit_button("✅ Confirmer", use_container_width=True):
+                        moved_uc_name_val = moved_uc_name_input.strip()
+                        if not moved_uc_name_val:
+                            st.error("Le nom du cas d'usage ne peut pas être vide.")
+                        elif (selected_target_family_for_move, moved_uc_name_val) == (final_selected_family_edition, final_selected_use_case_edition):
+                            st.info("Le nom et le métier sont identiques aux actuels.")
+                        elif moved_uc_name_val in st.session_state.editable_prompts.get(selected_target_family_for_move, {}):
+                            st.error(f"Un cas d'usage nommé '{moved_uc_name_val}' existe déjà dans le métier '{selected_target_family_for_move}'.")
+                        else:
+                            moved_location = rename_or_move_use_case(uc_widget_key, selected_target_family_for_move, moved_uc_name_val)
+                            st.session_state.moving_use_case_details = None
+                            if moved_location:
+                                st.toast(f"'{final_selected_use_case_edition}' est maintenant '{moved_location[1]}' dans le métier '{moved_location[0]}'.", icon="✏️")
+                                st.session_state.force_select_family_name, st.session_state.force_select_use_case_name = moved_location
+                            st.session_state.variable_type_to_create = None
+                            st.session_state.editing_variable_info = None # Repère le cas d'usage par son ancien nom
+                            st.session_state.go_to_config_section = True
+                            st.rerun()
+                if st.button("❌ Annuler", key=f"cancel_move_uc_{uc_widget_key}", use_container_width=True):
+                    st.session_state.moving_use_case_details = None
+                    st.rerun()
+            elif st.session_state.duplicating_use_case_details and \
                st.session_state.duplicating_use_case_details["family"] == final_selected_family_edition and \
                st.session_state.duplicating_use_case_details["use_case"] == final_selected_use_case_edition:
 
@@ -1201,7 +1880,7 @@ elif st.session_state.view_mode == "edit":
                 original_family_name_for_dup = st.session_state.duplicating_use_case_details["family"] # Famille d'origine
                 st.markdown(f"#### Dupliquer '{original_uc_name_for_dup_form}' (depuis: {original_family_name_for_dup})")
 
-                form_key_duplicate = f"form_duplicate_name_{original_family_name_for_dup.replace(' ','_')}_{original_uc_name_for_dup_form.replace(' ','_')}"
+                form_key_duplicate = f"form_duplicate_name_{uc_widget_key}"
                 with st.form(key=form_key_duplicate):
                     available_families_list = list(st.session_state.editable_prompts.keys())
                     try:
@@ -1244,7 +1923,7 @@ elif st.session_state.view_mode == "edit":
                             st.error(f"Un cas d'usage nommé '{new_uc_name_val_from_form}' existe déjà dans la famille '{target_family_on_submit}'.")
                         else:
                             # current_prompt_config est la config du cas d'usage original
-                            st.session_state.editable_prompts[target_family_on_submit][new_uc_name_val_from_form] = copy.deepcopy(current_prompt_config)
+                            st.session_state.editable_prompts[target_family_on_submit][new_uc_name_val_from_form] = assign_new_use_case_id(copy.deepcopy(current_prompt_config))
                             now_iso_dup_create, now_iso_dup_update = get_default_dates()
                             st.session_state.editable_prompts[target_family_on_submit][new_uc_name_val_from_form]["created_at"] = now_iso_dup_create
                             st.session_state.editable_prompts[target_family_on_submit][new_uc_name_val_from_form]["updated_at"] = now_iso_dup_update
@@ -1261,15 +1940,15 @@ elif st.session_state.view_mode == "edit":
                             st.session_state.go_to_config_section = True
                             st.rerun()
 
-                cancel_key_duplicate = f"cancel_dup_process_{original_family_name_for_dup.replace(' ','_')}_{original_uc_name_for_dup_form.replace(' ','_')}"
+                cancel_key_duplicate = f"cancel_dup_process_{uc_widget_key}"
                 if st.button("❌ Annuler la Duplication", key=cancel_key_duplicate, use_container_width=True):
                     st.session_state.duplicating_use_case_details = None
                     # st.session_state.go_to_config_section = True # On s'assure que l'expandeur reste ouvert même en annulant
                     st.rerun()
             else: 
-                action_cols_manage = st.columns(2)
+                action_cols_manage = st.columns(3)
                 with action_cols_manage[0]: 
-                    dup_key_init = f"initiate_dup_uc_btn_{final_selected_family_edition.replace(' ','_')}_{final_selected_use_case_edition.replace(' ','_')}"
+                    dup_key_init = f"initiate_dup_uc_btn_{uc_widget_key}"
                     if st.button("🔄 Dupliquer ce Cas d'Usage", key=dup_key_init, use_container_width=True):
                         st.session_state.duplicating_use_case_details = {
                             "family": final_selected_family_edition,
@@ -1278,8 +1957,14 @@ elif st.session_state.view_mode == "edit":
                         st.session_state.go_to_config_section = True
                         st.rerun()
 
-                with action_cols_manage[1]: 
-                    del_uc_key_exp_main = f"del_uc_btn_exp_main_{final_selected_family_edition.replace(' ','_')}_{final_selected_use_case_edition.replace(' ','_')}"
+                with action_cols_manage[1]:
+                    if st.button("✏️ Renommer / déplacer", key=f"initiate_move_uc_btn_{uc_widget_key}", use_container_width=True):
+                        st.session_state.moving_use_case_details = {"id": uc_widget_key}
+                        st.session_state.go_to_config_section = True
+                        st.rerun()
+
+                with action_cols_manage[2]: 
+                    del_uc_key_exp_main = f"del_uc_btn_exp_main_{uc_widget_key}"
                     is_confirming_this_uc_delete_main = bool(st.session_state.confirming_delete_details and \
                                                         st.session_state.confirming_delete_details.get("family") == final_selected_family_edition and \
                                                         st.session_state.confirming_delete_details.get("use_case") == final_selected_use_case_edition)
@@ -1289,6 +1974,7 @@ elif st.session_state.view_mode == "edit":
 
             if st.session_state.get('go_to_config_section'): 
                 st.session_state.go_to_config_section = False 
+        render_evaluation_panel(final_selected_family_edition, final_selected_use_case_edition, current_prompt_config, uc_widget_key)
     else:
         if not final_selected_family_edition: 
             st.info("Veuillez sélectionner un métier dans la barre latérale (onglet Édition) pour commencer.")
@@ -1338,52 +2024,7 @@ elif st.session_state.view_mode == "inject_manual":
                         if not isinstance(injected_data, dict): 
                             st.error("Le JSON fourni doit être un dictionnaire (objet JSON).")
                         else:
-                            target_family_name = st.session_state.injection_selected_family
-                            if target_family_name not in st.session_state.editable_prompts: 
-                                st.error(f"Le métier de destination '{target_family_name}' n'existe plus ou n'a pas été correctement sélectionnée.") 
-                            else:
-                                family_prompts = st.session_state.editable_prompts[target_family_name]
-                                successful_injections = []
-                                failed_injections = []
-                                first_new_uc_name = None
-                                for uc_name, uc_config_json in injected_data.items():
-                                    uc_name_stripped = uc_name.strip()
-                                    if not uc_name_stripped: 
-                                        failed_injections.append(f"Nom de cas d'usage vide ignoré.")
-                                        continue
-                                    if not isinstance(uc_config_json, dict) or "template" not in uc_config_json: 
-                                        failed_injections.append(f"'{uc_name_stripped}': Configuration invalide ou template manquant.")
-                                        continue
-                                    if uc_name_stripped in family_prompts: 
-                                        st.warning(f"Le cas d'usage '{uc_name_stripped}' existe déjà dans le métier '{target_family_name}'. Il a été ignoré.")
-                                        failed_injections.append(f"'{uc_name_stripped}': Existe déjà, ignoré.")
-                                        continue
-
-                                    prepared_uc_config = _prepare_newly_injected_use_case_config(uc_config_json)
-
-                                    if not prepared_uc_config.get("template"): 
-                                        failed_injections.append(f"'{uc_name_stripped}': Template invalide après traitement.")
-                                        continue
-                                    family_prompts[uc_name_stripped] = prepared_uc_config
-                                    successful_injections.append(uc_name_stripped)
-                                    if first_new_uc_name is None: 
-                                        first_new_uc_name = uc_name_stripped
-                                if successful_injections:
-                                    save_editable_prompts_to_gist()
-                                    st.success(f"{len(successful_injections)} cas d'usage injectés avec succès dans '{target_family_name}': {', '.join(successful_injections)}")
-                                    st.session_state.injection_json_text = "" 
-                                    if first_new_uc_name: 
-                                        st.session_state.view_mode = "edit"
-                                        st.session_state.force_select_family_name = target_family_name
-                                        st.session_state.force_select_use_case_name = first_new_uc_name
-                                        st.session_state.go_to_config_section = True
-                                        st.session_state.active_generated_prompt = "" # <--- AJOUTEZ CETTE LIGNE ICI
-                                        st.rerun()
-                                if failed_injections:
-                                    for fail_msg in failed_injections: 
-                                        st.error(f"Échec d'injection : {fail_msg}")
-                                if not successful_injections and not failed_injections: 
-                                    st.info("Aucun cas d'usage n'a été trouvé dans le JSON fourni ou tous étaient vides/invalides.")
+                            inject_use_cases(st.session_state.injection_selected_family, injected_data)
                     except json.JSONDecodeError as e: 
                         st.error(f"Erreur de parsing JSON : {e}")
                     except Exception as e: 
@@ -1517,6 +2158,7 @@ elif st.session_state.view_mode == "assistant_creation": # Cette vue gère maint
         st.code(st.session_state.generated_meta_prompt_for_llm, language='markdown', line_numbers=True)
         st.caption("<span style='color:gray; font-size:0.9em;'>Utilisez l'icône en haut à droite du bloc de code pour copier l'instruction.</span>", unsafe_allow_html=True)
         st.markdown("---")
+        render_assistant_auto_injection()
         st.info("Une fois que LaPoste GPT (ou votre LLM externe) a généré le JSON basé sur cette instruction, copiez ce JSON et utilisez le bouton \"💉 Injecter JSON Manuellement\" (disponible aussi dans l'onglet Assistant du menu) pour l'ajouter à votre atelier.")
         if st.button("💉 Injecter JSON Manuellement", key="prepare_inject_from_assistant_unified_btn", use_container_width=True, type="primary"):
             st.session_state.view_mode = "inject_manual"
@@ -1530,6 +2172,12 @@ elif st.session_state.view_mode == "assistant_creation": # Cette vue gère maint
         st.session_state.view_mode = "library" if list(st.session_state.editable_prompts.keys()) else "edit"
         st.rerun()
 
+perf_spans.end(view_span_name)
+
 # --- Sidebar Footer ---
 st.sidebar.markdown("---")
 st.sidebar.info(f"Générateur v3.3.6 - © {CURRENT_YEAR} La Poste (démo)")
+
+account_session_memory()
+render_perf_debug_panel()
+perf_spans.end(perf_spans.RERUN_SPAN)
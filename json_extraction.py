@@ -0,0 +1,86 @@
+"""Incremental extraction of the JSON object an LLM returns inside its answer.
+
+The assistant meta-prompts (``prompt_creation_template.md``,
+``prompt_improvement_template.md``) ask for one JSON object, which models
+surround with a sentence and usually a ```json fence. ``JSONObjectExtractor``
+is fed the streamed answer piece by piece: each character is scanned once
+(brace depth, string and escape state), so the object is parsed as soon as its
+closing brace arrives, without re-parsing the growing answer at each refresh.
+Braces inside JSON strings (``{variable}`` placeholders in templates) do not
+count. ``finish`` is a slower fallback for the complete answer when the fast
+path found nothing (e.g. an unbalanced brace in the prose before the JSON).
+"""
+import json
+import re
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
+
+
+class JSONObjectExtractor:
+    def __init__(self):
+        self._chars = []  # Objet candidat en cours de lecture
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.result = None
+        self.errors = []  # Candidats équilibrés mais invalides (JSON cassé, accolades dans le texte)
+
+    def feed(self, text):
+        """Consume the next piece of the answer; return the object once complete, else None."""
+        if self.result is not None:
+            return self.result
+        for char in text:
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                    self._chars = ["{"]
+                continue
+            self._chars.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._accept("".join(self._chars)):
+                    return self.result
+        return None
+
+    def _accept(self, candidate):
+        try:
+            value = json.loads(candidate)
+        except ValueError as error:
+            self.errors.append(str(error))
+            return False
+        if not isinstance(value, dict):
+            return False
+        self.result = value
+        return True
+
+    def finish(self, full_text):
+        """Last attempt on the complete answer: fenced blocks first, then every ``{`` position."""
+        if self.result is not None:
+            return self.result
+        decoder = json.JSONDecoder()
+        candidates = [match.group(1) for match in _FENCE_RE.finditer(full_text)]
+        for candidate in candidates:
+            if self._accept(candidate):
+                return self.result
+        position = full_text.find("{")
+        while position != -1:
+            try:
+                value, _ = decoder.raw_decode(full_text, position)
+                if isinstance(value, dict):
+                    self.result = value
+                    return value
+            except ValueError:
+                pass
+            position = full_text.find("{", position + 1)
+        return None
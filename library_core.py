@@ -0,0 +1,188 @@
+"""Library data helpers shared by both apps: (de)serialization of the Gist
+format, library search/tag filters and template substitution.
+
+These are the hot paths timed by ``benchmarks/bench_library_core.py``.
+"""
+import copy
+from datetime import datetime, date
+
+import streamlit as st
+
+from library_ids import ensure_use_case_ids
+
+
+def parse_default_value(value_str, var_type):
+    if not value_str:
+        if var_type == "number_input": return 0.0
+        if var_type == "date_input": return datetime.now().date()
+        return ""
+    if var_type == "number_input":
+        try: return float(value_str)
+        except ValueError: return 0.0
+    elif var_type == "date_input":
+        try: return datetime.strptime(value_str, "%Y-%m-%d").date()
+        except (ValueError, TypeError):
+            return value_str if isinstance(value_str, date) else datetime.now().date()
+    return value_str
+
+def _preprocess_for_saving(data_to_save):
+    processed_data = copy.deepcopy(data_to_save)
+    for family_name in list(processed_data.keys()):
+        use_cases_in_family = processed_data[family_name]
+        if not isinstance(use_cases_in_family, dict): # pragma: no cover
+            st.error(f"Données corrompues (famille non-dict): '{family_name}'. Suppression.")
+            del processed_data[family_name]
+            continue
+        for use_case_name in list(use_cases_in_family.keys()):
+            config = use_cases_in_family[use_case_name]
+            if not isinstance(config, dict): # pragma: no cover
+                st.error(f"Données corrompues (cas d'usage non-dict): '{use_case_name}' dans '{family_name}'. Suppression.")
+                del processed_data[family_name][use_case_name]
+                continue
+            if not isinstance(config.get("variables"), list):
+                config["variables"] = []
+            for var_info in config.get("variables", []):
+                if isinstance(var_info, dict):
+                    if var_info.get("type") == "date_input" and isinstance(var_info.get("default"), date):
+                        var_info["default"] = var_info["default"].strftime("%Y-%m-%d")
+                    if var_info.get("type") == "number_input":
+                        if "default" in var_info and var_info["default"] is not None:
+                            var_info["default"] = float(var_info["default"])
+                        if "min_value" in var_info and var_info["min_value"] is not None:
+                            var_info["min_value"] = float(var_info["min_value"])
+                        if "max_value" in var_info and var_info["max_value"] is not None:
+                            var_info["max_value"] = float(var_info["max_value"])
+                        if "step" in var_info and var_info["step"] is not None:
+                            var_info["step"] = float(var_info["step"])
+                        else: 
+                            var_info["step"] = 1.0
+                    # Ensure height for text_area is an int if it exists (it should be already from other functions)
+                    if var_info.get("type") == "text_area":
+                        if "height" in var_info and var_info["height"] is not None:
+                            try:
+                                var_info["height"] = int(var_info["height"])
+                            except (ValueError, TypeError): # pragma: no cover
+                                var_info["height"] = 100 # Should not happen if data is clean
+
+            config.setdefault("tags", [])
+            if "is_favorite" in config: # pragma: no cover
+                del config["is_favorite"]
+            config.setdefault("usage_count", 0)
+            config.setdefault("created_at", datetime.now().isoformat())
+            config.setdefault("updated_at", datetime.now().isoformat())
+    ensure_use_case_ids(processed_data)
+    return processed_data
+
+def _postprocess_after_loading(loaded_data): # User's trusted version + height fix
+    processed_data = copy.deepcopy(loaded_data)
+    now_iso = datetime.now().isoformat()
+    for family_name in list(processed_data.keys()):
+        use_cases_in_family = processed_data[family_name]
+        if not isinstance(use_cases_in_family, dict): # pragma: no cover
+            st.warning(f"Données corrompues (famille non-dict): '{family_name}'. Ignorée.")
+            del processed_data[family_name]
+            continue
+        for use_case_name in list(use_cases_in_family.keys()):
+            config = use_cases_in_family[use_case_name]
+            if not isinstance(config, dict): # pragma: no cover
+                st.warning(f"Données corrompues (cas d'usage non-dict): '{use_case_name}' dans '{family_name}'. Ignoré.")
+                del processed_data[family_name][use_case_name]
+                continue
+            if not isinstance(config.get("variables"), list):
+                config["variables"] = []
+            for var_info in config.get("variables", []):
+                if isinstance(var_info, dict):
+                    if var_info.get("type") == "date_input" and isinstance(var_info.get("default"), str):
+                        try:
+                            var_info["default"] = datetime.strptime(var_info["default"], "%Y-%m-%d").date()
+                        except ValueError:
+                            var_info["default"] = datetime.now().date()
+                    if var_info.get("type") == "number_input":
+                        if "default" in var_info and var_info["default"] is not None:
+                            var_info["default"] = float(var_info["default"])
+                        else: 
+                            var_info["default"] = 0.0
+                        if "min_value" in var_info and var_info["min_value"] is not None:
+                            var_info["min_value"] = float(var_info["min_value"])
+                        if "max_value" in var_info and var_info["max_value"] is not None:
+                            var_info["max_value"] = float(var_info["max_value"])
+                        if "step" in var_info and var_info["step"] is not None:
+                            var_info["step"] = float(var_info["step"])
+                        else: 
+                            var_info["step"] = 1.0
+
+                    # --- ADDED ROBUST HEIGHT VALIDATION ---
+                    if var_info.get("type") == "text_area":
+                        height_val = var_info.get("height")
+                        if height_val is not None:
+                            try:
+                                h = int(height_val)
+                                if h >= 68:
+                                    var_info["height"] = h
+                                else:
+                                    var_info["height"] = 68 # Set to minimum if too small
+                                    # st.warning(f"Hauteur pour '{var_info.get('name', 'N/A')}' ajustée à 68px (minimum).")
+                            except (ValueError, TypeError):
+                                var_info["height"] = 100 # Default if invalid
+                        # If height_val was None, 'height' key might not be in var_info, or it's None.
+                        # The st.text_area widget call will handle None by using its internal default.
+                        # Or we can explicitly set a default:
+                        # else:
+                        #     var_info["height"] = 100 # Default if not present
+
+            config.setdefault("tags", [])
+            if "is_favorite" in config: # pragma: no cover
+                del config["is_favorite"]
+            config.setdefault("usage_count", 0)
+            config.setdefault("created_at", now_iso)
+            config.setdefault("updated_at", now_iso)
+            if not isinstance(config.get("tags"), list): config["tags"] = []
+    ensure_use_case_ids(processed_data) # IDs stables (cf. library_ids.py), déterministes pour les anciennes données
+    return processed_data
+
+
+# --- Recherche et filtres de la bibliothèque ---
+def collect_all_tags(library):
+    """Sorted list of every tag used in the library."""
+    return sorted({tag for use_cases in library.values() for config in use_cases.values() for tag in config.get("tags", [])})
+
+def use_case_matches(use_case_name, config, search_term, selected_tags):
+    """``search_term`` must already be stripped and lowercased; every selected tag is required."""
+    if selected_tags:
+        use_case_tags = config.get("tags", [])
+        if not all(tag in use_case_tags for tag in selected_tags):
+            return False
+    if not search_term:
+        return True
+    return (search_term in use_case_name.lower() or
+            search_term in config.get("template", "").lower() or
+            any(search_term in var.get("name", "").lower() or search_term in var.get("label", "").lower()
+                for var in config.get("variables", [])))
+
+def filter_use_cases(use_cases, search_term, selected_tags):
+    """Return the ``{name: config}`` subset matching the library search box and tag filter."""
+    search_term = (search_term or "").strip().lower()
+    if not search_term and not selected_tags:
+        return dict(use_cases)
+    return {name: config for name, config in use_cases.items() if use_case_matches(name, config, search_term, selected_tags)}
+
+# --- Génération : remplissage du template ---
+def format_value_for_template(value):
+    if isinstance(value, date):
+        return value.strftime("%d/%m/%Y")
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else f"{value:.2f}"  # 50.0 -> "50", 0.125 -> "0.13"
+    return str(value)
+
+def format_values_for_template(form_values):
+    """Turn form values into strings; None values are dropped so their placeholders stay as is."""
+    return {name: format_value_for_template(value) for name, value in form_values.items() if value is not None}
+
+def fill_template(template, values):
+    """Replace ``{name}`` placeholders, then turn ``{{...}}`` (meant for the final LLM) into ``{...}``.
+
+    Longer names are replaced first so ``{jour_semaine}`` is not hit by ``{jour}``.
+    """
+    for var_name, var_value in sorted(values.items(), key=lambda item: len(item[0]), reverse=True):
+        template = template.replace(f"{{{var_name}}}", str(var_value))
+    return template.replace("{{", "{").replace("}}", "}")
@@ -0,0 +1,127 @@
+"""Stable IDs for use cases and families, and the ID -> location index.
+
+Use case IDs are stored in the config (``"id"``) and saved to the Gist, so they
+survive renames, moves between families and reloads. Configs saved before IDs
+existed get a deterministic ID derived from their location, so every session
+agrees on it until the next save persists it. Family dicts have no metadata
+slot in the Gist format, so family IDs live in the session's ``LibraryIndex``
+only: they are stable for the lifetime of the session (renames included),
+which is what widget keys need.
+
+Widget keys built from IDs never collide (names like "Note A" / "Note_A"
+used to) and do not change when a family or use case is renamed.
+"""
+import hashlib
+import uuid
+
+USE_CASE_ID_FIELD = "id"
+
+
+def new_use_case_id():
+    return "uc_" + uuid.uuid4().hex[:12]
+
+
+def legacy_use_case_id(family_name, use_case_name):
+    digest = hashlib.sha1(f"{family_name}\x1f{use_case_name}".encode("utf-8")).hexdigest()
+    return "uc_" + digest[:12]
+
+
+def ensure_use_case_ids(library):
+    """Give every use case a unique ID (in place); return how many IDs were assigned."""
+    seen = set()
+    assigned = 0
+    for family_name, use_cases in library.items():
+        if not isinstance(use_cases, dict):
+            continue
+        for use_case_name, config in use_cases.items():
+            if not isinstance(config, dict):
+                continue
+            current = config.get(USE_CASE_ID_FIELD)
+            if not current or current in seen:
+                current = legacy_use_case_id(family_name, use_case_name)
+                if current in seen: # Collision après renommage/copie : ID neuf
+                    current = new_use_case_id()
+                config[USE_CASE_ID_FIELD] = current
+                assigned += 1
+            seen.add(current)
+    return assigned
+
+
+def assign_new_use_case_id(config):
+    """Give a new, duplicated or injected use case its own ID (copies must not share one)."""
+    config[USE_CASE_ID_FIELD] = new_use_case_id()
+    return config
+
+
+class LibraryIndex:
+    """Family name <-> ID and use case ID -> (family, name), kept per session.
+
+    Renames and moves update the library and the index in constant time.
+    Edits made directly on the library (creation, deletion, injection) are
+    picked up lazily: a lookup that misses or finds a stale location rebuilds
+    the use case part of the index once.
+    """
+
+    def __init__(self, library):
+        self._family_ids = {}    # nom du métier -> ID
+        self._family_names = {}  # ID -> nom du métier
+        self.rebuild(library)
+
+    def rebuild(self, library):
+        self._locations = {}  # ID du cas d'usage -> (ID du métier, nom du cas d'usage)
+        for family_name, use_cases in library.items():
+            family_id = self.family_id(family_name)
+            for use_case_name, config in use_cases.items():
+                use_case_id = config.get(USE_CASE_ID_FIELD)
+                if use_case_id:
+                    self._locations[use_case_id] = (family_id, use_case_name)
+
+    def family_id(self, family_name):
+        """ID of the family, assigned on first sight."""
+        family_id = self._family_ids.get(family_name)
+        if family_id is None:
+            family_id = "fam_" + uuid.uuid4().hex[:12]
+            self._family_ids[family_name] = family_id
+            self._family_names[family_id] = family_name
+        return family_id
+
+    def family_name(self, family_id):
+        return self._family_names.get(family_id)
+
+    def _location(self, library, use_case_id):
+        location = self._locations.get(use_case_id)
+        if location is None:
+            return None
+        family_name = self._family_names.get(location[0])
+        config = library.get(family_name, {}).get(location[1])
+        if config is None or config.get(USE_CASE_ID_FIELD) != use_case_id:
+            return None
+        return family_name, location[1]
+
+    def locate(self, library, use_case_id):
+        """``(family_name, use_case_name)`` of a use case ID, or None if it no longer exists."""
+        location = self._location(library, use_case_id)
+        if location is None:
+            self.rebuild(library)
+            location = self._location(library, use_case_id)
+        return location
+
+    def rename_family(self, library, old_name, new_name):
+        """Rename a family: its use cases and its ID are kept (the subtree is moved, not copied)."""
+        library[new_name] = library.pop(old_name)
+        family_id = self._family_ids.pop(old_name, None) or self.family_id(new_name)
+        self._family_ids[new_name] = family_id
+        self._family_names[family_id] = new_name
+
+    def rename_use_case(self, library, family_name, old_name, new_name):
+        config = library[family_name].pop(old_name)
+        library[family_name][new_name] = config
+        self._locations[config[USE_CASE_ID_FIELD]] = (self.family_id(family_name), new_name)
+
+    def move_use_case(self, library, use_case_id, target_family, new_name=None):
+        """Move a use case (config, ID and usage counter included) to another family."""
+        family_name, use_case_name = self.locate(library, use_case_id)
+        new_name = new_name or use_case_name
+        library[target_family][new_name] = library[family_name].pop(use_case_name)
+        self._locations[use_case_id] = (self.family_id(target_family), new_name)
+        return target_family, new_name
@@ -0,0 +1,266 @@
+"""Typo-tolerant library search: trigram index over use case names, tags, variables and templates.
+
+Text is folded (case, accents: "Résumé" and "resume" are the same word),
+split into words, stripped of French stop words and reduced by a light French
+stemmer ("contrats", "contrat" -> "contrat"; "résumer", "résumés" -> "resum").
+Two indexes are kept:
+
+* stemmed term -> use cases containing it, with the weight of the best field
+  (``FIELD_WEIGHTS``: a word of the name counts more than one of the template);
+* trigram -> words as written (folded, trigrams padded like ``pg_trgm``), each
+  word pointing to its term, to find the words that look like a query word.
+
+A query word matches its own term, and, from ``MIN_PREFIX_CHARS`` letters, the
+terms of the words it starts ("contr" while typing). A word whose term is not
+indexed at all is taken for a typo: the words sharing enough trigrams with it
+are candidates, kept when their edit distance (transpositions count as one
+edit) leaves a similarity of ``MIN_TYPO_SIMILARITY`` ("contarts" -> "contrats",
+not "contexte"). Words are compared as written because a typo can hide the
+suffix from the stemmer ("reclamtions"). A use case matches when every query word matches one of its
+terms; the score sums, per query word, the best similarity x field weight.
+
+``sync`` keeps the index in step with the library: a use case is re-indexed
+only when its name, template, tags or variables changed (compared by value,
+which is cheap for unchanged strings), so an edit costs the re-indexing of
+one use case.
+"""
+import re
+import unicodedata
+from collections import Counter
+
+FIELD_WEIGHTS = {"name": 3.0, "tags": 2.0, "variables": 1.5, "template": 1.0}
+PREFIX_SIMILARITY = 0.9
+MIN_PREFIX_CHARS = 3
+MIN_CANDIDATE_DICE = 0.3  # Trigrammes communs (coefficient de Dice) pour tester un terme comme correction
+MIN_TYPO_SIMILARITY = 0.75  # 1 - distance d'édition / longueur : une faute sur 4 à 7 lettres, deux à partir de 8
+MAX_CACHED_WORDS = 200000
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# Lettres que la décomposition Unicode ne ramène pas à l'ASCII
+_FOLD_TABLE = str.maketrans({"œ": "oe", "æ": "ae", "ø": "o", "ł": "l", "đ": "d", "ð": "d", "þ": "th"})
+_FOLD_SPECIAL_RE = re.compile("[œæøłđðþ]")
+STOP_WORDS = frozenset("""
+a au aux avec ce ces cet cette d dans de des du elle en est et il ils je l la le les leur leurs lui m ma mais me mes
+n ne nos notre nous on ou par pas pour qu que qui s sa se ses si son sont sur t ta te tes toi ton tu un une vos votre
+vous y
+""".split())
+# Suffixes retirés par le racinisateur (le plus long d'abord), avec le remplacement éventuel
+_SUFFIXES = sorted([
+    ("issements", ""), ("issement", ""), ("ements", ""), ("ement", ""), ("ations", ""), ("ation", ""),
+    ("atrices", ""), ("atrice", ""), ("ateurs", ""), ("ateur", ""), ("ances", ""), ("ance", ""), ("ences", ""),
+    ("ence", ""), ("ites", ""), ("ite", ""), ("ismes", ""), ("isme", ""), ("istes", ""), ("iste", ""),
+    ("euses", ""), ("euse", ""), ("eurs", ""), ("eur", ""), ("ives", ""), ("ive", ""), ("ifs", ""), ("if", ""),
+    ("ables", ""), ("able", ""), ("iques", ""), ("ique", ""), ("aux", "al"), ("ees", ""), ("ee", ""), ("es", ""),
+    ("er", ""), ("ez", ""), ("e", ""), ("s", ""), ("x", ""),
+], key=lambda item: len(item[0]), reverse=True)
+MIN_STEM_CHARS = 3
+
+
+def fold(text):
+    """Case- and accent-insensitive form of ``text`` (ASCII letters and digits kept)."""
+    text = text.casefold()
+    if text.isascii():
+        return text
+    if _FOLD_SPECIAL_RE.search(text):
+        text = text.translate(_FOLD_TABLE)
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def stem(word):
+    """Light French stemmer: one inflectional or derivational suffix removed, stem of 3 letters at least."""
+    if len(word) <= MIN_STEM_CHARS or word.isdigit():
+        return word
+    for suffix, replacement in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_CHARS:
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+_stems = {}  # Mot -> racine ; le vocabulaire d'une bibliothèque est réduit, chaque mot n'est raciné qu'une fois
+
+
+def _cached_stem(word):
+    term = _stems.get(word)
+    if term is None:
+        if len(_stems) >= MAX_CACHED_WORDS:
+            _stems.clear()
+        term = _stems[word] = stem(word)
+    return term
+
+
+def words(text):
+    """Folded words of ``text``, in order, stop words removed (kept when the text has nothing else)."""
+    found = _WORD_RE.findall(fold(text))
+    return [word for word in found if word not in STOP_WORDS] or found
+
+
+def analyze(text):
+    """Stemmed terms of ``text``."""
+    return [_cached_stem(word) for word in words(text)]
+
+
+def trigrams(term):
+    padded = f"  {term} "
+    return frozenset(padded[index:index + 3] for index in range(len(padded) - 2))
+
+
+def edit_similarity(first, second):
+    """1 - optimal string alignment distance / length of the longer string."""
+    if first == second:
+        return 1.0
+    previous_row, row = None, list(range(len(second) + 1))
+    for i, char in enumerate(first, 1):
+        before_previous, previous_row, row = previous_row, row, [i] + [0] * len(second)
+        for j, other in enumerate(second, 1):
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + (char != other))
+            if i > 1 and j > 1 and char == second[j - 2] and first[i - 2] == other:
+                row[j] = min(row[j], before_previous[j - 2] + 1)
+    return 1.0 - row[-1] / max(len(first), len(second))
+
+
+def _indexed_fields(config):
+    """Fields whose change requires re-indexing (copies: the library is edited in place)."""
+    tags, variables = config.get("tags"), config.get("variables")
+    return (config.get("template"), list(tags) if isinstance(tags, list) else tags,
+            [dict(var) if isinstance(var, dict) else var for var in variables] if isinstance(variables, list) else variables)
+
+
+def _unchanged(fields, config):
+    return fields[0] == config.get("template") and fields[1] == config.get("tags") and fields[2] == config.get("variables")
+
+
+class LibrarySearchIndex:
+    """Incrementally updated index of a library ``{family: {use case name: config}}``."""
+
+    def __init__(self):
+        self._fields = {}       # (métier, cas d'usage) -> champs indexés (copie)
+        self._doc_terms = {}    # (métier, cas d'usage) -> {terme: poids}
+        self._postings = {}     # terme -> {(métier, cas d'usage): poids}
+        self._term_words = {}     # terme -> mots (tels qu'écrits, repliés) qui s'y ramènent
+        self._word_terms = {}     # mot -> terme
+        self._trigram_words = {}  # trigramme -> mots
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    @property
+    def term_count(self):
+        return len(self._postings)
+
+    def _add_word(self, word, term):
+        self._word_terms[word] = term
+        self._term_words.setdefault(term, set()).add(word)
+        for gram in trigrams(word):
+            self._trigram_words.setdefault(gram, set()).add(word)
+
+    def _drop_term(self, term):
+        """Forget the words of a term no use case contains any more."""
+        for word in self._term_words.pop(term, ()):
+            del self._word_terms[word]
+            for gram in trigrams(word):
+                grams_words = self._trigram_words[gram]
+                grams_words.discard(word)
+                if not grams_words:
+                    del self._trigram_words[gram]
+
+    def remove(self, key):
+        self._fields.pop(key, None)
+        for term in self._doc_terms.pop(key, {}):
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+                self._drop_term(term)
+
+    def update(self, family, name, config):
+        """(Re-)index one use case."""
+        key = (family, name)
+        self.remove(key)
+        terms = {}
+        fields = (
+            ("name", name), ("tags", " ".join(config.get("tags") or ())),
+            ("variables", " ".join(f"{var.get('name', '')} {var.get('label', '')}" for var in config.get("variables") or [] if isinstance(var, dict))),
+            ("template", config.get("template") or ""),
+        )
+        new_words = {}
+        for field, text in fields:
+            weight = FIELD_WEIGHTS[field]
+            for word in words(text):
+                term = _cached_stem(word)
+                if terms.get(term, 0.0) < weight:
+                    terms[term] = weight
+                if word not in self._word_terms:
+                    new_words[word] = term
+        for term, weight in terms.items():
+            self._postings.setdefault(term, {})[key] = weight
+        for word, term in new_words.items():
+            self._add_word(word, term)
+        self._doc_terms[key] = terms
+        self._fields[key] = _indexed_fields(config)
+
+    def sync(self, library):
+        """Bring the index in line with ``library``; returns the number of use cases (re-)indexed or removed."""
+        changed = 0
+        current = set()
+        for family, use_cases in library.items():
+            for name, config in (use_cases or {}).items():
+                key = (family, name)
+                current.add(key)
+                fields = self._fields.get(key)
+                if fields is None or not _unchanged(fields, config):
+                    self.update(family, name, config)
+                    changed += 1
+        for key in [key for key in self._fields if key not in current]:
+            self.remove(key)
+            changed += 1
+        return changed
+
+    def matching_terms(self, query_word):
+        """{indexed term: similarity} for one folded query word."""
+        query_term = _cached_stem(query_word)
+        matches = {query_term: 1.0} if query_term in self._postings else {}
+        grams = trigrams(query_word)
+        if len(query_word) >= MIN_PREFIX_CHARS:
+            # Un mot qui commence par le mot cherché contient tous ses trigrammes sauf le dernier (« at  »)
+            prefix_grams = grams - {f"{query_word[-2:]} "}
+            candidates = set.intersection(*(self._trigram_words.get(gram, set()) for gram in prefix_grams))
+            for word in candidates:
+                if word.startswith(query_word):
+                    matches.setdefault(self._word_terms[word], PREFIX_SIMILARITY)
+        if matches:
+            return matches
+        shared = Counter()
+        for gram in grams:
+            gram_words = self._trigram_words.get(gram)
+            if gram_words:
+                shared.update(gram_words)
+        for word, count in shared.items():
+            if 2.0 * count / (len(grams) + len(word) + 1) >= MIN_CANDIDATE_DICE: # Un mot de n lettres a au plus n + 1 trigrammes
+                similarity = edit_similarity(query_word, word)
+                term = self._word_terms[word]
+                if similarity >= MIN_TYPO_SIMILARITY and matches.get(term, 0.0) < similarity:
+                    matches[term] = similarity
+        return matches
+
+    def search(self, query, families=None):
+        """[((family, name), score)] matching every word of ``query``, best first.
+
+        ``families``: restrict the results to these families.
+        """
+        scores = None
+        for query_word in dict.fromkeys(words(query)):
+            best = {}
+            for term, similarity in self.matching_terms(query_word).items():
+                for key, weight in self._postings[term].items():
+                    if families is not None and key[0] not in families:
+                        continue
+                    score = similarity * weight
+                    if best.get(key, 0.0) < score:
+                        best[key] = score
+            if scores is None:
+                scores = best
+            else:
+                scores = {key: score + best[key] for key, score in scores.items() if key in best}
+            if not scores:
+                return []
+        return sorted((scores or {}).items(), key=lambda item: (-item[1], item[0]))
@@ -0,0 +1,365 @@
+"""Asyncio client for OpenAI-compatible chat completion endpoints.
+
+The apps only display the generated prompt; with the ``LLM_API_BASE_URL``
+secret set (any server exposing ``POST {base}/chat/completions``, e.g.
+``benchmarks/fake_llm_server.py`` offline), a prompt or a batch of prompts can
+be executed and the answer streamed back.
+
+* HTTP is spoken directly over ``asyncio`` streams (HTTP/1.1, SSE streaming,
+  chunked bodies, https), so a cancelled request closes its socket at once
+  and no extra dependency is needed. Proxies are not supported.
+* One event loop runs in a daemon thread for the whole process
+  (``BACKGROUND_LOOP``); the Streamlit script threads submit work to it and
+  poll an ``LLMJob``. The concurrency bound (semaphore) and the rate limit
+  (token bucket) of a client therefore apply to all sessions together.
+* 429/503 answers are retried after ``Retry-After`` (bounded backoff); other
+  failures end the request with an ``error`` result instead of raising.
+* With a ``response_cache`` (``response_cache.ResponseCache``), a prompt
+  already answered with the same endpoint, model and parameters is served
+  from disk before taking a concurrency slot or a rate-limit token. Lookups
+  and writes run on a single worker thread (``_cache_executor``), so a slow
+  SQLite call never stalls the other streams of the event loop.
+"""
+import asyncio
+import json
+import random
+import ssl
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import metrics
+from response_cache import make_key
+
+DEFAULT_MODEL = "gpt-4o-mini"
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_TIMEOUT_SECONDS = 300.0
+MAX_RETRIES = 3
+RETRYABLE_STATUSES = (429, 502, 503)
+READ_SIZE = 64 * 1024
+
+_cache_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-response-cache")
+
+# status : "ok", "error" ou "cancelled" ; text contient la réponse partielle en cas d'erreur/annulation ; cached : servie par le cache disque
+CompletionResult = namedtuple("CompletionResult", "text status finish_reason latency_s first_token_s error cached", defaults=(False,))
+
+
+class LLMError(Exception):
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """``rate`` requests per second on average, bursts of up to ``capacity``."""
+
+    def __init__(self, rate, capacity=1.0):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock: # Les appelants sont servis dans l'ordre d'arrivée
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# --- HTTP/1.1 minimal sur les streams asyncio ---
+async def _read_headers(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise LLMError("Connexion fermée par le serveur sans réponse.")
+    try:
+        status = int(status_line.split()[1])
+    except (IndexError, ValueError):
+        raise LLMError(f"Réponse HTTP invalide : {status_line[:80]!r}")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            return status, headers
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+async def _iter_body(reader, headers):
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                return
+            yield await reader.readexactly(size)
+            await reader.readexactly(2) # CRLF de fin de chunk
+    elif "content-length" in headers:
+        remaining = int(headers["content-length"])
+        while remaining > 0:
+            chunk = await reader.read(min(READ_SIZE, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+    else:
+        while True:
+            chunk = await reader.read(READ_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _retry_after(headers):
+    try:
+        return max(0.0, float(headers.get("retry-after", "")))
+    except ValueError:
+        return None
+
+
+class AsyncLLMClient:
+    """Chat completions on one endpoint, at most ``max_concurrency`` requests in flight.
+
+    Must be used from a single event loop (``BACKGROUND_LOOP`` in the apps).
+    """
+
+    def __init__(self, base_url, api_key=None, model=DEFAULT_MODEL, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, timeout=DEFAULT_TIMEOUT_SECONDS, temperature=None, response_cache=None):
+        self.endpoint = base_url.rstrip("/") + "/chat/completions"
+        parts = urlsplit(self.endpoint)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"URL d'API invalide : {base_url!r}")
+        self._parts = parts
+        self.api_key = api_key
+        self.model = model
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.timeout = float(timeout)
+        self.temperature = temperature
+        self.response_cache = response_cache
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._bucket = TokenBucket(max(0.01, float(requests_per_minute)) / 60.0, capacity=self.max_concurrency)
+
+    def _request_bytes(self, prompt, stream):
+        payload = {"model": self.model, "messages": [{"role": "user", "content": prompt}], "stream": stream}
+        if self.temperature is not None:
+            payload["temperature"] = self.temperature
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        path = self._parts.path + (f"?{self._parts.query}" if self._parts.query else "")
+        head = [
+            f"POST {path} HTTP/1.1", f"Host: {self._parts.netloc}", "Content-Type: application/json",
+            f"Accept: {'text/event-stream' if stream else 'application/json'}", f"Content-Length: {len(body)}",
+            "Connection: close",
+        ]
+        if self.api_key:
+            head.append(f"Authorization: Bearer {self.api_key}")
+        return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+    async def _attempt(self, prompt, on_delta, stream, state):
+        https = self._parts.scheme == "https"
+        reader, writer = await asyncio.open_connection(
+            self._parts.hostname, self._parts.port or (443 if https else 80),
+            ssl=ssl.create_default_context() if https else None,
+        )
+        try:
+            writer.write(self._request_bytes(prompt, stream))
+            await writer.drain()
+            status, headers = await _read_headers(reader)
+            if status != 200:
+                body = b"".join([chunk async for chunk in _iter_body(reader, headers)])
+                raise LLMError(f"HTTP {status} : {body[:300].decode('utf-8', 'replace')}", status, _retry_after(headers))
+            if "text/event-stream" not in headers.get("content-type", ""):
+                data = json.loads(b"".join([chunk async for chunk in _iter_body(reader, headers)]))
+                choice = data["choices"][0]
+                self._emit(choice.get("message", {}).get("content") or "", on_delta, state)
+                state["finish_reason"] = choice.get("finish_reason")
+                return
+            buffer = b""
+            async for chunk in _iter_body(reader, headers):
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    line = line.strip()
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == b"[DONE]":
+                        return
+                    choice = (json.loads(data).get("choices") or [{}])[0]
+                    self._emit((choice.get("delta") or {}).get("content") or "", on_delta, state)
+                    state["finish_reason"] = choice.get("finish_reason") or state["finish_reason"]
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _emit(delta, on_delta, state):
+        if not delta:
+            return
+        if state["first_token_s"] is None:
+            state["first_token_s"] = time.monotonic() - state["started"]
+        state["parts"].append(delta)
+        if on_delta is not None:
+            on_delta(delta)
+
+    def cache_key(self, prompt):
+        params = {} if self.temperature is None else {"temperature": self.temperature}
+        return make_key(self.endpoint, self.model, params, prompt)
+
+    async def complete(self, prompt, on_delta=None, stream=True, use_cache=True):
+        """Run one prompt; ``on_delta(text)`` is called for each streamed piece. Returns a ``CompletionResult``.
+
+        ``use_cache=False`` skips the cache lookup (the fresh answer still replaces the cached one).
+        """
+        state = {"parts": [], "finish_reason": None, "first_token_s": None, "started": time.monotonic()}
+        cache_key = self.cache_key(prompt) if self.response_cache is not None else None
+        if cache_key is not None and use_cache:
+            cached = await asyncio.get_running_loop().run_in_executor(_cache_executor, self.response_cache.get, cache_key)
+            if cached is not None:
+                if on_delta is not None and cached.text:
+                    on_delta(cached.text)
+                latency = time.monotonic() - state["started"]
+                return CompletionResult(cached.text, "ok", cached.finish_reason, latency, latency, None, True)
+
+        def result(status, error=None):
+            latency = time.monotonic() - state["started"]
+            metrics.LLM_REQUESTS.inc(outcome=status)
+            if status == "ok":
+                metrics.LLM_LATENCY.observe(latency, phase="total")
+                if state["first_token_s"] is not None:
+                    metrics.LLM_LATENCY.observe(state["first_token_s"], phase="first_token")
+            return CompletionResult("".join(state["parts"]), status, state["finish_reason"], latency, state["first_token_s"], error)
+
+        async with self._semaphore:
+            metrics.LLM_IN_FLIGHT.inc()
+            try:
+                for attempt in range(MAX_RETRIES + 1):
+                    await self._bucket.acquire()
+                    try:
+                        await asyncio.wait_for(self._attempt(prompt, on_delta, stream, state), self.timeout)
+                        if cache_key is not None and state["finish_reason"] != "length": # Réponse tronquée : pas mise en cache
+                            await asyncio.get_running_loop().run_in_executor(
+                                _cache_executor, self.response_cache.put, cache_key, "".join(state["parts"]), state["finish_reason"])
+                        return result("ok")
+                    except LLMError as error:
+                        if error.status not in RETRYABLE_STATUSES or attempt == MAX_RETRIES or state["parts"]:
+                            return result("error", str(error))
+                        metrics.LLM_REQUESTS.inc(outcome="retried")
+                        await asyncio.sleep(error.retry_after if error.retry_after is not None else min(30.0, 2 ** attempt + random.random()))
+                    except asyncio.TimeoutError:
+                        return result("error", f"Délai dépassé ({self.timeout:.0f} s).")
+                    except (OSError, ValueError, KeyError, IndexError, asyncio.IncompleteReadError) as error:
+                        return result("error", f"{type(error).__name__} : {error}")
+            except asyncio.CancelledError:
+                result("cancelled")
+                raise
+            finally:
+                metrics.LLM_IN_FLIGHT.dec()
+
+    async def run_batch(self, prompts, on_delta=None, on_result=None, stream=True, use_cache=True):
+        """Run prompts concurrently (within the client's bounds); results in the order of ``prompts``.
+
+        ``on_delta(index, text)`` and ``on_result(index, result)`` report progress.
+        """
+        async def run_one(index, prompt):
+            delta_callback = None if on_delta is None else (lambda delta: on_delta(index, delta))
+            completion = await self.complete(prompt, delta_callback, stream, use_cache)
+            if on_result is not None:
+                on_result(index, completion)
+            return completion
+        return await asyncio.gather(*(run_one(index, prompt) for index, prompt in enumerate(prompts)))
+
+
+class BackgroundLoop:
+    """One asyncio event loop in a daemon thread, started on first use."""
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="llm-event-loop", daemon=True).start()
+            return self._loop
+
+    def submit(self, coroutine):
+        """Schedule ``coroutine`` on the loop; returns a ``concurrent.futures.Future``."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop())
+
+    def call(self, function, *args):
+        """Run a plain function on the loop thread and return its result (builds loop-bound objects)."""
+        async def run():
+            return function(*args)
+        return self.submit(run()).result()
+
+
+BACKGROUND_LOOP = BackgroundLoop()
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url, api_key=None, model=DEFAULT_MODEL, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+               requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, timeout=DEFAULT_TIMEOUT_SECONDS, response_cache=None):
+    """Process-wide client for this configuration, bound to ``BACKGROUND_LOOP``."""
+    key = (base_url, api_key, model, int(max_concurrency), float(requests_per_minute), float(timeout), id(response_cache))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = BACKGROUND_LOOP.call(
+                AsyncLLMClient, base_url, api_key, model, max_concurrency, requests_per_minute, timeout, None, response_cache,
+            )
+        return client
+
+
+class LLMJob:
+    """Prompts executing on ``BACKGROUND_LOOP``, polled from a script thread (``texts``, ``done``, ``results``)."""
+
+    def __init__(self, client, prompts, stream=True, use_cache=True):
+        self.prompts = list(prompts)
+        self._parts = [[] for _ in self.prompts]
+        self._results = [None] * len(self.prompts)
+        self.started = time.monotonic()
+        self._future = BACKGROUND_LOOP.submit(client.run_batch(self.prompts, self._on_delta, self._on_result, stream, use_cache))
+
+    def _on_delta(self, index, delta):
+        self._parts[index].append(delta)
+
+    def _on_result(self, index, result):
+        self._results[index] = result
+
+    @property
+    def texts(self):
+        return ["".join(parts) for parts in self._parts]
+
+    @property
+    def done(self):
+        return self._future.done()
+
+    def cancel(self):
+        """Cancel the requests still running; their partial text is kept as ``cancelled`` results."""
+        self._future.cancel()
+
+    def wait(self, timeout=None):
+        try:
+            self._future.result(timeout)
+        except Exception: # Annulation : les résultats partiels restent disponibles
+            pass
+        return self.results
+
+    @property
+    def results(self):
+        """One ``CompletionResult`` per prompt (None while still running)."""
+        if not self.done:
+            return list(self._results)
+        elapsed = time.monotonic() - self.started
+        return [result or CompletionResult("".join(parts), "cancelled", None, elapsed, None, None)
+                for result, parts in zip(self._results, self._parts)]
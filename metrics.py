@@ -0,0 +1,237 @@
+"""Process-wide metrics in the Prometheus text exposition format (no dependency).
+
+The apps feed the registry from their existing call sites (Gist load/save,
+generation, injection, each rerun for session activity) and, when the
+``METRICS_PORT`` secret is set, ``start_metrics_server`` serves ``/metrics``
+on that port. Updating a metric is a dict update under a lock; all
+formatting happens at scrape time.
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRIC_PREFIX = "prompt_lab_"
+SESSION_IDLE_SECONDS = 15 * 60  # Une session sans rerun depuis ce délai n'est plus comptée comme active
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = METRIC_PREFIX + name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} attend les labels {self.label_names}, reçu {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in self._values.items()]
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for sample_name, key, extra, value in self._samples():
+            lines.append(f"{sample_name}{_format_labels(self.label_names, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, label_names=(), function=None):
+        super().__init__(name, documentation, label_names)
+        self._function = function  # Valeur calculée au scrape (sans labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def _samples(self):
+        if self._function is not None:
+            return [(self.name, (), (), self._function())]
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        samples = []
+        for key, bucket_counts, total, count in items:
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", key, (("le", _format_value(upper)),), cumulative))
+            samples.append((f"{self.name}_sum", key, (), total))
+            samples.append((f"{self.name}_count", key, (), count))
+        return samples
+
+
+class _SessionActivity:
+    """Last rerun time and library payload size of each session (pruned when idle)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id -> [last_seen, library_bytes]
+
+    def touch(self, session_id, library_bytes=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.setdefault(session_id, [now, 0])
+            entry[0] = now
+            if library_bytes is not None:
+                entry[1] = library_bytes
+
+    def _active(self):
+        cutoff = time.monotonic() - SESSION_IDLE_SECONDS
+        with self._lock:
+            for session_id in [sid for sid, entry in self._sessions.items() if entry[0] < cutoff]:
+                del self._sessions[session_id]
+            return [entry[1] for entry in self._sessions.values()]
+
+    def active_count(self):
+        return len(self._active())
+
+    def library_bytes_max(self):
+        return max(self._active(), default=0)
+
+    def library_bytes_sum(self):
+        return sum(self._active())
+
+
+SESSIONS = _SessionActivity()
+
+GIST_REQUESTS = Counter("gist_requests_total", "Appels Gist par opération et résultat.", ("operation", "outcome"))
+GIST_FAILURES = Counter("gist_failures_total", "Échecs Gist par opération et statut HTTP (0 = erreur réseau).", ("operation", "status"))
+GIST_LATENCY = Histogram("gist_request_duration_seconds", "Durée des chargements/sauvegardes Gist.", ("operation",))
+GIST_SAVES_IN_FLIGHT = Gauge("gist_saves_in_flight", "Sauvegardes Gist en cours (les sauvegardes sont synchrones : profondeur de file).")
+GENERATIONS = Counter("generations_total", "Prompts générés par métier et cas d'usage.", ("family", "use_case"))
+INJECTIONS = Counter("injected_use_cases_total", "Cas d'usage injectés (JSON) par résultat.", ("outcome",))
+LIBRARY_FAMILIES = Gauge("library_families", "Nombre de métiers dans la bibliothèque (vue par le dernier rerun).")
+LIBRARY_USE_CASES = Gauge("library_use_cases", "Nombre de cas d'usage dans la bibliothèque (vue par le dernier rerun).")
+ACTIVE_SESSIONS = Gauge("active_sessions", f"Sessions ayant fait un rerun dans les {SESSION_IDLE_SECONDS // 60} dernières minutes.", function=SESSIONS.active_count)
+SESSION_LIBRARY_BYTES_MAX = Gauge("session_library_bytes_max", "Plus grosse copie de bibliothèque (JSON, octets) parmi les sessions actives.", function=SESSIONS.library_bytes_max)
+SESSION_LIBRARY_BYTES_SUM = Gauge("session_library_bytes_sum", "Somme des copies de bibliothèque (JSON, octets) des sessions actives.", function=SESSIONS.library_bytes_sum)
+SESSION_MEMORY_TRACKED = Gauge("session_memory_tracked_sessions", "Sessions suivies par le comptage mémoire (session_memory).")
+SESSION_MEMORY_BYTES_MAX = Gauge("session_memory_bytes_max", "Plus grosse empreinte mémoire estimée d'une session (bibliothèque + tampons, octets).")
+SESSION_MEMORY_BYTES_SUM = Gauge("session_memory_bytes_sum", "Somme des empreintes mémoire estimées des sessions (octets).")
+RENDER_CACHE_LOOKUPS = Counter("render_cache_lookups_total", "Générations servies par le cache de prompts rendus (hit) ou recalculées (miss).", ("result",))
+SESSION_EVICTIONS = Counter("session_evictions_total", "Clés de session libérées par motif (cap, idle) et type (buffer, library).", ("reason", "kind"))
+LLM_REQUESTS = Counter("llm_requests_total", "Appels à l'endpoint LLM par résultat (ok, error, cancelled, retried).", ("outcome",))
+LLM_LATENCY = Histogram("llm_request_duration_seconds", "Durée des appels LLM réussis (total) et délai avant le premier token (first_token).", ("phase",), buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0))
+LLM_IN_FLIGHT = Gauge("llm_requests_in_flight", "Appels LLM en cours (bornés par LLM_MAX_CONCURRENCY).")
+LLM_CACHE_LOOKUPS = Counter("llm_cache_lookups_total", "Réponses LLM servies par le cache disque (hit) ou demandées à l'endpoint (miss).", ("result",))
+DOCUMENT_INGESTIONS = Counter("document_ingestions_total", "Documents déposés par format et résultat (extracted, cached, error, cancelled).", ("format", "outcome"))
+DOCUMENT_INGESTION_DURATION = Histogram("document_ingestion_duration_seconds", "Durée d'extraction du texte des documents déposés (hors cache).", ("format",), buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+
+REGISTRY = [
+    GIST_REQUESTS, GIST_FAILURES, GIST_LATENCY, GIST_SAVES_IN_FLIGHT, GENERATIONS, INJECTIONS,
+    LIBRARY_FAMILIES, LIBRARY_USE_CASES, ACTIVE_SESSIONS, SESSION_LIBRARY_BYTES_MAX, SESSION_LIBRARY_BYTES_SUM,
+    SESSION_MEMORY_TRACKED, SESSION_MEMORY_BYTES_MAX, SESSION_MEMORY_BYTES_SUM, SESSION_EVICTIONS, RENDER_CACHE_LOOKUPS,
+    LLM_REQUESTS, LLM_LATENCY, LLM_IN_FLIGHT, LLM_CACHE_LOOKUPS, DOCUMENT_INGESTIONS, DOCUMENT_INGESTION_DURATION,
+]
+
+
+def observe_gist_call(operation, duration_s, status=None, ok=True):
+    """Record one Gist load/save: ``status`` is the HTTP status of a failure (None for a network error)."""
+    GIST_LATENCY.observe(duration_s, operation=operation)
+    GIST_REQUESTS.inc(operation=operation, outcome="ok" if ok else "error")
+    if not ok:
+        GIST_FAILURES.inc(operation=operation, status=status or 0)
+
+
+def set_library_size(library):
+    LIBRARY_FAMILIES.set(len(library))
+    LIBRARY_USE_CASES.set(sum(len(use_cases) for use_cases in library.values() if isinstance(use_cases, dict)))
+
+
+def exposition():
+    return "\n".join(metric.expose() for metric in REGISTRY) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = exposition().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Start (once per process) the ``/metrics`` endpoint."""
+    global _metrics_server
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _metrics_server
@@ -0,0 +1,129 @@
+"""Opt-in timed spans for script reruns and Gist I/O, with rolling p50/p95.
+
+Disabled by default: every call is then a flag check. The apps enable it with
+the ``PERF_PROFILING`` secret; ``gist_store`` wraps its network calls in
+``span`` so the background reconciler is measured too.
+
+Two ways to time a section:
+
+    with span("gist.patch"):
+        ...
+
+    begin("sidebar")   # pour les longues sections du script, sans réindenter
+    ...
+    end("sidebar")
+
+Open ``begin`` spans are per thread (one script run = one thread) and are
+dropped by ``start_rerun`` when a previous run stopped early (``st.rerun``).
+Samples are aggregated process-wide, over all sessions.
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+DEFAULT_WINDOW = 500  # Échantillons conservés par span pour les percentiles glissants
+RERUN_SPAN = "rerun.total"
+
+_enabled = False
+_lock = threading.Lock()
+_samples = {}  # nom -> deque de durées (ms)
+_counts = {}   # nom -> nombre total d'échantillons depuis le démarrage
+_local = threading.local()
+_window = DEFAULT_WINDOW
+
+
+def enable(flag=True, window=None):
+    global _enabled, _window
+    _enabled = bool(flag)
+    if window:
+        _window = int(window)
+
+
+def is_enabled():
+    return _enabled
+
+
+def record(name, duration_ms):
+    with _lock:
+        samples = _samples.get(name)
+        if samples is None:
+            samples = _samples[name] = deque(maxlen=_window)
+            _counts[name] = 0
+        samples.append(duration_ms)
+        _counts[name] += 1
+
+
+@contextmanager
+def span(name):
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - start) * 1000)
+
+
+def _open_spans():
+    open_spans = getattr(_local, "open_spans", None)
+    if open_spans is None:
+        open_spans = _local.open_spans = {}
+    return open_spans
+
+
+def begin(name):
+    if _enabled:
+        _open_spans()[name] = time.perf_counter()
+
+
+def end(name):
+    if not _enabled:
+        return
+    started = _open_spans().pop(name, None)
+    if started is not None:
+        record(name, (time.perf_counter() - started) * 1000)
+
+
+def start_rerun():
+    """Forget spans left open by an interrupted run, then start timing the whole rerun."""
+    if _enabled:
+        _open_spans().clear()
+        begin(RERUN_SPAN)
+
+
+def _percentile(sorted_values, pct):
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summary():
+    """``{name: {"count", "window", "last_ms", "p50_ms", "p95_ms", "max_ms"}}`` sorted by name."""
+    with _lock:
+        data = {name: (list(samples), _counts[name]) for name, samples in _samples.items()}
+    result = {}
+    for name in sorted(data):
+        samples, count = data[name]
+        ordered = sorted(samples)
+        result[name] = {
+            "count": count,
+            "window": len(samples),
+            "last_ms": round(samples[-1], 3),
+            "p50_ms": round(_percentile(ordered, 50), 3),
+            "p95_ms": round(_percentile(ordered, 95), 3),
+            "max_ms": round(ordered[-1], 3),
+        }
+    return result
+
+
+def export_json():
+    return json.dumps({"exported_at": datetime.now().isoformat(), "window": _window, "spans": summary()}, indent=2)
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _counts.clear()
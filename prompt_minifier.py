@@ -0,0 +1,151 @@
+"""Token-saving minification of prompt templates, an option of prompt generation.
+
+Templates written by the creation meta-prompt are verbose markdown: blank lines
+around every heading, ``---`` separators, bold headings, padded tables,
+instructions repeated from one section to the next. ``minify_template`` removes
+what the model does not need and keeps every instruction:
+
+* whitespace: trailing spaces, runs of spaces inside a line, blank lines after
+  a heading, between list items and in runs (one blank line at most);
+* decorative markdown: horizontal rules, closing ``#`` of headings, bold
+  markers of headings, of whole-line pseudo-headings and of list item lead-ins,
+  table padding (``| :---: |`` becomes ``|:-:|``);
+* repetition: a heading identical (case, spacing and bold aside) to an earlier
+  one of the same level under the same parent heading, or an instruction line
+  of ``MIN_DEDUP_CHARS`` or more identical (case, spacing and list marker aside)
+  to an earlier one, is dropped.
+
+The template is minified before substitution (``library_core.fill_template``),
+so placeholders, ``{{ }}`` escapes, inline code and fenced code blocks are left
+exactly as written, substituted values (pasted documents) are never altered, and
+a line holding a placeholder is never dropped. Results are memoized per
+template text, so a render costs one dict probe once a template is minified.
+"""
+import re
+import threading
+
+MIN_DEDUP_CHARS = 24
+MAX_CACHED_TEMPLATES = 20000
+
+# Zones à ne jamais modifier : accolades (placeholders, échappements), code en ligne
+_PROTECTED_RE = re.compile(r"\{[^{}\n]*\}|`[^`\n]+`")
+_MASK_RE = re.compile("\x00(\\d+)\x00")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+# "## Titre", et "##Titre" tel que le méta-prompt le demande ; pas "#mot-clé" ni le "#" final de "C#"
+_HEADING_RE = re.compile(r"^(#{1,6})(?:[ \t]+|(?<=##)(?=[^#\s]))(.*?)(?:[ \t]+#+)?[ \t]*$")
+_RULE_RE = re.compile(r"^\s*([-*_=])(\s*\1){2,}\s*$")
+_LIST_RE = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+")
+_BOLD_RE = re.compile(r"\*\*(.+?)\*\*")
+_BOLD_LINE_RE = re.compile(r"^\*\*([^*]+?)\*\*\s*(:?)\s*$")
+_LEAD_BOLD_RE = re.compile(r"^(\s*(?:[-*+]|\d+[.)])\s+)\*\*([^*]+?)\*\*")
+_TABLE_RE = re.compile(r"^\s*\|.*\|\s*$")
+_TABLE_DELIMITER_CELL_RE = re.compile(r"^\s*(:?)-+(:?)\s*$")
+_SPACES_RE = re.compile(r"(?<=\S)[ \t]{2,}")
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _mask(line):
+    """Replace protected spans by markers; returns the masked line and the spans."""
+    spans = []
+
+    def keep(match):
+        spans.append(match.group(0))
+        return f"\x00{len(spans) - 1}\x00"
+
+    return _PROTECTED_RE.sub(keep, line), spans
+
+
+def _unmask(line, spans):
+    return _MASK_RE.sub(lambda match: spans[int(match.group(1))], line)
+
+
+def _dedup_key(masked):
+    """Comparison form of a line: no list marker, single spaces, case-folded."""
+    return " ".join(_LIST_RE.sub("", masked).split()).casefold()
+
+
+def _minify_table_row(masked):
+    cells = masked.strip()[1:-1].split("|")
+    delimiters = [_TABLE_DELIMITER_CELL_RE.match(cell) for cell in cells]
+    if all(delimiters):
+        cells = [f"{match.group(1)}-{match.group(2)}" for match in delimiters]
+    else:
+        cells = [cell.strip() for cell in cells]
+    return "|" + "|".join(cells) + "|"
+
+
+def _minify(template):
+    output = []  # (genre, ligne) ; genre : blank, heading, list, text, code
+    seen_headings = {}  # niveau -> titres déjà vus sous le titre parent courant
+    seen_lines = set()
+    in_fence = False
+    for raw_line in template.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        if _FENCE_RE.match(raw_line) or in_fence:
+            if _FENCE_RE.match(raw_line):
+                in_fence = not in_fence
+            output.append(("code", raw_line))
+            continue
+        masked, spans = _mask(raw_line.rstrip())
+        if not masked.strip():
+            if output and output[-1][0] != "blank":
+                output.append(("blank", ""))
+            continue
+        if _RULE_RE.match(masked):
+            continue
+        indent = masked[:len(masked) - len(masked.lstrip())]
+        masked = indent + _SPACES_RE.sub(" ", masked.lstrip())
+        heading = _HEADING_RE.match(masked)
+        bold_line = _BOLD_LINE_RE.match(masked)
+        if heading:
+            text = _BOLD_RE.sub(r"\1", heading.group(2))
+            key, level = _dedup_key(text), len(heading.group(1))
+            for deeper in [seen for seen in seen_headings if seen > level]:
+                del seen_headings[deeper] # Sous-titres d'un autre parent : « ### Exemple » peut revenir sous chaque « ## Étape »
+            siblings = seen_headings.setdefault(level, set())
+            if key in siblings and not spans:
+                continue
+            siblings.add(key)
+            output.append(("heading", _unmask(f"{heading.group(1)} {text}", spans)))
+            continue
+        if bold_line:
+            masked = bold_line.group(1) + bold_line.group(2)
+        else:
+            masked = _LEAD_BOLD_RE.sub(r"\1\2", masked).rstrip()
+        if _TABLE_RE.match(masked):
+            masked = indent + _minify_table_row(masked)
+        key = _dedup_key(masked)
+        if not spans and len(key) >= MIN_DEDUP_CHARS:
+            if key in seen_lines:
+                continue
+            seen_lines.add(key)
+        output.append(("list" if _LIST_RE.match(masked) else "text", _unmask(masked, spans)))
+
+    lines = []
+    for index, (kind, line) in enumerate(output):
+        if kind == "blank":
+            previous = output[index - 1][0] if index else None
+            following = output[index + 1][0] if index + 1 < len(output) else None
+            # Une ligne vide ne sert qu'entre deux paragraphes (ou autour du code)
+            if previous in (None, "heading") or following in (None, "heading"):
+                continue
+            if previous == "list" and following == "list":
+                continue
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def minify_template(template):
+    """Minified ``template`` (before substitution); memoized per template text."""
+    if not template:
+        return template or ""
+    with _cache_lock:
+        minified = _cache.get(template)
+    if minified is None:
+        minified = _minify(template)
+        with _cache_lock:
+            if len(_cache) >= MAX_CACHED_TEMPLATES:
+                _cache.clear()
+            _cache[template] = minified
+    return minified
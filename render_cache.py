@@ -0,0 +1,99 @@
+"""Bounded LRU cache of generated prompts.
+
+Users often click "Générer Prompt" again with the same inputs. The rendered
+prompt is cached under (use case ID, hash of title + template, hash of the
+normalized values), so a repeat returns the stored text without
+re-substituting, and the apps do not count it as a new generation (no
+``usage_count`` bump, hence no save). Editing the template or the use case
+name changes the key, so stale outputs are never served.
+
+The cache is process-wide and bounded both in entries and in characters (pasted
+documents make some outputs large). Hit/miss counts feed ``metrics`` and the
+performance debug panel.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import metrics
+from library_core import fill_template, format_values_for_template
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_CHARS = 32 * 1024 * 1024
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def render_use_case_prompt(title, template, values):
+    """Final prompt shown to the user: subject line + filled template (``values`` already formatted)."""
+    return f"Sujet : {title}\n{fill_template(template, values)}"
+
+
+class RenderCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_chars=DEFAULT_MAX_CHARS):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # clé -> prompt rendu
+        self._chars = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(use_case_id, title, template, values):
+        """``values`` are the formatted strings (``format_values_for_template``), so equal inputs give equal keys."""
+        values_json = json.dumps(sorted(values.items()), ensure_ascii=False)
+        return (use_case_id, _digest(f"{title}\x1f{template}"), _digest(values_json))
+
+    def render(self, use_case_id, title, template, form_values):
+        """Return ``(prompt, from_cache)`` for the raw form values of a use case."""
+        values = format_values_for_template(form_values)
+        key = self.make_key(use_case_id, title, template, values)
+        with self._lock:
+            prompt = self._entries.get(key)
+            if prompt is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if prompt is not None:
+            metrics.RENDER_CACHE_LOOKUPS.inc(result="hit")
+            return prompt, True
+        prompt = render_use_case_prompt(title, template, values)
+        metrics.RENDER_CACHE_LOOKUPS.inc(result="miss")
+        self._store(key, prompt)
+        return prompt, False
+
+    def _store(self, key, prompt):
+        size = len(prompt)
+        with self._lock:
+            self.misses += 1
+            if size > self.max_chars:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._chars -= len(previous)
+            self._entries[key] = prompt
+            self._chars += size
+            while len(self._entries) > self.max_entries or self._chars > self.max_chars:
+                _, evicted = self._entries.popitem(last=False)
+                self._chars -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries), "chars": self._chars, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._chars = 0
+
+
+RENDER_CACHE = RenderCache()
@@ -0,0 +1,143 @@
+"""Content-addressed on-disk cache of LLM responses (SQLite, zlib-compressed bodies).
+
+The key is the SHA-256 of (endpoint, model, parameters, rendered prompt), so
+re-running the same use case on the same inputs with the same settings is
+answered locally: no latency, no tokens. ``AsyncLLMClient`` reads through the
+cache before queuing a request and writes completed answers through it;
+errors, cancellations and truncated answers are never stored.
+
+* TTL: an entry older than ``ttl_seconds`` is a miss (and is deleted).
+* Size: when the compressed bodies exceed ``max_bytes``, the least recently
+  read entries are deleted until the cache is back under 90% of the bound.
+
+SQLite keeps the cache in one file, safe for the threads of one process and
+for several processes (WAL journal). The client makes its calls on a
+single worker thread (``llm_client._cache_executor``), never on its event
+loop, so a slow disk does not stall the other streams.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+import metrics
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "llm_responses.sqlite3")  # À côté du snapshot de la bibliothèque
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+EVICTION_TARGET_RATIO = 0.9
+
+CachedResponse = namedtuple("CachedResponse", "text finish_reason created_at")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    finish_reason TEXT,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+"""
+
+
+def make_key(endpoint, model, params, prompt):
+    """Cache key of a request; ``params`` are the generation settings that change the answer (temperature...)."""
+    canonical = json.dumps([endpoint, model, params or {}, prompt], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.ttl_seconds = float(ttl_seconds)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """The cached response, or None (absent or expired)."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT body, finish_reason, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[2] > self.ttl_seconds:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+            else:
+                self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self.hits += 1
+        metrics.LLM_CACHE_LOOKUPS.inc(result="miss" if row is None else "hit")
+        if row is None:
+            return None
+        return CachedResponse(zlib.decompress(row[0]).decode("utf-8"), row[1], row[2])
+
+    def put(self, key, text, finish_reason=None):
+        body = zlib.compress(text.encode("utf-8"))
+        if len(body) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, body, size, finish_reason, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, body, len(body), finish_reason, now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        expired = self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        self.evictions += expired
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICTION_TARGET_RATIO
+        victims = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(path, max_bytes=DEFAULT_MAX_BYTES, ttl_seconds=DEFAULT_TTL_SECONDS):
+    """Process-wide cache for ``path`` (limits updated if they changed)."""
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = ResponseCache(path, max_bytes, ttl_seconds)
+        cache.max_bytes, cache.ttl_seconds = int(max_bytes), float(ttl_seconds)
+        return cache
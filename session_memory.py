@@ -0,0 +1,245 @@
+"""Per-session memory accounting, a per-session cap and eviction of idle sessions.
+
+Each session holds a full library copy (``editable_prompts`` and its
+``DirtyTracker``) plus transient buffers (generated prompt, meta-prompt,
+pasted JSON, assistant form, document extractions, LLM answers, evaluation
+reports) that can reach megabytes when documents are pasted. The apps call ``SESSION_MEMORY.account`` at the end of every run:
+
+* the session's usage is measured (``deep_sizeof``), each key only when it
+  changed: the library when its checksum changes, a buffer when its identity
+  or length does; a value edited in place (a library without checksum, a job
+  still streaming) is re-measured at most every ``REMEASURE_SECONDS``;
+* above the cap, transient buffers the current view does not display are
+  dropped, biggest first;
+* at most every ``sweep_interval`` seconds, sessions idle for longer than the
+  TTL lose their transient buffers and, if it has no unsaved change and a
+  shared store exists, their library copy.
+
+Evicted keys are deleted: the session init of the script recreates the
+buffers empty and reloads the library from the local snapshot / Gist on the
+session's next rerun (the key ``EVICTED_FLAG_KEY`` tells it to say so).
+Sessions are held through weak references, so closed sessions are forgotten.
+"""
+import sys
+import threading
+import time
+import weakref
+
+import metrics
+
+DEFAULT_CAP_BYTES = 50 * 1024 * 1024
+DEFAULT_IDLE_TTL_SECONDS = 30 * 60
+DEFAULT_SWEEP_INTERVAL_SECONDS = 60
+EVICTED_FLAG_KEY = "session_memory_evicted"
+REMEASURE_SECONDS = 30
+EMPTY_BUFFER_BYTES = max(sys.getsizeof(""), sys.getsizeof({})) # Tampon vide (chaîne ou dict) : rien à libérer
+
+# Tampon transitoire -> vues qui l'affichent (il n'est jamais libéré pendant qu'on est sur ces vues)
+TRANSIENT_BUFFERS = {
+    "active_generated_prompt": ("edit", "generator"),
+    "generated_meta_prompt_for_llm": ("assistant_creation",),
+    "injection_json_text": ("inject_manual",),
+    "assistant_form_values": ("assistant_creation",),
+    "assistant_existing_prompt_value": ("assistant_creation",),
+    "document_ingestions": ("edit", "generator"),
+    "llm_execution": ("edit", "generator"),
+    "map_reduce_execution": ("edit", "generator"),
+    "evaluation_history": ("edit",),
+}
+LIBRARY_KEY = "editable_prompts"
+# Clés rechargées avec la bibliothèque (voir load_editable_prompts_from_gist)
+LIBRARY_KEYS = (LIBRARY_KEY, "library_dirty_tracker", "library_content_checksum", "library_manifest", "library_search_index", "similar_prompts_index")
+
+
+def deep_sizeof(obj):
+    """Approximate deep size in bytes (containers, object ``__dict__``), each object counted once."""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, (str, bytes, int, float, bool)) or current is None:
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif hasattr(current, "__dict__"):
+            stack.append(vars(current))
+    return total
+
+
+def _state_get(state, key, default=None):
+    try:
+        return state[key]
+    except KeyError:
+        return default
+
+
+def _marker(value):
+    """Cheap change marker: identity, plus length (a new value can reuse the id of a freed one)."""
+    try:
+        return id(value), len(value)
+    except TypeError:
+        return id(value), None
+
+
+def _delete_keys(state, keys):
+    freed = []
+    for key in keys:
+        try:
+            del state[key]
+            freed.append(key)
+        except KeyError:
+            pass
+    return freed
+
+
+class _SessionEntry:
+    __slots__ = ("state_ref", "last_seen", "library_marker", "library_measured_at", "library_bytes", "buffer_bytes", "buffer_sizes",
+                 "library_evictable")
+
+    def __init__(self, state):
+        self.state_ref = weakref.ref(state)
+        self.last_seen = time.monotonic()
+        self.library_marker = None
+        self.library_measured_at = 0.0
+        self.library_bytes = 0
+        self.buffer_bytes = {}
+        self.buffer_sizes = {}  # clé -> (marqueur, octets, instant de la mesure)
+        self.library_evictable = False
+
+    @property
+    def total_bytes(self):
+        return self.library_bytes + sum(self.buffer_bytes.values())
+
+
+class SessionMemoryManager:
+    """Process-wide registry of session states with their measured footprint."""
+
+    def __init__(self, cap_bytes=DEFAULT_CAP_BYTES, idle_ttl=DEFAULT_IDLE_TTL_SECONDS, sweep_interval=DEFAULT_SWEEP_INTERVAL_SECONDS):
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id -> _SessionEntry
+        self._last_sweep = time.monotonic()
+        self.sweep_interval = sweep_interval
+        self.configure(cap_bytes, idle_ttl)
+
+    def configure(self, cap_bytes=None, idle_ttl=None):
+        """Update the cap (bytes) and idle TTL (seconds); ``None`` or <= 0 keeps the default."""
+        self.cap_bytes = int(cap_bytes) if cap_bytes and float(cap_bytes) > 0 else DEFAULT_CAP_BYTES
+        self.idle_ttl = float(idle_ttl) if idle_ttl and float(idle_ttl) > 0 else DEFAULT_IDLE_TTL_SECONDS
+
+    def account(self, session_id, state, view_mode, library_evictable=True):
+        """Measure the session, enforce the cap, sweep idle sessions if due; return the session report.
+
+        ``state`` must be the session's own state object (``ctx.session_state``),
+        not the ``st.session_state`` proxy, which resolves to the calling thread.
+        ``library_evictable`` is False when there is no shared store to reload from.
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry.state_ref() is not state:
+                entry = self._sessions[session_id] = _SessionEntry(state)
+            entry.last_seen = time.monotonic()
+            entry.library_evictable = library_evictable
+        self._measure(entry, state)
+        freed = self._enforce_cap(entry, state, view_mode)
+        self._maybe_sweep()
+        self._publish()
+        return {"total_bytes": entry.total_bytes, "library_bytes": entry.library_bytes,
+                "cap_bytes": self.cap_bytes, "freed": freed}
+
+    def _measure(self, entry, state):
+        now = time.monotonic()
+        library = _state_get(state, LIBRARY_KEY)
+        marker = (id(library), _state_get(state, "library_content_checksum"))
+        if library is None:
+            entry.library_marker, entry.library_bytes = None, 0
+        elif marker != entry.library_marker or (marker[1] is None and now - entry.library_measured_at >= REMEASURE_SECONDS):
+            # Sans checksum (pas de Gist), une modification sur place ne change pas le marqueur : nouvelle mesure périodique
+            entry.library_marker, entry.library_measured_at = marker, now
+            entry.library_bytes = deep_sizeof(library) + deep_sizeof(_state_get(state, "library_dirty_tracker"))
+        buffer_bytes = {}
+        for key in TRANSIENT_BUFFERS:
+            value = _state_get(state, key, "")
+            marker = _marker(value)
+            cached = entry.buffer_sizes.get(key)
+            if cached is None or cached[0] != marker or (not isinstance(value, str) and now - cached[2] >= REMEASURE_SECONDS):
+                cached = entry.buffer_sizes[key] = (marker, deep_sizeof(value), now)
+            buffer_bytes[key] = cached[1]
+        entry.buffer_bytes = buffer_bytes
+
+    def _enforce_cap(self, entry, state, view_mode):
+        if entry.total_bytes <= self.cap_bytes:
+            return []
+        candidates = sorted(
+            (key for key, views in TRANSIENT_BUFFERS.items() if view_mode not in views),
+            key=lambda key: entry.buffer_bytes.get(key, 0), reverse=True,
+        )
+        freed = []
+        for key in candidates:
+            if entry.total_bytes <= self.cap_bytes or entry.buffer_bytes.get(key, 0) <= EMPTY_BUFFER_BYTES:
+                break
+            freed.extend(_delete_keys(state, [key]))
+            entry.buffer_bytes[key] = 0
+        if freed:
+            metrics.SESSION_EVICTIONS.inc(len(freed), reason="cap", kind="buffer")
+        return freed
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        self.sweep(now)
+
+    def sweep(self, now=None):
+        """Evict idle sessions (buffers, then the library copy if clean); return ``{session_id: [keys]}``."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for session_id in [sid for sid, entry in self._sessions.items() if entry.state_ref() is None]:
+                del self._sessions[session_id]
+            idle = [(sid, entry) for sid, entry in self._sessions.items() if now - entry.last_seen > self.idle_ttl]
+        evicted = {}
+        for session_id, entry in idle:
+            state = entry.state_ref()
+            if state is None:
+                continue
+            freed = _delete_keys(state, [key for key in TRANSIENT_BUFFERS if _state_get(state, key)])
+            if freed:
+                metrics.SESSION_EVICTIONS.inc(len(freed), reason="idle", kind="buffer")
+            tracker = _state_get(state, "library_dirty_tracker")
+            library = _state_get(state, LIBRARY_KEY)
+            if entry.library_evictable and library is not None and tracker is not None and not tracker.has_changes(library):
+                freed.extend(_delete_keys(state, LIBRARY_KEYS))
+                metrics.SESSION_EVICTIONS.inc(reason="idle", kind="library")
+                entry.library_marker, entry.library_bytes = None, 0
+            entry.buffer_bytes = {}
+            if freed:
+                state[EVICTED_FLAG_KEY] = freed
+                evicted[session_id] = freed
+        return evicted
+
+    def _publish(self):
+        with self._lock:
+            totals = [entry.total_bytes for entry in self._sessions.values()]
+        metrics.SESSION_MEMORY_TRACKED.set(len(totals))
+        metrics.SESSION_MEMORY_BYTES_MAX.set(max(totals, default=0))
+        metrics.SESSION_MEMORY_BYTES_SUM.set(sum(totals))
+
+    def usage(self):
+        """``{session_id: {"total_bytes", "library_bytes", "idle_s"}}`` for the tracked sessions."""
+        now = time.monotonic()
+        with self._lock:
+            return {sid: {"total_bytes": entry.total_bytes, "library_bytes": entry.library_bytes,
+                          "idle_s": round(now - entry.last_seen, 1)}
+                    for sid, entry in self._sessions.items()}
+
+
+SESSION_MEMORY = SessionMemoryManager()
@@ -0,0 +1,239 @@
+"""Similar prompts: TF-IDF cosine neighbours of every use case, precomputed and kept up to date.
+
+Each use case (name + template) is a row of a sparse TF-IDF matrix: the terms
+of ``library_search.analyze`` (folded, stemmed, no stop words), sublinear term
+frequency, smoothed IDF, rows normalized to unit length, so the product of two
+rows is their cosine similarity. Terms found in more than ``MAX_DF_RATIO`` of
+the use cases are dropped: they are the skeleton all templates share (role,
+format, rules) and would make every prompt look alike.
+
+``sync`` computes the ``top_k`` neighbours of all use cases at once, by blocks
+of rows (row block x transposed matrix, then ``argpartition``), and afterwards
+keeps them up to date incrementally: the rows of edited, added or removed use
+cases are recomputed, and so are the rows of the use cases whose neighbour
+list contained one of them or that one of them now enters. The vocabulary and
+IDF stay those of the last full computation, redone once ``REBUILD_RATIO`` of
+the library has changed. A lookup (``similar``) is an array read.
+
+SciPy is optional: with ``scipy.sparse`` the block products use its sparse
+matrix product, otherwise the same product is computed with NumPy from the
+column (inverted) index, gathering the postings of the block's terms and
+summing them with ``bincount``. When the vocabulary is small and shared by
+most use cases (a library of variations on a few themes), the sparse product
+does nearly as many multiplications as a dense one: the matrix is then kept
+dense and the blocks are computed with a BLAS product.
+"""
+import math
+from collections import Counter, namedtuple
+
+import numpy as np
+
+from library_search import analyze
+
+try:
+    from scipy import sparse
+except ImportError: # Dépendance optionnelle
+    sparse = None
+
+DEFAULT_TOP_K = 5
+MIN_SIMILARITY = 0.2
+DUPLICATE_SIMILARITY = 0.8  # Au-delà : probablement le même cas d'usage recréé
+MAX_DF_RATIO = 0.5
+MIN_DOCS_FOR_MAX_DF = 20  # En dessous, tous les termes sont gardés
+REBUILD_RATIO = 0.2
+MAX_BLOCK_PAIRS = 4_000_000  # Produits élémentaires par bloc de lignes (borne la mémoire du calcul NumPy)
+MAX_DENSE_BYTES = 64 * 1024 * 1024
+DENSE_SPEEDUP = 300  # Un produit dense (BLAS) fait ~300 multiplications dans le temps d'une multiplication du produit creux (NumPy)
+
+SimilarPrompt = namedtuple("SimilarPrompt", "family name similarity")
+
+_EMPTY_VECTOR = (np.zeros(0, np.int32), np.zeros(0, np.float32))
+
+
+class SimilarPromptsIndex:
+    """Top-k similar use cases of a library ``{family: {use case name: config}}``."""
+
+    def __init__(self, top_k=DEFAULT_TOP_K):
+        self.top_k = top_k
+        self._keys = []           # ligne -> (métier, cas d'usage), None si supprimé depuis le dernier calcul complet
+        self._rows = {}           # (métier, cas d'usage) -> ligne
+        self._templates = {}      # (métier, cas d'usage) -> template indexé
+        self._vocabulary = {}     # terme -> colonne
+        self._idf = np.zeros(0, np.float32)
+        self._vectors = []        # ligne -> (colonnes, poids) de norme 1
+        self._neighbors = np.zeros((0, top_k), np.int32)  # -1 : pas de voisin
+        self._scores = np.zeros((0, top_k), np.float32)
+        self._changes_since_build = 0
+        self.builds = 0
+        self.updated_rows = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    # --- Vecteurs et matrice ---
+    def _vector(self, counts):
+        pairs = [(self._vocabulary[term], count) for term, count in counts.items() if term in self._vocabulary]
+        if not pairs:
+            return _EMPTY_VECTOR
+        columns = np.fromiter((column for column, _ in pairs), np.int32, len(pairs))
+        weights = (1.0 + np.log(np.fromiter((count for _, count in pairs), np.float32, len(pairs)))) * self._idf[columns]
+        return columns, (weights / np.linalg.norm(weights)).astype(np.float32)
+
+    def _assemble(self):
+        """Row (CSR) and column (CSC) arrays of the matrix from the row vectors."""
+        n_rows, n_columns = len(self._vectors), len(self._vocabulary)
+        lengths = np.fromiter((len(columns) for columns, _ in self._vectors), np.int64, n_rows)
+        self._indptr = np.concatenate(([0], np.cumsum(lengths)))
+        self._indices = np.concatenate([columns for columns, _ in self._vectors]) if n_rows else np.zeros(0, np.int32)
+        self._data = np.concatenate([weights for _, weights in self._vectors]) if n_rows else np.zeros(0, np.float32)
+        if sparse is not None:
+            self._matrix = sparse.csr_matrix((self._data, self._indices, self._indptr), shape=(n_rows, n_columns))
+            self._matrix_t = self._matrix.T.tocsr()
+        order = np.argsort(self._indices, kind="stable")
+        self._csc_rows = np.repeat(np.arange(n_rows, dtype=np.int32), lengths)[order]
+        self._csc_data = self._data[order]
+        column_counts = np.bincount(self._indices, minlength=n_columns)
+        self._csc_indptr = np.concatenate(([0], np.cumsum(column_counts)))
+        self._dense = None
+        pairs = float(np.square(column_counts, dtype=np.float64).sum())
+        if n_rows * n_columns * 4 <= MAX_DENSE_BYTES and pairs * DENSE_SPEEDUP >= float(n_rows) * n_rows * n_columns:
+            self._dense = np.zeros((n_rows, n_columns), np.float32)
+            self._dense[np.repeat(np.arange(n_rows), lengths), self._indices] = self._data
+
+    def _block_scores(self, rows):
+        """Dense cosine similarities (len(rows) x n) of ``rows`` with every row."""
+        n_rows = len(self._vectors)
+        if self._dense is not None:
+            return self._dense[rows] @ self._dense.T
+        if sparse is not None:
+            return (self._matrix[rows] @ self._matrix_t).toarray().astype(np.float32)
+        lengths = self._indptr[rows + 1] - self._indptr[rows]
+        entries = np.concatenate([np.arange(self._indptr[row], self._indptr[row + 1]) for row in rows]) if len(rows) else np.zeros(0, np.int64)
+        columns, weights = self._indices[entries], self._data[entries]
+        block_rows = np.repeat(np.arange(len(rows)), lengths)
+        starts = self._csc_indptr[columns]
+        counts = self._csc_indptr[columns + 1] - starts
+        # Postings de chaque terme du bloc mis bout à bout : position = début du terme + rang dans ses postings
+        postings = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        products = np.repeat(weights, counts) * self._csc_data[postings]
+        flat = np.repeat(block_rows, counts) * n_rows + self._csc_rows[postings]
+        return np.bincount(flat, weights=products, minlength=len(rows) * n_rows).reshape(len(rows), n_rows).astype(np.float32)
+
+    def _blocks(self, rows):
+        """Split ``rows`` so each block's product stays within ``MAX_BLOCK_PAIRS`` (and its dense result too)."""
+        n_rows = max(1, len(self._vectors))
+        if self._dense is not None:
+            costs = np.full(len(rows), n_rows * max(1, len(self._vocabulary)) // DENSE_SPEEDUP + n_rows, np.int64)
+        else:
+            column_counts = np.diff(self._csc_indptr)
+            costs = np.array([column_counts[self._vectors[row][0]].sum() + n_rows for row in rows], np.int64)
+        block, cost = [], 0
+        for row, row_cost in zip(rows, costs):
+            if block and cost + row_cost > MAX_BLOCK_PAIRS:
+                yield np.array(block)
+                block, cost = [], 0
+            block.append(row)
+            cost += row_cost
+        if block:
+            yield np.array(block)
+
+    def _compute_rows(self, rows):
+        """Neighbour lists of ``rows`` (best first) from the current matrix."""
+        for block in self._blocks(rows):
+            scores = self._block_scores(block)
+            scores[np.arange(len(block)), block] = -1.0 # Pas soi-même
+            k = min(self.top_k, scores.shape[1] - 1)
+            self._neighbors[block] = -1
+            self._scores[block] = 0.0
+            if k <= 0:
+                continue
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1)
+            best, best_scores = np.take_along_axis(best, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+            kept = best_scores >= MIN_SIMILARITY
+            self._neighbors[block, :k] = np.where(kept, best, -1)
+            self._scores[block, :k] = np.where(kept, best_scores, 0.0)
+        self.updated_rows += len(rows)
+
+    # --- Synchronisation avec la bibliothèque ---
+    def _build(self, templates):
+        keys = list(templates)
+        counts = [Counter(analyze(f"{key[1]}\n{templates[key]}")) for key in keys]
+        document_frequency = Counter()
+        for doc_counts in counts:
+            document_frequency.update(doc_counts.keys())
+        n_docs = len(keys)
+        max_df = MAX_DF_RATIO * n_docs if n_docs >= MIN_DOCS_FOR_MAX_DF else n_docs
+        terms = [term for term, frequency in document_frequency.items() if frequency <= max_df]
+        self._vocabulary = {term: column for column, term in enumerate(terms)}
+        self._idf = np.array([math.log((1 + n_docs) / (1 + document_frequency[term])) + 1.0 for term in terms], np.float32)
+        self._keys = keys
+        self._rows = {key: row for row, key in enumerate(keys)}
+        self._templates = dict(templates)
+        self._vectors = [self._vector(doc_counts) for doc_counts in counts]
+        self._neighbors = np.full((n_docs, self.top_k), -1, np.int32)
+        self._scores = np.zeros((n_docs, self.top_k), np.float32)
+        self._assemble()
+        self._compute_rows(np.arange(n_docs))
+        self._changes_since_build = 0
+        self.builds += 1
+
+    def _update(self, changed, removed, templates):
+        touched = []
+        for key in removed:
+            row = self._rows.pop(key)
+            del self._templates[key]
+            self._keys[row] = None
+            self._vectors[row] = _EMPTY_VECTOR
+            touched.append(row)
+        added = [key for key in changed if key not in self._rows]
+        if added:
+            self._neighbors = np.vstack([self._neighbors, np.full((len(added), self.top_k), -1, np.int32)])
+            self._scores = np.vstack([self._scores, np.zeros((len(added), self.top_k), np.float32)])
+            for key in added:
+                self._rows[key] = len(self._keys)
+                self._keys.append(key)
+                self._vectors.append(_EMPTY_VECTOR)
+        for key in changed:
+            row = self._rows[key]
+            self._templates[key] = templates[key]
+            self._vectors[row] = self._vector(Counter(analyze(f"{key[1]}\n{templates[key]}")))
+            touched.append(row)
+        self._assemble()
+        touched = np.array(touched)
+        # Lignes à recalculer : celles touchées, celles qui listaient une ligne touchée, celles où une ligne touchée entre
+        scores = np.vstack([self._block_scores(block) for block in self._blocks(touched)])
+        threshold = np.where(self._neighbors[:, -1] >= 0, self._scores[:, -1], MIN_SIMILARITY)
+        refresh = np.isin(self._neighbors, touched).any(axis=1) | (scores >= threshold).any(axis=0)
+        refresh[touched] = True
+        self._compute_rows(np.flatnonzero(refresh))
+        self._changes_since_build += len(changed) + len(removed)
+
+    def sync(self, library):
+        """Bring the neighbours in line with ``library``; returns the number of use cases changed."""
+        templates = {(family, name): config.get("template") or ""
+                     for family, use_cases in library.items() for name, config in (use_cases or {}).items()}
+        changed = [key for key, template in templates.items() if self._templates.get(key) != template]
+        removed = [key for key in self._templates if key not in templates]
+        if not changed and not removed:
+            return 0
+        if not self.builds or self._changes_since_build + len(changed) + len(removed) > REBUILD_RATIO * len(templates):
+            self._build(templates)
+        else:
+            self._update(changed, removed, templates)
+        return len(changed) + len(removed)
+
+    def similar(self, family, name, limit=None):
+        """Most similar use cases of ``(family, name)``, best first (empty if unknown or not synced)."""
+        row = self._rows.get((family, name))
+        if row is None:
+            return []
+        results = []
+        for neighbor, score in zip(self._neighbors[row], self._scores[row]):
+            if neighbor < 0:
+                break
+            key = self._keys[neighbor]
+            if key is not None:
+                results.append(SimilarPrompt(key[0], key[1], float(score)))
+        return results[:limit]
@@ -0,0 +1,91 @@
+"""Storage encodings for library files pushed to the Gist.
+
+Every encoded payload except the historical pretty JSON starts with a one-line
+header ``PLENC/<version> <encoding>``; ``decode_payload`` reads it and falls
+back to plain JSON for files written before encodings existed.
+"""
+import base64
+import gzip
+import json
+
+try:
+    import msgpack
+except ImportError:  # Dépendance optionnelle
+    msgpack = None
+
+STORAGE_FORMAT_VERSION = 1
+ENCODING_HEADER_PREFIX = "PLENC/"
+
+ENCODING_JSON = "json"                  # JSON indenté (historique, sans en-tête)
+ENCODING_JSON_COMPACT = "json-compact"  # JSON sans espaces
+ENCODING_GZIP_JSON = "gzip-json"        # JSON compact, gzip puis base64
+ENCODING_MSGPACK = "msgpack"            # MessagePack, gzip puis base64
+ENCODINGS = (ENCODING_JSON, ENCODING_JSON_COMPACT, ENCODING_GZIP_JSON, ENCODING_MSGPACK)
+DEFAULT_ENCODING = ENCODING_JSON_COMPACT
+
+
+def available_encodings():
+    return tuple(enc for enc in ENCODINGS if enc != ENCODING_MSGPACK or msgpack is not None)
+
+
+def resolve_encoding(name):
+    """Return ``name`` if it can be used here, DEFAULT_ENCODING otherwise."""
+    return name if name in available_encodings() else DEFAULT_ENCODING
+
+
+def _compact_json(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _pack(raw_bytes):
+    # mtime=0 : même entrée, même sortie (les checksums du manifeste restent stables)
+    return base64.b64encode(gzip.compress(raw_bytes, compresslevel=9, mtime=0)).decode("ascii")
+
+
+def _unpack(text):
+    return gzip.decompress(base64.b64decode(text))
+
+
+def encode_payload(data, encoding=DEFAULT_ENCODING):
+    """Serialize ``data`` (JSON-compatible) to text with the given encoding."""
+    if encoding == ENCODING_JSON:
+        return json.dumps(data, indent=4, ensure_ascii=False)
+    if encoding == ENCODING_JSON_COMPACT:
+        body = _compact_json(data)
+    elif encoding == ENCODING_GZIP_JSON:
+        body = _pack(_compact_json(data).encode("utf-8"))
+    elif encoding == ENCODING_MSGPACK:
+        if msgpack is None:
+            raise ValueError("Encodage 'msgpack' indisponible : installez le paquet msgpack.")
+        body = _pack(msgpack.packb(data, use_bin_type=True))
+    else:
+        raise ValueError(f"Encodage de stockage inconnu : '{encoding}'.")
+    return f"{ENCODING_HEADER_PREFIX}{STORAGE_FORMAT_VERSION} {encoding}\n{body}"
+
+
+def payload_encoding(text):
+    """Return the encoding named in the header (``json`` for headerless files)."""
+    if not text.startswith(ENCODING_HEADER_PREFIX):
+        return ENCODING_JSON
+    header = text.split("\n", 1)[0]
+    return header[len(ENCODING_HEADER_PREFIX):].split(" ", 1)[1].strip()
+
+
+def decode_payload(text):
+    """Inverse of ``encode_payload``; plain JSON without header is accepted as is."""
+    if not text.startswith(ENCODING_HEADER_PREFIX):
+        return json.loads(text)
+    header, _, body = text.partition("\n")
+    version_str, _, encoding = header[len(ENCODING_HEADER_PREFIX):].partition(" ")
+    if int(version_str) > STORAGE_FORMAT_VERSION:
+        raise ValueError(f"Format de stockage v{version_str} non supporté (max v{STORAGE_FORMAT_VERSION}).")
+    encoding = encoding.strip()
+    if encoding in (ENCODING_JSON, ENCODING_JSON_COMPACT):
+        return json.loads(body)
+    if encoding == ENCODING_GZIP_JSON:
+        return json.loads(_unpack(body).decode("utf-8"))
+    if encoding == ENCODING_MSGPACK:
+        if msgpack is None:
+            raise ValueError("Données encodées en 'msgpack' : installez le paquet msgpack pour les lire.")
+        return msgpack.unpackb(_unpack(body), raw=False)
+    raise ValueError(f"Encodage de stockage inconnu : '{encoding}'.")
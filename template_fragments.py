@@ -0,0 +1,116 @@
+"""Shared template fragments (partials) included by reference with ``{>nom}``.
+
+Templates generated by the assistant repeat the same boilerplate (role, La
+Poste context, output rules). A fragment is stored once, in the library
+manifest (``manifest["fragments"]``, see ``gist_store.push_library``), and a
+template includes it with ``{>nom_du_fragment}``. Fragments may include other
+fragments; unknown names and include cycles are left as written and reported
+by ``include_errors``.
+
+Expansion happens before variable substitution (``library_core.fill_template``),
+so fragments can use ``{variables}`` and ``{{ }}`` escapes like any template.
+Expanded templates are cached per fragment set: the cache key is the version
+(hash) of the whole fragment set, so changing any fragment invalidates every
+expansion at once and the render cache sees a new template text.
+"""
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+
+INCLUDE_RE = re.compile(r"\{>(\w+)\}")
+MAX_INCLUDE_DEPTH = 8
+MAX_CACHED_VERSIONS = 4
+MAX_CACHED_TEMPLATES_PER_VERSION = 20000
+
+_compiled = OrderedDict()  # version du jeu de fragments -> {template: template développé}
+_compiled_lock = threading.Lock()
+
+
+def fragments_version(fragments):
+    if not fragments:
+        return ""
+    canonical = json.dumps(fragments, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def find_includes(template):
+    return INCLUDE_RE.findall(template or "")
+
+
+def _expand(template, fragments, stack):
+    def replace(match):
+        name = match.group(1)
+        if name not in fragments or name in stack or len(stack) >= MAX_INCLUDE_DEPTH:
+            return match.group(0)
+        return _expand(fragments[name], fragments, stack + (name,))
+    return INCLUDE_RE.sub(replace, template)
+
+
+def _version_cache(version):
+    with _compiled_lock:
+        cache = _compiled.get(version)
+        if cache is None:
+            cache = _compiled[version] = {}
+            while len(_compiled) > MAX_CACHED_VERSIONS:
+                _compiled.popitem(last=False)
+        else:
+            _compiled.move_to_end(version)
+        return cache
+
+
+def expand_template(template, fragments, version=None):
+    """Template with its ``{>nom}`` includes expanded (cached per fragment set version)."""
+    template = template or ""
+    if not fragments or "{>" not in template:
+        return template
+    cache = _version_cache(version if version is not None else fragments_version(fragments))
+    expanded = cache.get(template)
+    if expanded is None:
+        expanded = _expand(template, fragments, ())
+        if len(cache) >= MAX_CACHED_TEMPLATES_PER_VERSION:
+            cache.clear()
+        cache[template] = expanded
+    return expanded
+
+
+def include_errors(template, fragments):
+    """Messages for includes that cannot be expanded (unknown fragment, cycle, too deep)."""
+    errors = []
+
+    def walk(text, stack):
+        for name in dict.fromkeys(find_includes(text)):
+            if name not in (fragments or {}):
+                errors.append(f"fragment inconnu : {{>{name}}}")
+            elif name in stack:
+                errors.append(f"inclusion circulaire : {' > '.join(stack + (name,))}")
+            elif len(stack) >= MAX_INCLUDE_DEPTH:
+                errors.append(f"inclusions trop profondes (> {MAX_INCLUDE_DEPTH}) : {{>{name}}}")
+            else:
+                walk(fragments[name], stack + (name,))
+    walk(template or "", ())
+    return list(dict.fromkeys(errors))
+
+
+def factor_fragment(library, name, text):
+    """Replace ``text`` by ``{>name}`` in every template of the library (in place).
+
+    Returns ``[(family, use_case), ...]`` of the modified use cases.
+    """
+    if not text:
+        return []
+    include = f"{{>{name}}}"
+    changed = []
+    for family_name, use_cases in library.items():
+        for use_case_name, config in use_cases.items():
+            template = config.get("template", "")
+            if text in template:
+                config["template"] = template.replace(text, include)
+                changed.append((family_name, use_case_name))
+    return changed
+
+
+def clear_cache():
+    with _compiled_lock:
+        _compiled.clear()
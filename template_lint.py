@@ -0,0 +1,108 @@
+"""Static analysis of prompt templates: placeholders vs configured variables, brace balance.
+
+Template syntax (see ``library_core.fill_template``): ``{name}`` is replaced by
+the variable ``name``; ``{{`` and ``}}`` are escapes that reach the final LLM
+as ``{`` and ``}`` (JSON examples, instructions for the LLM). A template is
+scanned once per version: ``analyze_template`` keeps its result in a bounded
+cache keyed by the template text (Python caches the hash of each string, so a
+lookup for an unchanged template is one dict probe). ``lint_library`` runs
+over the whole library in one pass. With ``fragments``, ``{>nom}`` includes
+(``template_fragments``) are expanded first and broken includes reported.
+"""
+import re
+import threading
+from collections import namedtuple
+
+from template_fragments import expand_template, fragments_version, include_errors
+
+MAX_CACHED_TEMPLATES = 50000
+
+# Ordre des alternatives : les échappements avant les accolades simples
+_TOKEN_RE = re.compile(r"\{\{|\}\}|\{(\w+)\}|\{>\w+\}|\{|\}")
+
+# escaped_placeholders : {nom} entre {{ }} ; remplacés aussi si la variable existe, sinon texte pour le LLM
+TemplateAnalysis = namedtuple("TemplateAnalysis", "placeholders escaped_placeholders brace_errors")
+LintIssue = namedtuple("LintIssue", "level message")  # level : "error" (rendu faux) ou "warning"
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _scan(template):
+    placeholders = []
+    escaped_placeholders = []
+    errors = []
+    escape_depth = 0
+    stray_open = stray_close = 0
+    for match in _TOKEN_RE.finditer(template):
+        token = match.group(0)
+        if token == "{{":
+            escape_depth += 1
+        elif token == "}}":
+            if escape_depth:
+                escape_depth -= 1
+            else:
+                errors.append("« }} » fermant sans « {{ » ouvrant")
+        elif match.group(1) is not None:
+            (escaped_placeholders if escape_depth else placeholders).append(match.group(1))
+        elif token.startswith("{>"):
+            continue # Inclusion de fragment non résolue : signalée par include_errors
+        elif token == "{":
+            stray_open += 1
+        else:
+            stray_close += 1
+    if escape_depth:
+        errors.append(f"{escape_depth} « {{{{ » sans « }}}} » fermant")
+    if stray_open or stray_close:
+        errors.append(f"accolade(s) isolée(s) : {stray_open} « {{ », {stray_close} « }} » (utilisez {{{{ }}}} pour du texte littéral)")
+    return TemplateAnalysis(tuple(dict.fromkeys(placeholders)), tuple(dict.fromkeys(escaped_placeholders)), tuple(errors))
+
+
+def analyze_template(template):
+    """Placeholders (in order of first use) and brace errors of a template, cached per template text."""
+    analysis = _cache.get(template)
+    if analysis is None:
+        analysis = _scan(template)
+        with _cache_lock:
+            if len(_cache) >= MAX_CACHED_TEMPLATES:
+                _cache.pop(next(iter(_cache)))
+            _cache[template] = analysis
+    return analysis
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def lint_use_case(config, fragments=None, version=None):
+    """``LintIssue`` list for one use case config (empty when the template is consistent)."""
+    template = config.get("template", "") or ""
+    issues = []
+    if "{>" in template:
+        issues.extend(LintIssue("error", f"Fragment : {error}") for error in include_errors(template, fragments))
+        template = expand_template(template, fragments, version)
+    analysis = analyze_template(template)
+    variable_names = [var.get("name") for var in config.get("variables", []) if isinstance(var, dict) and var.get("name")]
+    issues.extend(LintIssue("error", f"Accolades déséquilibrées : {error}") for error in analysis.brace_errors)
+    defined = set(variable_names)
+    undefined = [name for name in analysis.placeholders if name not in defined]
+    if undefined:
+        issues.append(LintIssue("error", "Placeholder(s) sans variable (resteront tels quels) : " + ", ".join(f"{{{name}}}" for name in undefined)))
+    used = set(analysis.placeholders) | set(analysis.escaped_placeholders)
+    unused = [name for name in variable_names if name not in used]
+    if unused:
+        issues.append(LintIssue("warning", "Variable(s) jamais utilisée(s) dans le template : " + ", ".join(unused)))
+    return issues
+
+
+def lint_library(library, fragments=None):
+    """``{(family, use_case): [LintIssue, ...]}`` for every use case that has issues."""
+    report = {}
+    version = fragments_version(fragments)
+    for family_name, use_cases in library.items():
+        for use_case_name, config in use_cases.items():
+            issues = lint_use_case(config, fragments, version)
+            if issues:
+                report[(family_name, use_case_name)] = issues
+    return report